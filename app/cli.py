@@ -34,7 +34,9 @@ COLORS = {
 def start(
         host: str = typer.Option("0.0.0.0", help="Хост для запуска сервера"),
         port: int = typer.Option(8000, help="Порт для запуска сервера"),
-        reload: bool = typer.Option(True, help="Включить авто-перезагрузку (для разработки)")
+        reload: bool = typer.Option(True, help="Включить авто-перезагрузку (для разработки)"),
+        warmup: str = typer.Option(None, help="OpenAPI document to warm the cache from at startup"),
+        fixtures: str = typer.Option(None, help="record: save every response to fixtures, replay: serve only from them")
 ):
     """
     Запускает API сервер Helix.
@@ -50,6 +52,16 @@ def start(
     provider = config.get("HELIX_AI_PROVIDER", "unknown")
 
     ConsoleClass.info(f"AI Provider: [bold {COLORS['primary']}]{provider}[/]")
+    if warmup:
+        # read by the server process (and the reloader's child) at startup
+        os.environ["HELIX_WARMUP_SPEC"] = warmup
+        ConsoleClass.info(f"Cache warm-up from [bold {COLORS['primary']}]{warmup}[/]")
+    if fixtures:
+        if fixtures not in ("off", "record", "replay"):
+            ConsoleClass.error("--fixtures must be off, record or replay")
+            return
+        os.environ["HELIX_FIXTURE_MODE"] = fixtures
+        ConsoleClass.info(f"Fixtures: [bold {COLORS['primary']}]{fixtures}[/]")
     ConsoleClass.success(f"Server initializing at http://{host}:{port}")
     console.print()
 
@@ -139,6 +151,11 @@ def check_docker():
 
 
 def setup_redis():
+    backend = (read_env_config() or {}).get("HELIX_STORAGE_BACKEND", "redis")
+    if backend != "redis":
+        ConsoleClass.info(f"Storage backend is '{backend}'. Skipping Redis setup")
+        return True
+
     if not check_docker():
         ConsoleClass.warning("Docker not found. Skipping Redis setup")
         return False
@@ -501,5 +518,151 @@ def config():
     console.print()
 
 
+@app.command()
+def warmup(
+        spec: str = typer.Argument(..., help="OpenAPI document: file path or URL"),
+        session: str = typer.Option("default_session", help="Session (X-Session-ID) the responses are cached for"),
+        concurrency: int = typer.Option(4, help="Responses generated at the same time"),
+        methods: str = typer.Option("GET", help="Comma separated methods to warm, * for all"),
+        force: bool = typer.Option(False, help="Regenerate responses that are already cached")
+):
+    """
+    Pre-generates cached responses for every operation of an OpenAPI document.
+    """
+    import asyncio
+
+    from app.database.core.config import settings
+    from app.database.core.storage import close_storage, init_storage
+    from app.services.ai.manager import ai_manager
+    from app.services.sessions import session_index
+    from app.services.warmup import list_operations, load_spec, summarize, warm_cache
+
+    ConsoleClass.header("Cache Warm-up", "PRE-GENERATING RESPONSES")
+
+    if settings.STORAGE_BACKEND == "memory":
+        ConsoleClass.error("The memory backend lives inside the server process. Use 'helix start --warmup' instead")
+        return
+
+    try:
+        operations = list_operations(load_spec(spec), methods.split(","))
+    except Exception as e:
+        ConsoleClass.error(f"Could not read {spec}: {e}")
+        return
+
+    if not operations:
+        ConsoleClass.warning(f"No {methods} operations in {spec}")
+        return
+
+    ConsoleClass.info(f"{len(operations)} operations, {concurrency} at a time, session '{session}'")
+    console.print()
+
+    styles = {"warmed": COLORS["success"], "cached": COLORS["secondary"], "busy": COLORS["warning"],
+              "skipped": "dim", "failed": COLORS["error"]}
+
+    def report(result):
+        operation = result.operation
+        query = "&".join(f"{k}={v}" for k, v in operation.query.items())
+        path = f"/{operation.path}" + (f"?{query}" if query else "")
+        line = (f"[{styles[result.status]}]{result.status:>7}[/] {operation.method:<7} {path} "
+                f"[dim]{result.duration_ms:.0f}ms[/]")
+        if result.error:
+            line += f" [{COLORS['error']}]{result.error}[/]"
+        console.print(line)
+
+    async def run():
+        await init_storage().start()
+        try:
+            started = time.perf_counter()
+            results = await warm_cache(operations, session, concurrency, force, on_result=report)
+            return summarize(results, time.perf_counter() - started)
+        finally:
+            await session_index.stop()
+            await ai_manager.close()
+            await close_storage()
+
+    summary = asyncio.run(run())
+
+    console.print()
+    table = Table(border_style=COLORS['secondary'], header_style=f"bold {COLORS['primary']}")
+    table.add_column("Result", style=f"bold {COLORS['tertiary']}")
+    table.add_column("Operations", justify="right")
+    for status in ("warmed", "cached", "busy", "skipped", "failed"):
+        if summary.get(status):
+            table.add_row(status, str(summary[status]))
+    table.add_row("total", f"{summary['operations']} in {summary['elapsed_s']}s")
+    console.print(Align.center(table))
+    console.print()
+
+
+@app.command()
+def fixtures(
+        directory: str = typer.Option(None, "--dir", help="Fixture directory (default: HELIX_FIXTURE_DIR)")
+):
+    """
+    Rebuilds the replay index of recorded fixtures (after an interrupted recording).
+    """
+    from app.database.core.config import settings
+    from app.services.fixtures import build_index, list_segments
+
+    ConsoleClass.header("Fixtures", "REBUILDING INDEX")
+
+    path = Path(directory or settings.FIXTURE_DIR)
+    segments = list_segments(path) if path.is_dir() else []
+    if not segments:
+        ConsoleClass.error(f"No fixture segments in {path}")
+        return
+
+    started = time.perf_counter()
+    count = build_index(path)
+    size = sum(segment.stat().st_size for _, segment in segments)
+    ConsoleClass.success(
+        f"{count} responses in {len(segments)} segments ({size / 1024 / 1024:.1f} MB), "
+        f"indexed in {time.perf_counter() - started:.2f}s"
+    )
+    console.print()
+
+
+@app.command()
+def rebalance(
+        previous: str = typer.Option(..., "--from", help="Comma separated host:port list the keys were sharded over"),
+        nodes: str = typer.Option(None, "--to", help="New host:port list (default: HELIX_REDIS_NODES)"),
+        dry_run: bool = typer.Option(False, help="Only count the keys that would move")
+):
+    """
+    Moves keys to their new Redis node after nodes were added to or removed from HELIX_REDIS_NODES.
+    """
+    import asyncio
+
+    from app.database.core.connect import redis_nodes
+    from app.database.core.rebalance import rebalance as rebalance_nodes
+
+    ConsoleClass.header("Rebalance", "MOVING SESSIONS BETWEEN NODES")
+
+    old_nodes = [node.strip() for node in previous.split(",") if node.strip()]
+    new_nodes = [node.strip() for node in nodes.split(",") if node.strip()] if nodes else redis_nodes()
+    if old_nodes == new_nodes:
+        ConsoleClass.warning("The node lists are the same, nothing moves")
+        return
+
+    ConsoleClass.info(f"{', '.join(old_nodes)} -> {', '.join(new_nodes)}")
+    started = time.perf_counter()
+    try:
+        stats = asyncio.run(rebalance_nodes(old_nodes, new_nodes, dry_run=dry_run))
+    except Exception as e:
+        ConsoleClass.error(f"Rebalance failed: {e}")
+        return
+
+    elapsed = time.perf_counter() - started
+    if dry_run:
+        ConsoleClass.success(f"{stats['keys']} of {stats['scanned']} keys would move ({elapsed:.2f}s)")
+    else:
+        ConsoleClass.success(
+            f"Moved {stats['keys']} of {stats['scanned']} keys, {stats['sessions']} sessions and "
+            f"{stats['tag_entries']} index entries in {elapsed:.2f}s "
+            f"({stats['kept_newer']} already rewritten on their new node)"
+        )
+    console.print()
+
+
 if __name__ == "__main__":
     app()
\ No newline at end of file
@@ -0,0 +1,22 @@
+from .base import Batch, Bucket, IndexedKey, LookupResult, SessionUsage, StorageBackend
+from .compression import Codec, CompressedBackend
+from .memory import MemoryBackend
+from .redis import RedisBackend
+from .sharded import HashRing, ShardedBackend
+from .sqlite import SqliteBackend
+
+__all__ = [
+    "Batch",
+    "Bucket",
+    "IndexedKey",
+    "LookupResult",
+    "SessionUsage",
+    "StorageBackend",
+    "Codec",
+    "CompressedBackend",
+    "MemoryBackend",
+    "RedisBackend",
+    "HashRing",
+    "ShardedBackend",
+    "SqliteBackend",
+]
@@ -0,0 +1,206 @@
+"""
+Storage backend interface.
+The services talk to storage in terms of what they need (a cached value,
+a capped list, a lock, a batch of writes) rather than Redis commands, so
+that a single-process deployment can run without a Redis server.
+"""
+
+import asyncio
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+
+class LookupResult(NamedTuple):
+    cached: Optional[bytes]
+    locked: bool
+    # newest entry first
+    context: List[bytes]
+
+
+class SessionUsage(NamedTuple):
+    session_id: str
+    bytes: int
+    keys: int
+    last_seen: float
+
+
+class IndexedKey(NamedTuple):
+    """A key written for a session: its size in bytes and when it expires (None: never)."""
+
+    size: int
+    expires_at: Optional[float] = None
+
+
+class Bucket(NamedTuple):
+    """A token bucket holding up to `capacity` tokens, refilled at `rate` per second; a take costs `cost`."""
+
+    key: str
+    capacity: float
+    rate: float
+    cost: float
+
+
+def refill(
+    buckets: Sequence[Bucket], states: Sequence[Optional[Tuple[float, float]]], now: float
+) -> Tuple[float, List[float]]:
+    """
+    Levels of the buckets at `now` from their stored (tokens, updated_at), None
+    for a bucket never taken from (full), and the seconds until every bucket
+    holds its cost, 0 when they all do already.
+    """
+    wait, levels = 0.0, []
+    for bucket, state in zip(buckets, states):
+        tokens = bucket.capacity
+        if state is not None:
+            tokens = min(bucket.capacity, state[0] + max(0.0, now - state[1]) * bucket.rate)
+        levels.append(tokens)
+        if tokens < bucket.cost:
+            wait = max(wait, (bucket.cost - tokens) / bucket.rate)
+    return wait, levels
+
+
+class Batch:
+    """Writes sent to the backend together, in one round trip where the backend has them."""
+
+    __slots__ = ("ops",)
+
+    def __init__(self):
+        self.ops: List[tuple] = []
+
+    def __len__(self):
+        return len(self.ops)
+
+    def set(self, key: str, value: bytes, ttl: Optional[int] = None):
+        self.ops.append(("set", key, value, ttl))
+
+    def delete(self, key: str):
+        self.ops.append(("delete", key))
+
+    def push(self, key: str, values: Sequence[bytes], max_len: int, ttl: Optional[int] = None):
+        """Prepend `values` (oldest first) to a list keeping its newest `max_len` entries."""
+        self.ops.append(("push", key, list(values), max_len, ttl))
+
+    def release_lock(self, key: str, token: str):
+        """Delete `key` if it still holds `token`."""
+        self.ops.append(("release_lock", key, token))
+
+    def publish(self, channel: str, message: str):
+        self.ops.append(("publish", channel, message))
+
+    def tag(self, key: str, tags: Sequence[str], ttl: Optional[int] = None):
+        """Add `key` to the secondary index of each tag until it expires `ttl` seconds from now."""
+        self.ops.append(("tag", key, list(tags), ttl))
+
+    def untag(self, key: str, tags: Sequence[str]):
+        self.ops.append(("untag", key, list(tags)))
+
+
+class StorageBackend(ABC):
+    name: str
+
+    async def start(self):
+        """Called once from the app lifespan before serving requests."""
+
+    @abstractmethod
+    async def close(self): ...
+
+    @abstractmethod
+    async def ping(self) -> bool: ...
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]: ...
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool: ...
+
+    @abstractmethod
+    async def range(self, key: str, limit: Optional[int] = None) -> List[bytes]:
+        """Newest `limit` entries of a list (all when None), newest first."""
+
+    @abstractmethod
+    async def lookup(
+        self,
+        key: str,
+        lock_key: str,
+        lock_token: str,
+        lock_ttl: int,
+        context_key: str,
+        context_limit: int,
+        revalidate: bool = False,
+        magic: Tuple[bytes, ...] = (),
+    ) -> LookupResult:
+        """
+        Atomically: read `key` unless revalidating (values starting with none
+        of the `magic` prefixes count as missing); on a miss take `lock_key`
+        for `lock_ttl` seconds if `lock_token` is set, and read the newest
+        `context_limit` entries of `context_key`.
+        """
+
+    @abstractmethod
+    async def apply(self, batch: Batch, atomic: bool = False) -> int:
+        """Run the batch's operations in order; returns the number of keys its deletes removed."""
+
+    @abstractmethod
+    def listen(self, channel: str) -> AsyncIterator[str]:
+        """Messages published to `channel`, until the subscription is lost."""
+
+    @abstractmethod
+    async def tagged(self, tags: Sequence[str]) -> List[str]:
+        """Unexpired keys carrying every one of `tags`, read from the smallest index first."""
+
+    @abstractmethod
+    async def take_tokens(self, buckets: Sequence[Bucket]) -> Tuple[float, List[float]]:
+        """
+        Atomically take each bucket's cost if every one of them holds it. Returns
+        0 and the levels left when taken, else the seconds until they would all
+        hold it and their current levels, taking nothing. See `refill`.
+        """
+
+    # session index: keys written per session and their sizes, so whole
+    # sessions can be measured and evicted without scanning the keyspace
+
+    @abstractmethod
+    async def index_sessions(self, writes: Dict[str, Dict[str, IndexedKey]], seen: Dict[str, float]):
+        """
+        Record the keys written per session and when each session was last seen.
+        The keys of every session indexed that have expired since are dropped from
+        its index and their bytes from its size, so a session only counts live keys.
+        """
+
+    @abstractmethod
+    async def session_totals(self) -> Tuple[int, int]:
+        """Number of indexed sessions and their total bytes."""
+
+    @abstractmethod
+    async def list_sessions(
+        self, by: str = "bytes", limit: int = 10, seen_before: Optional[float] = None
+    ) -> List[SessionUsage]:
+        """Largest sessions first (by="bytes"), or least recently seen first (by="idle")."""
+
+    @abstractmethod
+    async def drop_sessions(self, session_ids: Sequence[str]) -> Dict[str, List[str]]:
+        """Delete every indexed key of the sessions and their index; returns the deleted keys."""
+
+    def get_stats(self) -> dict:
+        return {"backend": self.name}
+
+
+class LocalBroker:
+    """Publish/subscribe within the process, for backends without a server."""
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    def publish(self, channel: str, message: str):
+        for queue in self._subscribers.get(channel, ()):
+            queue.put_nowait(message)
+
+    async def listen(self, channel: str) -> AsyncIterator[str]:
+        queue: asyncio.Queue = asyncio.Queue()
+        subscribers = self._subscribers.setdefault(channel, set())
+        subscribers.add(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            subscribers.discard(queue)
@@ -0,0 +1,210 @@
+"""
+Transparent compression of stored values.
+Values above a size threshold are compressed on write and tagged with a
+marker and codec id; anything without the marker (small values, values
+written before compression was enabled) is returned as stored.
+"""
+
+import logging
+import time
+import zlib
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from .base import Batch, Bucket, IndexedKey, LookupResult, SessionUsage, StorageBackend
+
+try:
+    import zstandard
+except ImportError:  # optional, zlib is always available
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# never the first byte of JSON text or of a response envelope
+MARKER = b"\x00HZ"
+ZLIB = b"\x01"
+ZSTD = b"\x02"
+
+
+class Codec:
+    def __init__(self, name: str = "zlib", min_bytes: int = 1024, level: Optional[int] = None):
+        if name == "zstd" and zstandard is None:
+            logger.warning("⚠️ zstandard is not installed, compressing with zlib")
+            name = "zlib"
+
+        self.name = name
+        self.min_bytes = min_bytes
+        if name == "zstd":
+            self.codec_id = ZSTD
+            self._compress = zstandard.ZstdCompressor(level=level or 3).compress
+        else:
+            self.codec_id = ZLIB
+            self._compress = lambda data: zlib.compress(data, level or 6)
+        self._zstd_decompressor = zstandard.ZstdDecompressor() if zstandard is not None else None
+
+        self.stats = {
+            "compressed": 0,
+            "skipped": 0,
+            "decompressed": 0,
+            "errors": 0,
+            "bytes_in": 0,
+            "bytes_out": 0,
+            "compress_cpu_s": 0.0,
+            "decompress_cpu_s": 0.0,
+        }
+
+    def encode(self, value: bytes) -> bytes:
+        if len(value) < self.min_bytes:
+            return value
+
+        started = time.thread_time()
+        compressed = MARKER + self.codec_id + self._compress(value)
+        self.stats["compress_cpu_s"] += time.thread_time() - started
+
+        if len(compressed) >= len(value):
+            # incompressible, storing it as is is cheaper to read back
+            self.stats["skipped"] += 1
+            return value
+
+        self.stats["compressed"] += 1
+        self.stats["bytes_in"] += len(value)
+        self.stats["bytes_out"] += len(compressed)
+        return compressed
+
+    def decode(self, value: Optional[bytes]) -> Optional[bytes]:
+        """Stored value to original bytes, None if it cannot be decompressed."""
+        if value is None or not value.startswith(MARKER):
+            return value
+
+        started = time.thread_time()
+        codec_id, payload = value[len(MARKER) : len(MARKER) + 1], value[len(MARKER) + 1 :]
+        try:
+            if codec_id == ZLIB:
+                data = zlib.decompress(payload)
+            elif codec_id == ZSTD and self._zstd_decompressor is not None:
+                data = self._zstd_decompressor.decompress(payload)
+            else:
+                raise ValueError(f"unsupported codec {codec_id!r}")
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"⚠️ Could not decompress stored value: {e}")
+            return None
+        finally:
+            self.stats["decompress_cpu_s"] += time.thread_time() - started
+
+        self.stats["decompressed"] += 1
+        return data
+
+    def get_stats(self) -> dict:
+        ops = self.stats["compressed"] + self.stats["skipped"]
+        return {
+            "codec": self.name,
+            "min_bytes": self.min_bytes,
+            **self.stats,
+            "ratio": round(self.stats["bytes_in"] / self.stats["bytes_out"], 2) if self.stats["bytes_out"] else 1.0,
+            "compress_us_per_op": round(self.stats["compress_cpu_s"] / ops * 1e6, 1) if ops else 0.0,
+            "decompress_us_per_op": (
+                round(self.stats["decompress_cpu_s"] / self.stats["decompressed"] * 1e6, 1)
+                if self.stats["decompressed"]
+                else 0.0
+            ),
+        }
+
+
+class CompressedBackend(StorageBackend):
+    """Compresses values written to, and decompresses values read from, another backend."""
+
+    def __init__(self, inner: StorageBackend, codec: Codec):
+        self.inner = inner
+        self.codec = codec
+        self.name = inner.name
+
+    async def start(self):
+        await self.inner.start()
+
+    async def close(self):
+        await self.inner.close()
+
+    async def ping(self) -> bool:
+        return await self.inner.ping()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self.codec.decode(await self.inner.get(key))
+
+    async def exists(self, key: str) -> bool:
+        return await self.inner.exists(key)
+
+    async def range(self, key: str, limit: Optional[int] = None) -> List[bytes]:
+        return self._decode_all(await self.inner.range(key, limit))
+
+    async def lookup(
+        self,
+        key: str,
+        lock_key: str,
+        lock_token: str,
+        lock_ttl: int,
+        context_key: str,
+        context_limit: int,
+        revalidate: bool = False,
+        magic: Tuple[bytes, ...] = (),
+    ) -> LookupResult:
+        # compressed values only ever hold what passed the magic check when written
+        result = await self.inner.lookup(
+            key,
+            lock_key,
+            lock_token,
+            lock_ttl,
+            context_key,
+            context_limit,
+            revalidate=revalidate,
+            magic=(*magic, MARKER) if magic else magic,
+        )
+        if result.cached is not None:
+            cached = self.codec.decode(result.cached)
+            if cached is None:
+                # unreadable entry: regenerate it under the lock like any other miss
+                return await self.inner.lookup(
+                    key, lock_key, lock_token, lock_ttl, context_key, context_limit, revalidate=True
+                )
+            return LookupResult(cached, False, [])
+        return LookupResult(None, result.locked, self._decode_all(result.context))
+
+    async def apply(self, batch: Batch, atomic: bool = False) -> int:
+        encoded = Batch()
+        for op in batch.ops:
+            if op[0] == "set":
+                encoded.set(op[1], self.codec.encode(op[2]), op[3])
+            elif op[0] == "push":
+                encoded.push(op[1], [self.codec.encode(value) for value in op[2]], op[3], op[4])
+            else:
+                encoded.ops.append(op)
+        return await self.inner.apply(encoded, atomic)
+
+    def listen(self, channel: str) -> AsyncIterator[str]:
+        return self.inner.listen(channel)
+
+    async def tagged(self, tags: Sequence[str]) -> List[str]:
+        return await self.inner.tagged(tags)
+
+    async def take_tokens(self, buckets: Sequence[Bucket]) -> Tuple[float, List[float]]:
+        return await self.inner.take_tokens(buckets)
+
+    async def index_sessions(self, writes: Dict[str, Dict[str, IndexedKey]], seen: Dict[str, float]):
+        await self.inner.index_sessions(writes, seen)
+
+    async def session_totals(self) -> Tuple[int, int]:
+        return await self.inner.session_totals()
+
+    async def list_sessions(
+        self, by: str = "bytes", limit: int = 10, seen_before: Optional[float] = None
+    ) -> List[SessionUsage]:
+        return await self.inner.list_sessions(by, limit, seen_before)
+
+    async def drop_sessions(self, session_ids: Sequence[str]) -> Dict[str, List[str]]:
+        return await self.inner.drop_sessions(session_ids)
+
+    def get_stats(self) -> dict:
+        return {**self.inner.get_stats(), "compression": self.codec.get_stats()}
+
+    def _decode_all(self, values: List[bytes]) -> List[bytes]:
+        decoded = [self.codec.decode(value) for value in values]
+        return [value for value in decoded if value is not None]
@@ -0,0 +1,252 @@
+import heapq
+import time
+from collections import deque
+from itertools import islice
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from .base import Batch, Bucket, IndexedKey, LocalBroker, LookupResult, SessionUsage, StorageBackend, refill
+
+# expired entries nobody reads again are swept every this many writes
+SWEEP_EVERY = 1024
+
+
+class MemoryBackend(StorageBackend):
+    """
+    Process-local storage: no network hop, nothing survives a restart.
+    Only for a single worker; other processes see neither the data nor the
+    invalidations. A key holds either a value or a list.
+    """
+
+    name = "memory"
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self._values: Dict[str, bytes] = {}
+        self._lists: Dict[str, Deque[bytes]] = {}
+        self._expires: Dict[str, float] = {}
+        self._broker = LocalBroker()
+        self._writes = 0
+        self._session_keys: Dict[str, Dict[str, IndexedKey]] = {}
+        # per session, a heap of (expires_at, key) of its indexed keys that expire
+        self._session_expiry: Dict[str, List[Tuple[float, str]]] = {}
+        self._session_bytes: Dict[str, int] = {}
+        self._session_seen: Dict[str, float] = {}
+        self._total_bytes = 0
+        # tag: key -> expiry of the tagged key
+        self._tags: Dict[str, Dict[str, float]] = {}
+        # token bucket: (tokens, updated_at)
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    async def close(self):
+        pass
+
+    async def ping(self) -> bool:
+        return True
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self._get(key)
+
+    async def exists(self, key: str) -> bool:
+        return self._exists(key)
+
+    async def range(self, key: str, limit: Optional[int] = None) -> List[bytes]:
+        return self._range(key, limit)
+
+    async def lookup(
+        self,
+        key: str,
+        lock_key: str,
+        lock_token: str,
+        lock_ttl: int,
+        context_key: str,
+        context_limit: int,
+        revalidate: bool = False,
+        magic: Tuple[bytes, ...] = (),
+    ) -> LookupResult:
+        if not revalidate:
+            cached = self._get(key)
+            if cached is not None and (not magic or cached.startswith(magic)):
+                return LookupResult(cached, False, [])
+
+        locked = False
+        if lock_token and self._get(lock_key) is None:
+            self._set(lock_key, lock_token.encode(), lock_ttl)
+            locked = True
+
+        return LookupResult(None, locked, self._range(context_key, context_limit))
+
+    async def apply(self, batch: Batch, atomic: bool = False) -> int:
+        # nothing is awaited in between, so every batch is atomic
+        deleted = 0
+        for op in batch.ops:
+            kind = op[0]
+            if kind == "set":
+                self._set(op[1], op[2], op[3])
+            elif kind == "delete":
+                deleted += self._exists(op[1])
+                self._delete(op[1])
+            elif kind == "push":
+                self._push(*op[1:])
+            elif kind == "release_lock":
+                if self._get(op[1]) == op[2].encode():
+                    self._delete(op[1])
+            elif kind == "publish":
+                self._broker.publish(op[1], op[2])
+            elif kind == "tag":
+                _, key, tags, ttl = op
+                expires_at = self.clock() + ttl if ttl else float("inf")
+                for tag in tags:
+                    self._tags.setdefault(tag, {})[key] = expires_at
+            elif kind == "untag":
+                for tag in op[2]:
+                    self._tags.get(tag, {}).pop(op[1], None)
+
+        self._writes += len(batch)
+        if self._writes >= SWEEP_EVERY:
+            self._writes = 0
+            self._sweep()
+        return deleted
+
+    def listen(self, channel: str):
+        return self._broker.listen(channel)
+
+    async def tagged(self, tags: Sequence[str]) -> List[str]:
+        indexes = sorted((self._tags.get(tag, {}) for tag in tags), key=len)
+        if not indexes:
+            return []
+        now = self.clock()
+        return [
+            key
+            for key, expires_at in indexes[0].items()
+            if expires_at > now and all(index.get(key, 0) > now for index in indexes[1:])
+        ]
+
+    async def take_tokens(self, buckets: Sequence[Bucket]) -> Tuple[float, List[float]]:
+        now = self.clock()
+        wait, levels = refill(buckets, [self._buckets.get(bucket.key) for bucket in buckets], now)
+        if wait:
+            return wait, levels
+        levels = [level - bucket.cost for bucket, level in zip(buckets, levels)]
+        for bucket, level in zip(buckets, levels):
+            self._buckets[bucket.key] = (level, now)
+        return 0.0, levels
+
+    async def index_sessions(self, writes: Dict[str, Dict[str, IndexedKey]], seen: Dict[str, float]):
+        for session_id, indexed in writes.items():
+            index = self._session_keys.setdefault(session_id, {})
+            expiry = self._session_expiry.setdefault(session_id, [])
+            delta = 0
+            for key, entry in indexed.items():
+                delta += entry.size - (index[key].size if key in index else 0)
+                index[key] = entry
+                if entry.expires_at is not None:
+                    heapq.heappush(expiry, (entry.expires_at, key))
+            self._add_session_bytes(session_id, delta)
+        for session_id, at in seen.items():
+            self._session_seen[session_id] = at
+        now = self.clock()
+        for session_id in writes.keys() | seen.keys():
+            self._prune_session(session_id, now)
+
+    def _prune_session(self, session_id: str, now: float):
+        """Drop the session's indexed keys that expired by `now`."""
+        index, expiry = self._session_keys.get(session_id), self._session_expiry.get(session_id)
+        if not index or not expiry:
+            return
+        delta = 0
+        while expiry and expiry[0][0] <= now:
+            expires_at, key = heapq.heappop(expiry)
+            # skip entries of keys rewritten with a later expiry since
+            if key in index and index[key].expires_at == expires_at:
+                delta -= index.pop(key).size
+        self._add_session_bytes(session_id, delta)
+
+    def _add_session_bytes(self, session_id: str, delta: int):
+        self._session_bytes[session_id] = self._session_bytes.get(session_id, 0) + delta
+        self._total_bytes += delta
+
+    async def session_totals(self) -> Tuple[int, int]:
+        return len(self._session_seen), self._total_bytes
+
+    async def list_sessions(
+        self, by: str = "bytes", limit: int = 10, seen_before: Optional[float] = None
+    ) -> List[SessionUsage]:
+        if by == "bytes":
+            session_ids = heapq.nlargest(limit, self._session_bytes, key=self._session_bytes.__getitem__)
+        else:
+            candidates = self._session_seen
+            if seen_before is not None:
+                candidates = {sid: at for sid, at in candidates.items() if at < seen_before}
+            session_ids = heapq.nsmallest(limit, candidates, key=candidates.__getitem__)
+        return [self._usage(session_id) for session_id in session_ids]
+
+    async def drop_sessions(self, session_ids: Sequence[str]) -> Dict[str, List[str]]:
+        dropped = {}
+        for session_id in session_ids:
+            keys = list(self._session_keys.pop(session_id, {}))
+            self._session_expiry.pop(session_id, None)
+            for key in keys:
+                self._delete(key)
+            self._total_bytes -= self._session_bytes.pop(session_id, 0)
+            self._session_seen.pop(session_id, None)
+            dropped[session_id] = keys
+        return dropped
+
+    def _usage(self, session_id: str) -> SessionUsage:
+        return SessionUsage(
+            session_id,
+            self._session_bytes.get(session_id, 0),
+            len(self._session_keys.get(session_id, ())),
+            self._session_seen.get(session_id, 0.0),
+        )
+
+    def _expired(self, key: str) -> bool:
+        expires_at = self._expires.get(key)
+        if expires_at is None or expires_at > self.clock():
+            return False
+        self._delete(key)
+        return True
+
+    def _exists(self, key: str) -> bool:
+        return not self._expired(key) and (key in self._values or key in self._lists)
+
+    def _get(self, key: str) -> Optional[bytes]:
+        if self._expired(key):
+            return None
+        return self._values.get(key)
+
+    def _set(self, key: str, value: bytes, ttl: Optional[int]):
+        self._values[key] = value
+        if ttl:
+            self._expires[key] = self.clock() + ttl
+        else:
+            self._expires.pop(key, None)
+
+    def _delete(self, key: str):
+        self._values.pop(key, None)
+        self._lists.pop(key, None)
+        self._expires.pop(key, None)
+
+    def _range(self, key: str, limit: Optional[int]) -> List[bytes]:
+        if self._expired(key) or key not in self._lists:
+            return []
+        return list(islice(self._lists[key], limit))
+
+    def _push(self, key: str, values: List[bytes], max_len: int, ttl: Optional[int]):
+        self._expired(key)
+        entries = self._lists.setdefault(key, deque())
+        entries.extendleft(values)
+        while len(entries) > max_len:
+            entries.pop()
+        if ttl:
+            self._expires[key] = self.clock() + ttl
+
+    def _sweep(self):
+        now = self.clock()
+        for key in [key for key, expires_at in self._expires.items() if expires_at <= now]:
+            self._delete(key)
+        for tag, index in list(self._tags.items()):
+            for key in [key for key, expires_at in index.items() if expires_at <= now]:
+                del index[key]
+            if not index:
+                del self._tags[tag]
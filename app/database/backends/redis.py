@@ -0,0 +1,398 @@
+import logging
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import redis.asyncio as redis
+from redis.exceptions import ResponseError
+
+from app.database.core.config import settings
+from app.database.core.connect import close_redis, get_redis_connection, init_redis, ping_redis
+
+from .base import Batch, Bucket, IndexedKey, LookupResult, SessionUsage, StorageBackend
+
+logger = logging.getLogger(__name__)
+
+# KEYS: cache key, generation lock, session context
+# ARGV: skip cache read ("1" to revalidate), lock token ("" for no lock), lock TTL, context window,
+#       accepted value prefixes (any value when none are given)
+LOOKUP_SCRIPT = """
+if ARGV[1] ~= '1' then
+    local cached = redis.call('GET', KEYS[1])
+    if cached then
+        local accepted = #ARGV < 5
+        for i = 5, #ARGV do
+            if string.sub(cached, 1, string.len(ARGV[i])) == ARGV[i] then
+                accepted = true
+                break
+            end
+        end
+        if accepted then
+            return {cached}
+        end
+    end
+end
+
+local locked = 0
+if ARGV[2] ~= '' and redis.call('SET', KEYS[2], ARGV[2], 'NX', 'EX', ARGV[3]) then
+    locked = 1
+end
+
+local context = {}
+local context_type = redis.call('TYPE', KEYS[3])['ok']
+if context_type == 'list' then
+    context = redis.call('LRANGE', KEYS[3], 0, tonumber(ARGV[4]) - 1)
+elseif context_type ~= 'none' then
+    redis.call('DEL', KEYS[3])
+end
+
+return {false, locked, context}
+"""
+
+# delete the lock only if we still own it
+RELEASE_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# secondary indexes: one sorted set per tag, scored by when the tagged key expires
+TAGS = "helix:tags:"
+
+# one hash tag for the whole session index: its script touches several of these keys at once,
+# so on a cluster they have to share a slot
+SESSIONS = "helix:{sessions}:"
+SESSIONS_SEEN = SESSIONS + "seen"
+SESSIONS_BYTES = SESSIONS + "bytes"
+SESSIONS_TOTAL = SESSIONS + "total"
+
+# KEYS: last seen zset, bytes zset, total bytes, then per session in ARGV its key sizes hash and key expiry zset
+# ARGV: now, then per session: session id, last seen, number of keys, then that many key / size / expiry triples
+INDEX_SESSIONS = """
+local now = ARGV[1]
+local pos = 2
+local total = 0
+for i = 4, #KEYS, 2 do
+    local sizes, expiry = KEYS[i], KEYS[i + 1]
+    local session_id, seen, count = ARGV[pos], ARGV[pos + 1], tonumber(ARGV[pos + 2])
+    pos = pos + 3
+    local delta = 0
+    for _ = 1, count do
+        local key, size = ARGV[pos], tonumber(ARGV[pos + 1])
+        delta = delta + size - tonumber(redis.call('HGET', sizes, key) or '0')
+        redis.call('HSET', sizes, key, size)
+        redis.call('ZADD', expiry, ARGV[pos + 2], key)
+        pos = pos + 3
+    end
+    -- keys that expired since they were written no longer take memory
+    local expired = redis.call('ZRANGEBYSCORE', expiry, '-inf', now)
+    for _, key in ipairs(expired) do
+        delta = delta - tonumber(redis.call('HGET', sizes, key) or '0')
+        redis.call('HDEL', sizes, key)
+    end
+    if #expired > 0 then
+        redis.call('ZREMRANGEBYSCORE', expiry, '-inf', now)
+    end
+    redis.call('ZADD', KEYS[1], seen, session_id)
+    redis.call('ZINCRBY', KEYS[2], delta, session_id)
+    total = total + delta
+end
+if total ~= 0 then
+    redis.call('INCRBY', KEYS[3], total)
+end
+return 1
+"""
+
+
+# token buckets, see refill(): a hash of tokens and updated_at per bucket, on the server's clock
+# so every worker refills alike; written only when every bucket holds its cost
+# KEYS: the buckets
+# ARGV: per bucket: capacity, rate per second, cost
+TAKE_TOKENS = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local wait, levels = 0, {}
+for i, key in ipairs(KEYS) do
+    local capacity, rate, cost = tonumber(ARGV[i * 3 - 2]), tonumber(ARGV[i * 3 - 1]), tonumber(ARGV[i * 3])
+    local state = redis.call('HMGET', key, 'tokens', 'updated_at')
+    local tokens = capacity
+    if state[1] then
+        tokens = math.min(capacity, tonumber(state[1]) + math.max(0, now - tonumber(state[2])) * rate)
+    end
+    levels[i] = tokens
+    if tokens < cost then
+        wait = math.max(wait, (cost - tokens) / rate)
+    end
+end
+if wait == 0 then
+    for i, key in ipairs(KEYS) do
+        local capacity, rate, cost = tonumber(ARGV[i * 3 - 2]), tonumber(ARGV[i * 3 - 1]), tonumber(ARGV[i * 3])
+        levels[i] = levels[i] - cost
+        redis.call('HSET', key, 'tokens', levels[i], 'updated_at', now)
+        -- a bucket left alone until it is full again is the same as no bucket
+        redis.call('EXPIRE', key, math.ceil((capacity - levels[i]) / rate) + 1)
+    end
+end
+local reply = {tostring(wait)}
+for i = 1, #levels do
+    reply[i + 1] = tostring(levels[i])
+end
+return reply
+"""
+
+
+def session_index_key(session_id: str) -> str:
+    return f"{SESSIONS}keys:{session_id}"
+
+
+def session_expiry_key(session_id: str) -> str:
+    return f"{SESSIONS}expiry:{session_id}"
+
+
+class RedisBackend(StorageBackend):
+    """
+    Shared storage for any number of workers, through the pooled client of
+    one node of REDIS_NODES, or the cluster client.
+
+    On a cluster, the keys of one session share a slot through their hash tag,
+    but a batch also writes secondary indexes in other slots: batches run as
+    plain pipelines there, so they are not atomic.
+    """
+
+    name = "redis"
+
+    def __init__(self, node: int = 0, cluster: bool = False):
+        self.node = node
+        self.cluster = cluster
+        self._lookup_script = None
+        self._index_script = None
+        self._take_script = None
+
+    @property
+    def client(self):
+        return get_redis_connection(self.node)
+
+    async def start(self):
+        init_redis()
+        # load the lookup script up front so the first miss is not answered with NOSCRIPT
+        try:
+            self._lookup_script = self.client.register_script(LOOKUP_SCRIPT)
+            await self.client.script_load(LOOKUP_SCRIPT)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not load cache lookup script: {e}")
+
+    async def close(self):
+        self._lookup_script = None
+        await close_redis()
+
+    async def ping(self) -> bool:
+        return bool(await ping_redis(self.node))
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(key)
+
+    async def exists(self, key: str) -> bool:
+        return bool(await self.client.exists(key))
+
+    async def range(self, key: str, limit: Optional[int] = None) -> List[bytes]:
+        try:
+            return await self.client.lrange(key, 0, -1 if limit is None else limit - 1)
+        except ResponseError:
+            # pre-list value, replaced on the next push
+            return []
+
+    async def lookup(
+        self,
+        key: str,
+        lock_key: str,
+        lock_token: str,
+        lock_ttl: int,
+        context_key: str,
+        context_limit: int,
+        revalidate: bool = False,
+        magic: Tuple[bytes, ...] = (),
+    ) -> LookupResult:
+        if self._lookup_script is None:
+            self._lookup_script = self.client.register_script(LOOKUP_SCRIPT)
+
+        result = await self._lookup_script(
+            keys=[key, lock_key, context_key],
+            args=["1" if revalidate else "0", lock_token, lock_ttl, context_limit, *magic],
+            client=self.client,
+        )
+        if result[0] is not None:
+            return LookupResult(result[0], False, [])
+        return LookupResult(None, bool(result[1]), result[2])
+
+    async def apply(self, batch: Batch, atomic: bool = False) -> int:
+        try:
+            return await self._execute(batch, atomic)
+        except ResponseError as e:
+            if "WRONGTYPE" not in str(e):
+                raise
+            # pre-list values under list keys: replace them and write the lists again
+            retry = Batch()
+            for op in batch.ops:
+                if op[0] == "push":
+                    retry.delete(op[1])
+                    retry.ops.append(op)
+            await self._execute(retry, atomic)
+            return 0
+
+    async def _execute(self, batch: Batch, atomic: bool) -> int:
+        # positions of the DEL replies among the pipeline's
+        deletes = []
+        async with self.client.pipeline(transaction=atomic and not self.cluster) as pipe:
+            for op in batch.ops:
+                kind = op[0]
+                if kind == "set":
+                    _, key, value, ttl = op
+                    if ttl:
+                        pipe.setex(key, ttl, value)
+                    else:
+                        pipe.set(key, value)
+                elif kind == "delete":
+                    deletes.append(len(pipe))
+                    pipe.delete(op[1])
+                elif kind == "push":
+                    _, key, values, max_len, ttl = op
+                    pipe.lpush(key, *values)
+                    pipe.ltrim(key, 0, max_len - 1)
+                    if ttl:
+                        pipe.expire(key, ttl)
+                elif kind == "release_lock":
+                    # plain EVAL, a registered script would add a SCRIPT EXISTS round trip to the pipeline
+                    pipe.eval(RELEASE_LOCK, 1, op[1], op[2])
+                elif kind == "publish":
+                    pipe.publish(op[1], op[2])
+                elif kind == "tag":
+                    _, key, tags, ttl = op
+                    now = time.time()
+                    for tag in tags:
+                        pipe.zadd(TAGS + tag, {key: now + ttl if ttl else float("inf")})
+                        # expired members leave as new ones arrive
+                        pipe.zremrangebyscore(TAGS + tag, "-inf", now)
+                elif kind == "untag":
+                    for tag in op[2]:
+                        pipe.zrem(TAGS + tag, op[1])
+            replies = await pipe.execute()
+        return sum(replies[position] for position in deletes)
+
+    async def tagged(self, tags: Sequence[str]) -> List[str]:
+        if not tags:
+            return []
+        async with self.client.pipeline(transaction=False) as pipe:
+            for tag in tags:
+                pipe.zcard(TAGS + tag)
+            sizes = await pipe.execute()
+
+        smallest, *others = [tag for _, tag in sorted(zip(sizes, tags))]
+        now = time.time()
+        keys = await self.client.zrangebyscore(TAGS + smallest, f"({now}", "+inf")
+        for tag in others:
+            if not keys:
+                break
+            kept = []
+            for start in range(0, len(keys), 1000):
+                chunk = keys[start : start + 1000]
+                scores = await self.client.zmscore(TAGS + tag, chunk)
+                kept += [key for key, score in zip(chunk, scores) if score is not None and score > now]
+            keys = kept
+        return [key.decode() for key in keys]
+
+    async def take_tokens(self, buckets: Sequence[Bucket]) -> Tuple[float, List[float]]:
+        if self._take_script is None:
+            self._take_script = self.client.register_script(TAKE_TOKENS)
+
+        args = []
+        for bucket in buckets:
+            args += [bucket.capacity, bucket.rate, bucket.cost]
+        reply = await self._take_script(keys=[bucket.key for bucket in buckets], args=args, client=self.client)
+        return float(reply[0]), [float(level) for level in reply[1:]]
+
+    async def index_sessions(self, writes: Dict[str, Dict[str, IndexedKey]], seen: Dict[str, float]):
+        if self._index_script is None:
+            self._index_script = self.client.register_script(INDEX_SESSIONS)
+
+        keys, args = [SESSIONS_SEEN, SESSIONS_BYTES, SESSIONS_TOTAL], [time.time()]
+        for session_id in seen.keys() | writes.keys():
+            indexed = writes.get(session_id, {})
+            keys += [session_index_key(session_id), session_expiry_key(session_id)]
+            args += [session_id, seen.get(session_id, 0), len(indexed)]
+            for key, entry in indexed.items():
+                args += [key, entry.size, "+inf" if entry.expires_at is None else entry.expires_at]
+        await self._index_script(keys=keys, args=args, client=self.client)
+
+    async def session_totals(self) -> Tuple[int, int]:
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.zcard(SESSIONS_SEEN)
+            pipe.get(SESSIONS_TOTAL)
+            count, total = await pipe.execute()
+        return count, int(total or 0)
+
+    async def list_sessions(
+        self, by: str = "bytes", limit: int = 10, seen_before: Optional[float] = None
+    ) -> List[SessionUsage]:
+        if by == "bytes":
+            ranked = await self.client.zrevrange(SESSIONS_BYTES, 0, limit - 1, withscores=True)
+        else:
+            before = "+inf" if seen_before is None else f"({seen_before}"
+            ranked = await self.client.zrangebyscore(SESSIONS_SEEN, "-inf", before, start=0, num=limit, withscores=True)
+        if not ranked:
+            return []
+
+        async with self.client.pipeline(transaction=False) as pipe:
+            for session_id, _ in ranked:
+                pipe.zscore(SESSIONS_SEEN if by == "bytes" else SESSIONS_BYTES, session_id)
+                pipe.hlen(session_index_key(session_id.decode()))
+            details = await pipe.execute()
+
+        sessions = []
+        for (session_id, score), other, keys in zip(ranked, details[::2], details[1::2]):
+            size, seen = (score, other) if by == "bytes" else (other, score)
+            sessions.append(SessionUsage(session_id.decode(), int(size or 0), keys, seen or 0.0))
+        return sessions
+
+    async def drop_sessions(self, session_ids: Sequence[str]) -> Dict[str, List[str]]:
+        if not session_ids:
+            return {}
+
+        async with self.client.pipeline(transaction=False) as pipe:
+            for session_id in session_ids:
+                pipe.hkeys(session_index_key(session_id))
+                pipe.zscore(SESSIONS_BYTES, session_id)
+            indexed = await pipe.execute()
+
+        dropped = {}
+        freed = 0
+        async with self.client.pipeline(transaction=not self.cluster) as pipe:
+            for session_id, keys, size in zip(session_ids, indexed[::2], indexed[1::2]):
+                keys = [key.decode() for key in keys]
+                # a cluster pipeline sends a multi-key DEL to one slot
+                step = 1 if self.cluster else 500
+                for start in range(0, len(keys), step):
+                    pipe.delete(*keys[start : start + step])
+                pipe.delete(session_index_key(session_id), session_expiry_key(session_id))
+                pipe.zrem(SESSIONS_SEEN, session_id)
+                pipe.zrem(SESSIONS_BYTES, session_id)
+                freed += int(size or 0)
+                dropped[session_id] = keys
+            pipe.decrby(SESSIONS_TOTAL, freed)
+            await pipe.execute()
+        return dropped
+
+    async def listen(self, channel: str):
+        client = self.client
+        if self.cluster:
+            # the cluster client has no pub/sub, but a message published on any node reaches every node
+            await client.initialize()
+            node = client.get_random_node()
+            client = redis.Redis(host=node.host, port=node.port, password=settings.REDIS_PASSWORD)
+        try:
+            async with client.pubsub(ignore_subscribe_messages=True) as pubsub:
+                await pubsub.subscribe(channel)
+                async for message in pubsub.listen():
+                    yield message["data"].decode()
+        finally:
+            if client is not self.client:
+                await client.aclose()
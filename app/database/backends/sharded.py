@@ -0,0 +1,207 @@
+"""
+Client-side sharding over several backends (one per Redis node).
+
+Keys are placed on a consistent-hash ring by their hash tag, the part
+between the first { and the next } (the whole key when there is none), as a
+Redis Cluster would slot them. Cache keys, locks and the context of a session
+all carry the session id as their tag, so one session lives on one shard:
+a lookup is one script on one node and the writes of a miss are one
+transaction on one node.
+
+Each shard keeps the session index and secondary indexes of its own keys.
+Ring points are derived from the node names (host:port), not their order, so
+adding a node only moves the keys it takes over: about 1/N of the sessions.
+"""
+
+import asyncio
+import hashlib
+from bisect import bisect_right
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from .base import Batch, Bucket, IndexedKey, LookupResult, SessionUsage, StorageBackend
+
+# points per node on the ring, the spread of keys per node is within a few percent from ~100 on
+VIRTUAL_NODES = 160
+
+
+def hash_tag(key: str) -> str:
+    """Part of `key` it is sharded by, with Redis Cluster's hash tag rules."""
+    start = key.find("{")
+    if start != -1:
+        end = key.find("}", start + 1)
+        if end > start + 1:
+            return key[start + 1 : end]
+    return key
+
+
+def _point(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hashing of keys to nodes."""
+
+    def __init__(self, nodes: Sequence[str], virtual_nodes: int = VIRTUAL_NODES):
+        if not nodes:
+            raise ValueError("A hash ring needs at least one node")
+        self.nodes = list(nodes)
+        points = sorted(
+            (_point(f"{node}#{i}"), index) for index, node in enumerate(nodes) for i in range(virtual_nodes)
+        )
+        self._points = [point for point, _ in points]
+        self._owners = [index for _, index in points]
+
+    def index_for(self, key: str) -> int:
+        """Index in `nodes` of the node owning `key`."""
+        position = bisect_right(self._points, _point(hash_tag(key)))
+        return self._owners[position % len(self._points)]
+
+    def node_for(self, key: str) -> str:
+        return self.nodes[self.index_for(key)]
+
+
+def session_tag(session_id: str) -> str:
+    """Any key tagged with the session, for routing by session id."""
+    return f"{{{session_id}}}"
+
+
+class ShardedBackend(StorageBackend):
+    """Routes every operation to the shard owning its key, see the module docstring."""
+
+    def __init__(self, shards: Sequence[StorageBackend], nodes: Sequence[str]):
+        if len(shards) != len(nodes):
+            raise ValueError("One node name per shard is needed")
+        self.shards = list(shards)
+        self.ring = HashRing(nodes)
+        self.name = self.shards[0].name
+
+    def shard_for(self, key: str) -> StorageBackend:
+        return self.shards[self.ring.index_for(key)]
+
+    async def start(self):
+        await asyncio.gather(*(shard.start() for shard in self.shards))
+
+    async def close(self):
+        for shard in self.shards:
+            await shard.close()
+
+    async def ping(self) -> bool:
+        return all(await asyncio.gather(*(shard.ping() for shard in self.shards)))
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.shard_for(key).get(key)
+
+    async def exists(self, key: str) -> bool:
+        return await self.shard_for(key).exists(key)
+
+    async def range(self, key: str, limit: Optional[int] = None) -> List[bytes]:
+        return await self.shard_for(key).range(key, limit)
+
+    async def lookup(
+        self,
+        key: str,
+        lock_key: str,
+        lock_token: str,
+        lock_ttl: int,
+        context_key: str,
+        context_limit: int,
+        revalidate: bool = False,
+        magic: Tuple[bytes, ...] = (),
+    ) -> LookupResult:
+        # the three keys share the session's hash tag
+        return await self.shard_for(key).lookup(
+            key, lock_key, lock_token, lock_ttl, context_key, context_limit, revalidate=revalidate, magic=magic
+        )
+
+    async def apply(self, batch: Batch, atomic: bool = False) -> int:
+        """One batch per shard, sent in parallel; atomic per shard only."""
+        batches: Dict[int, Batch] = {}
+        index = 0
+        for op in batch.ops:
+            # tags follow their key; messages go out with the writes before them (listeners hear every shard)
+            if op[0] != "publish":
+                index = self.ring.index_for(op[1])
+            batches.setdefault(index, Batch()).ops.append(op)
+        deleted = await asyncio.gather(*(self.shards[index].apply(part, atomic) for index, part in batches.items()))
+        return sum(deleted)
+
+    async def listen(self, channel: str) -> AsyncIterator[str]:
+        """Messages published on any shard, until one of the subscriptions is lost."""
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def forward(shard: StorageBackend):
+            try:
+                async for message in shard.listen(channel):
+                    queue.put_nowait(message)
+            except Exception as e:
+                queue.put_nowait(e)
+                return
+            queue.put_nowait(None)
+
+        tasks = [asyncio.create_task(forward(shard)) for shard in self.shards]
+        try:
+            while True:
+                message = await queue.get()
+                if isinstance(message, Exception):
+                    raise message
+                if message is None:
+                    return
+                yield message
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def tagged(self, tags: Sequence[str]) -> List[str]:
+        found = await asyncio.gather(*(shard.tagged(tags) for shard in self.shards))
+        return [key for keys in found for key in keys]
+
+    async def take_tokens(self, buckets: Sequence[Bucket]) -> Tuple[float, List[float]]:
+        # buckets taken together share a hash tag
+        return await self.shard_for(buckets[0].key).take_tokens(buckets)
+
+    async def index_sessions(self, writes: Dict[str, Dict[str, IndexedKey]], seen: Dict[str, float]):
+        per_shard: Dict[int, Tuple[dict, dict]] = {}
+        for session_id in writes.keys() | seen.keys():
+            shard_writes, shard_seen = per_shard.setdefault(self.ring.index_for(session_tag(session_id)), ({}, {}))
+            if session_id in writes:
+                shard_writes[session_id] = writes[session_id]
+            if session_id in seen:
+                shard_seen[session_id] = seen[session_id]
+        await asyncio.gather(*(self.shards[index].index_sessions(*indexed) for index, indexed in per_shard.items()))
+
+    async def session_totals(self) -> Tuple[int, int]:
+        totals = await asyncio.gather(*(shard.session_totals() for shard in self.shards))
+        return sum(count for count, _ in totals), sum(size for _, size in totals)
+
+    async def list_sessions(
+        self, by: str = "bytes", limit: int = 10, seen_before: Optional[float] = None
+    ) -> List[SessionUsage]:
+        found = await asyncio.gather(*(shard.list_sessions(by, limit, seen_before) for shard in self.shards))
+        sessions = [session for shard_sessions in found for session in shard_sessions]
+        if by == "bytes":
+            sessions.sort(key=lambda session: session.bytes, reverse=True)
+        else:
+            sessions.sort(key=lambda session: session.last_seen)
+        return sessions[:limit]
+
+    async def drop_sessions(self, session_ids: Sequence[str]) -> Dict[str, List[str]]:
+        per_shard: Dict[int, List[str]] = {}
+        for session_id in session_ids:
+            per_shard.setdefault(self.ring.index_for(session_tag(session_id)), []).append(session_id)
+        results = await asyncio.gather(*(self.shards[index].drop_sessions(ids) for index, ids in per_shard.items()))
+
+        dropped = {}
+        stray = Batch()
+        for index, result in zip(per_shard, results):
+            for session_id, keys in result.items():
+                dropped[session_id] = keys
+                # indexed keys without the session's hash tag may live on another shard
+                for key in keys:
+                    if self.ring.index_for(key) != index:
+                        stray.delete(key)
+        if stray.ops:
+            await self.apply(stray)
+        return dropped
+
+    def get_stats(self) -> dict:
+        return {"backend": self.name, "shards": self.ring.nodes}
@@ -0,0 +1,313 @@
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .base import Batch, Bucket, IndexedKey, LocalBroker, LookupResult, SessionUsage, StorageBackend, refill
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL);
+CREATE TABLE IF NOT EXISTS lists (key TEXT PRIMARY KEY, expires_at REAL);
+CREATE TABLE IF NOT EXISTS list_items (id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL, value BLOB NOT NULL);
+CREATE INDEX IF NOT EXISTS list_items_key ON list_items (key, id);
+CREATE TABLE IF NOT EXISTS tags (tag TEXT NOT NULL, key TEXT NOT NULL, expires_at REAL, PRIMARY KEY (tag, key));
+CREATE INDEX IF NOT EXISTS tags_expires_at ON tags (expires_at);
+CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, last_seen REAL NOT NULL, bytes INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions (last_seen);
+CREATE INDEX IF NOT EXISTS sessions_bytes ON sessions (bytes);
+CREATE TABLE IF NOT EXISTS session_keys (
+    session_id TEXT NOT NULL, key TEXT NOT NULL, size INTEGER NOT NULL, expires_at REAL, PRIMARY KEY (session_id, key)
+);
+CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL);
+"""
+
+# expired rows nobody reads again are swept every this many writes
+SWEEP_EVERY = 1024
+
+
+class SqliteBackend(StorageBackend):
+    """
+    Storage in a local SQLite file that survives restarts.
+    Statements run on the event loop: with WAL and synchronous=NORMAL a
+    commit does not fsync, so they cost microseconds, less than a thread hop.
+    Writes from several processes are safe, but cache invalidations only
+    reach the process that made them. A key holds either a value or a list.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.clock = clock
+        self._db: Optional[sqlite3.Connection] = None
+        self._broker = LocalBroker()
+        self._writes = 0
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            if self.path != ":memory:":
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(self.path, isolation_level=None, timeout=5.0, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(SCHEMA)
+            # files created before session keys had an expiry
+            if "expires_at" not in {row[1] for row in db.execute("PRAGMA table_info(session_keys)")}:
+                db.execute("ALTER TABLE session_keys ADD COLUMN expires_at REAL")
+            db.execute("CREATE INDEX IF NOT EXISTS session_keys_expires_at ON session_keys (session_id, expires_at)")
+            self._db = db
+        return self._db
+
+    async def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    async def ping(self) -> bool:
+        try:
+            self.db.execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self._get(key)
+
+    async def exists(self, key: str) -> bool:
+        return self._get(key) is not None or self._list_alive(key)
+
+    async def range(self, key: str, limit: Optional[int] = None) -> List[bytes]:
+        return self._range(key, limit)
+
+    async def lookup(
+        self,
+        key: str,
+        lock_key: str,
+        lock_token: str,
+        lock_ttl: int,
+        context_key: str,
+        context_limit: int,
+        revalidate: bool = False,
+        magic: Tuple[bytes, ...] = (),
+    ) -> LookupResult:
+        if not revalidate:
+            cached = self._get(key)
+            if cached is not None and (not magic or cached.startswith(magic)):
+                return LookupResult(cached, False, [])
+
+        with self._transaction():
+            locked = False
+            if lock_token and self._get(lock_key) is None:
+                self._set(lock_key, lock_token.encode(), lock_ttl)
+                locked = True
+            context = self._range(context_key, context_limit)
+
+        return LookupResult(None, locked, context)
+
+    async def apply(self, batch: Batch, atomic: bool = False) -> int:
+        # always one transaction: cheaper than a commit per statement
+        messages = []
+        deleted = 0
+        with self._transaction():
+            for op in batch.ops:
+                kind = op[0]
+                if kind == "set":
+                    self._set(op[1], op[2], op[3])
+                elif kind == "delete":
+                    deleted += self._get(op[1]) is not None or self._list_alive(op[1])
+                    self._delete(op[1])
+                elif kind == "push":
+                    self._push(*op[1:])
+                elif kind == "release_lock":
+                    self.db.execute("DELETE FROM kv WHERE key = ? AND value = ?", (op[1], op[2].encode()))
+                elif kind == "publish":
+                    messages.append(op[1:])
+                elif kind == "tag":
+                    _, key, tags, ttl = op
+                    expires_at = self.clock() + ttl if ttl else None
+                    self.db.executemany(
+                        "INSERT OR REPLACE INTO tags (tag, key, expires_at) VALUES (?, ?, ?)",
+                        [(tag, key, expires_at) for tag in tags],
+                    )
+                elif kind == "untag":
+                    self.db.executemany("DELETE FROM tags WHERE tag = ? AND key = ?", [(tag, op[1]) for tag in op[2]])
+
+            self._writes += len(batch)
+            if self._writes >= SWEEP_EVERY:
+                self._writes = 0
+                self._sweep()
+
+        for channel, message in messages:
+            self._broker.publish(channel, message)
+        return deleted
+
+    def listen(self, channel: str):
+        return self._broker.listen(channel)
+
+    async def tagged(self, tags: Sequence[str]) -> List[str]:
+        if not tags:
+            return []
+        query = " INTERSECT ".join(
+            ["SELECT key FROM tags WHERE tag = ? AND (expires_at IS NULL OR expires_at > ?)"] * len(tags)
+        )
+        now = self.clock()
+        return [row[0] for row in self.db.execute(query, [value for tag in tags for value in (tag, now)])]
+
+    async def take_tokens(self, buckets: Sequence[Bucket]) -> Tuple[float, List[float]]:
+        now = self.clock()
+        with self._transaction():
+            states = [
+                self.db.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (bucket.key,)).fetchone()
+                for bucket in buckets
+            ]
+            wait, levels = refill(buckets, states, now)
+            if wait:
+                return wait, levels
+            levels = [level - bucket.cost for bucket, level in zip(buckets, levels)]
+            self.db.executemany(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                [(bucket.key, level, now) for bucket, level in zip(buckets, levels)],
+            )
+        return 0.0, levels
+
+    async def index_sessions(self, writes: Dict[str, Dict[str, IndexedKey]], seen: Dict[str, float]):
+        db = self.db
+        now = self.clock()
+        with self._transaction():
+            for session_id, at in seen.items():
+                db.execute(
+                    "INSERT INTO sessions (session_id, last_seen, bytes) VALUES (?, ?, 0) "
+                    "ON CONFLICT (session_id) DO UPDATE SET last_seen = excluded.last_seen",
+                    (session_id, at),
+                )
+            for session_id, indexed in writes.items():
+                delta = 0
+                for key, entry in indexed.items():
+                    row = db.execute(
+                        "SELECT size FROM session_keys WHERE session_id = ? AND key = ?", (session_id, key)
+                    ).fetchone()
+                    delta += entry.size - (row[0] if row else 0)
+                    db.execute(
+                        "INSERT OR REPLACE INTO session_keys (session_id, key, size, expires_at) VALUES (?, ?, ?, ?)",
+                        (session_id, key, entry.size, entry.expires_at),
+                    )
+                db.execute(
+                    "INSERT INTO sessions (session_id, last_seen, bytes) VALUES (?, ?, ?) "
+                    "ON CONFLICT (session_id) DO UPDATE SET bytes = bytes + excluded.bytes",
+                    (session_id, seen.get(session_id, now), delta),
+                )
+            for session_id in writes.keys() | seen.keys():
+                expired, size = db.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM session_keys "
+                    "WHERE session_id = ? AND expires_at <= ?",
+                    (session_id, now),
+                ).fetchone()
+                if expired:
+                    db.execute("DELETE FROM session_keys WHERE session_id = ? AND expires_at <= ?", (session_id, now))
+                    db.execute("UPDATE sessions SET bytes = bytes - ? WHERE session_id = ?", (size, session_id))
+
+    async def session_totals(self) -> Tuple[int, int]:
+        count, total = self.db.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM sessions").fetchone()
+        return count, total
+
+    async def list_sessions(
+        self, by: str = "bytes", limit: int = 10, seen_before: Optional[float] = None
+    ) -> List[SessionUsage]:
+        query = (
+            "SELECT session_id, bytes, (SELECT COUNT(*) FROM session_keys k WHERE k.session_id = s.session_id), "
+            "last_seen FROM sessions s "
+        )
+        if by == "bytes":
+            rows = self.db.execute(query + "ORDER BY bytes DESC LIMIT ?", (limit,))
+        else:
+            before = float("inf") if seen_before is None else seen_before
+            rows = self.db.execute(query + "WHERE last_seen < ? ORDER BY last_seen LIMIT ?", (before, limit))
+        return [SessionUsage(*row) for row in rows]
+
+    async def drop_sessions(self, session_ids: Sequence[str]) -> Dict[str, List[str]]:
+        dropped = {}
+        with self._transaction():
+            for session_id in session_ids:
+                keys = [
+                    row[0]
+                    for row in self.db.execute("SELECT key FROM session_keys WHERE session_id = ?", (session_id,))
+                ]
+                for key in keys:
+                    self._delete(key)
+                self.db.execute("DELETE FROM session_keys WHERE session_id = ?", (session_id,))
+                self.db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                dropped[session_id] = keys
+        return dropped
+
+    @contextmanager
+    def _transaction(self):
+        db = self.db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def _alive(self, expires_at: Optional[float]) -> bool:
+        return expires_at is None or expires_at > self.clock()
+
+    def _get(self, key: str) -> Optional[bytes]:
+        row = self.db.execute("SELECT value, expires_at FROM kv WHERE key = ?", (key,)).fetchone()
+        if row is None or not self._alive(row[1]):
+            return None
+        return row[0]
+
+    def _set(self, key: str, value: bytes, ttl: Optional[int]):
+        expires_at = self.clock() + ttl if ttl else None
+        self.db.execute("INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)", (key, value, expires_at))
+
+    def _delete(self, key: str):
+        self.db.execute("DELETE FROM kv WHERE key = ?", (key,))
+        self._delete_list(key)
+
+    def _delete_list(self, key: str):
+        self.db.execute("DELETE FROM lists WHERE key = ?", (key,))
+        self.db.execute("DELETE FROM list_items WHERE key = ?", (key,))
+
+    def _list_alive(self, key: str) -> bool:
+        row = self.db.execute("SELECT expires_at FROM lists WHERE key = ?", (key,)).fetchone()
+        return row is not None and self._alive(row[0])
+
+    def _range(self, key: str, limit: Optional[int]) -> List[bytes]:
+        if not self._list_alive(key):
+            return []
+        rows = self.db.execute(
+            "SELECT value FROM list_items WHERE key = ? ORDER BY id DESC LIMIT ?", (key, -1 if limit is None else limit)
+        )
+        return [row[0] for row in rows]
+
+    def _push(self, key: str, values: List[bytes], max_len: int, ttl: Optional[int]):
+        row = self.db.execute("SELECT expires_at FROM lists WHERE key = ?", (key,)).fetchone()
+        if row is not None and not self._alive(row[0]):
+            self._delete_list(key)
+            row = None
+        if row is None:
+            self.db.execute("INSERT INTO lists (key, expires_at) VALUES (?, NULL)", (key,))
+
+        self.db.executemany("INSERT INTO list_items (key, value) VALUES (?, ?)", [(key, value) for value in values])
+        self.db.execute(
+            "DELETE FROM list_items WHERE key = ? AND id NOT IN "
+            "(SELECT id FROM list_items WHERE key = ? ORDER BY id DESC LIMIT ?)",
+            (key, key, max_len),
+        )
+        if ttl:
+            self.db.execute("UPDATE lists SET expires_at = ? WHERE key = ?", (self.clock() + ttl, key))
+
+    def _sweep(self):
+        now = self.clock()
+        self.db.execute("DELETE FROM kv WHERE expires_at <= ?", (now,))
+        self.db.execute(
+            "DELETE FROM list_items WHERE key IN (SELECT key FROM lists WHERE expires_at <= ?)",
+            (now,),
+        )
+        self.db.execute("DELETE FROM lists WHERE expires_at <= ?", (now,))
+        self.db.execute("DELETE FROM tags WHERE expires_at <= ?", (now,))
@@ -1,12 +1,92 @@
-﻿from pydantic_settings import BaseSettings, SettingsConfigDict
+﻿from typing import Literal
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env", env_ignore_empty=True, extra="ignore", env_prefix="HELIX_")
 
+    # where cache, context and logs live: redis (shared by all workers), or embedded for a single process
+    STORAGE_BACKEND: Literal["redis", "memory", "sqlite"] = "redis"
+    STORAGE_SQLITE_PATH: str = "data/helix.db"
+    # stored values from this size on are compressed (zstd needs the zstandard package)
+    STORAGE_COMPRESSION: Literal["none", "zlib", "zstd"] = "zlib"
+    STORAGE_COMPRESSION_MIN_BYTES: int = 1024
+    STORAGE_COMPRESSION_LEVEL: int | None = None
+
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
     REDIS_DB: int = 0
+    REDIS_PASSWORD: str | None = None
+    # comma separated host:port list: keys are sharded over the nodes by session with consistent
+    # hashing, adding a node moves about 1/N of the sessions (see `helix rebalance`)
+    REDIS_NODES: str | None = None
+    # REDIS_NODES (or REDIS_HOST:REDIS_PORT) are startup nodes of a Redis Cluster
+    REDIS_CLUSTER: bool = False
+
+    # connection pool
+    REDIS_MAX_CONNECTIONS: int = 100
+    REDIS_POOL_TIMEOUT: float = 5.0
+    REDIS_SOCKET_TIMEOUT: float = 5.0
+
+    # response cache policy (see assets/cache/policy.yaml)
+    CACHE_POLICY_FILE: str = "assets/cache/policy.yaml"
+    CACHE_DEFAULT_TTL: int = 86400
+    CACHE_SOFT_TTL: int | None = None
+
+    # in-process (L1) response cache in front of Redis
+    CACHE_L1_MAX_BYTES: int = 64 * 1024 * 1024
+    CACHE_L1_TTL: int = 60
+    CACHE_INVALIDATION_CHANNEL: str = "helix:cache:invalidate"
+    PROMPT_RELOAD_CHANNEL: str = "helix:prompt:reload"
+    TEMPLATE_INVALIDATION_CHANNEL: str = "helix:templates:invalidate"
+
+    # session context: newest N requests per session, TTL refreshed on every append
+    CONTEXT_WINDOW: int = 5
+    CONTEXT_TTL: int = 3600
+
+    # session budgets: whole sessions are evicted when idle for SESSION_TTL, over their own
+    # quota, or least recently seen while all sessions together are over the global budget
+    SESSION_TTL: int = 86400
+    SESSION_MAX_BYTES: int = 16 * 1024 * 1024
+    SESSION_MAX_COUNT: int = 10000
+    SESSION_MAX_TOTAL_BYTES: int = 512 * 1024 * 1024
+    SESSION_INDEX_INTERVAL: float = 1.0
+
+    # single-flight: identical concurrent misses wait for one generation
+    SINGLEFLIGHT_LOCK_TTL: int = 35
+    SINGLEFLIGHT_POLL_INTERVAL: float = 0.5
+
+    # fixtures: record every response sent to FIXTURE_DIR, or replay only from it (no Redis, no AI provider)
+    FIXTURE_MODE: Literal["off", "record", "replay"] = "off"
+    FIXTURE_DIR: str = "fixtures"
+    FIXTURE_SEGMENT_BYTES: int = 64 * 1024 * 1024
+
+    # cache warm-up at startup from an OpenAPI document (file path or URL), in the background
+    WARMUP_SPEC: str | None = None
+    WARMUP_SESSION: str = "default_session"
+    WARMUP_CONCURRENCY: int = 4
+    # comma separated, * for every method
+    WARMUP_METHODS: str = "GET"
+
+    # response pools: misses on plain GETs are answered from items generated POOL_BATCH_SIZE at a time
+    # per collection, each served up to POOL_ITEM_USES times; topped up below POOL_MIN_ITEMS
+    POOL_ENABLED: bool = False
+    POOL_BATCH_SIZE: int = 20
+    POOL_MIN_ITEMS: int = 10
+    POOL_ITEM_USES: int = 10
+    POOL_PAGE_SIZE: int = 5
+    POOL_MAX_COLLECTIONS: int = 256
+    # seconds a collection whose fill failed or yielded no items is not filled again
+    POOL_FILL_BACKOFF: float = 60.0
+
+    # request log: entries kept for the dashboard, written in batches by a background task
+    LOG_MAX_ENTRIES: int = 100
+    LOG_QUEUE_SIZE: int = 10000
+    LOG_BATCH_SIZE: int = 500
+    LOG_FLUSH_INTERVAL: float = 0.25
+    # when the queue is full: drop (new entry), drop_oldest, or sample (replace a random queued entry)
+    LOG_OVERFLOW_POLICY: Literal["drop", "drop_oldest", "sample"] = "drop_oldest"
 
 
 settings = Settings()
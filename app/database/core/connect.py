@@ -1,16 +1,100 @@
-﻿import redis
+﻿import logging
+from typing import List, Tuple
+
+import redis.asyncio as redis
+from redis.asyncio.cluster import ClusterNode, RedisCluster
+from redis.exceptions import RedisClusterException, RedisError
 
 from .config import settings
+from .roundtrips import CountingConnection
+
+logger = logging.getLogger(__name__)
+
+_pools: List[redis.BlockingConnectionPool] = []
+# one client per node of REDIS_NODES, or the single cluster client
+_clients: List[redis.Redis | RedisCluster] = []
+
+
+def redis_nodes() -> List[str]:
+    """host:port of every configured node, REDIS_HOST:REDIS_PORT when REDIS_NODES is not set."""
+    if settings.REDIS_NODES:
+        return [node.strip() for node in settings.REDIS_NODES.split(",") if node.strip()]
+    return [f"{settings.REDIS_HOST}:{settings.REDIS_PORT}"]
+
+
+def parse_node(node: str) -> Tuple[str, int]:
+    host, _, port = node.rpartition(":")
+    if not host:
+        return node, 6379
+    return host, int(port)
+
+
+def init_redis() -> redis.Redis | RedisCluster:
+    """Create the shared connection pools. Called once from the app lifespan."""
+    if _clients:
+        return _clients[0]
+
+    nodes = redis_nodes()
+    if settings.REDIS_CLUSTER:
+        # the nodes are startup nodes, the client discovers the rest of the cluster and routes by slot
+        client = RedisCluster(
+            startup_nodes=[ClusterNode(*parse_node(node)) for node in nodes],
+            password=settings.REDIS_PASSWORD,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            decode_responses=False,
+        )
+        # shared with the node manager, so connections to discovered nodes count round trips too
+        client.connection_kwargs["connection_class"] = CountingConnection
+        _clients.append(client)
+        logger.info(f"Redis cluster client ready ({', '.join(nodes)}, max {settings.REDIS_MAX_CONNECTIONS} per node)")
+        return client
+
+    for node in nodes:
+        host, port = parse_node(node)
+        pool = redis.BlockingConnectionPool(
+            connection_class=CountingConnection,
+            host=host,
+            port=port,
+            db=settings.REDIS_DB,
+            password=settings.REDIS_PASSWORD,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            timeout=settings.REDIS_POOL_TIMEOUT,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            # values are stored as bytes: cached responses are pre-encoded, JSON is decoded by the services
+            decode_responses=False,
+        )
+        _pools.append(pool)
+        _clients.append(redis.Redis(connection_pool=pool))
+    logger.info(f"Redis pool ready ({', '.join(nodes)}, max {settings.REDIS_MAX_CONNECTIONS} per node)")
+    return _clients[0]
+
+
+async def close_redis():
+    for client in _clients:
+        await client.aclose()
+    for pool in _pools:
+        await pool.disconnect()
 
-r = redis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB, decode_responses=True)
+    _pools.clear()
+    _clients.clear()
 
 
-def get_redis_connection():
-    return r
+def get_redis_connection(node: int = 0) -> redis.Redis | RedisCluster:
+    # outside of the app lifespan (CLI, scripts) the pools are created on first use
+    if not _clients:
+        init_redis()
+    return _clients[node]
 
 
-def ping_redis():
+async def ping_redis(node: int | None = None):
+    """Ping one node, or every node when `node` is None."""
+    if not _clients:
+        init_redis()
     try:
-        return r.ping()
-    except redis.ConnectionError:
+        for client in _clients if node is None else [_clients[node]]:
+            if not await client.ping():
+                return False
+        return True
+    except (RedisError, RedisClusterException):
         return False
@@ -0,0 +1,179 @@
+"""
+Moving keys between Redis nodes after REDIS_NODES changed.
+
+Workers started with the new node list read and write each session on its
+new node right away; the sessions that moved simply miss there until their
+keys are moved by `rebalance` (or regenerated). Keys are copied with
+DUMP/RESTORE, keeping their TTL, and never overwrite a key the new owner
+already has: that one was written after the switch and is newer.
+
+The session index and secondary indexes are per node: the entries of moved
+sessions and keys are moved along with them.
+"""
+
+import logging
+import math
+import time
+from typing import Dict, List, Sequence
+
+import redis.asyncio as redis
+
+from app.database.backends.redis import (
+    INDEX_SESSIONS,
+    SESSIONS,
+    SESSIONS_BYTES,
+    SESSIONS_SEEN,
+    SESSIONS_TOTAL,
+    TAGS,
+    session_expiry_key,
+    session_index_key,
+)
+from app.database.backends.sharded import HashRing, session_tag
+
+from .config import settings
+from .connect import parse_node
+
+logger = logging.getLogger(__name__)
+
+SCAN_COUNT = 1000
+MOVE_CHUNK = 500
+
+
+def _client(node: str) -> redis.Redis:
+    host, port = parse_node(node)
+    return redis.Redis(
+        host=host,
+        port=port,
+        db=settings.REDIS_DB,
+        password=settings.REDIS_PASSWORD,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        decode_responses=False,
+    )
+
+
+async def _move_keys(source: redis.Redis, target: redis.Redis, keys: List[bytes], stats: dict):
+    async with target.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.exists(key)
+        rewritten = await pipe.execute()
+    async with source.pipeline(transaction=False) as pipe:
+        for key, exists in zip(keys, rewritten):
+            if not exists:
+                pipe.pttl(key)
+                pipe.dump(key)
+        dumped = iter(await pipe.execute())
+
+    restoring = []
+    async with target.pipeline(transaction=False) as pipe:
+        for key, exists in zip(keys, rewritten):
+            if exists:
+                stats["kept_newer"] += 1
+                continue
+            ttl, value = next(dumped), next(dumped)
+            # expired since the scan otherwise
+            if value is not None and ttl != -2:
+                pipe.restore(key, max(ttl, 0), value)
+                restoring.append(key)
+        results = await pipe.execute(raise_on_error=False)
+
+    for result in results:
+        if isinstance(result, Exception):
+            # written on the target between the check and the restore
+            if "BUSYKEY" not in str(result):
+                raise result
+            stats["kept_newer"] += 1
+        else:
+            stats["keys"] += 1
+    # a key the target already has is dropped from the source as well
+    await source.delete(*keys)
+
+
+async def _move_tags(source: redis.Redis, clients: Dict[str, redis.Redis], node: str, ring: HashRing, stats: dict):
+    async for tag_key in source.scan_iter(match=f"{TAGS}*", count=SCAN_COUNT):
+        moving: Dict[str, Dict[bytes, float]] = {}
+        async for member, score in source.zscan_iter(tag_key):
+            owner = ring.node_for(member.decode())
+            if owner != node:
+                moving.setdefault(owner, {})[member] = score
+        for owner, members in moving.items():
+            await clients[owner].zadd(tag_key, members)
+            await source.zrem(tag_key, *members)
+            stats["tag_entries"] += len(members)
+
+
+async def _move_sessions(source: redis.Redis, clients: Dict[str, redis.Redis], node: str, ring: HashRing, stats: dict):
+    async for session_id, seen in source.zscan_iter(SESSIONS_SEEN):
+        session_id = session_id.decode()
+        owner = ring.node_for(session_tag(session_id))
+        if owner == node:
+            continue
+        target = clients[owner]
+        sizes = await source.hgetall(session_index_key(session_id))
+        expiry = dict(await source.zrange(session_expiry_key(session_id), 0, -1, withscores=True))
+        newer_seen = await target.zscore(SESSIONS_SEEN, session_id)
+
+        # the indexing script adds only what the target's own entry for the session is missing
+        keys = [
+            SESSIONS_SEEN,
+            SESSIONS_BYTES,
+            SESSIONS_TOTAL,
+            session_index_key(session_id),
+            session_expiry_key(session_id),
+        ]
+        args = [time.time(), session_id, max(seen, newer_seen or 0), len(sizes)]
+        for key, size in sizes.items():
+            expires_at = expiry.get(key, math.inf)
+            args += [key, size, "+inf" if math.isinf(expires_at) else expires_at]
+        await target.eval(INDEX_SESSIONS, len(keys), *keys, *args)
+
+        freed = await source.zscore(SESSIONS_BYTES, session_id)
+        async with source.pipeline(transaction=True) as pipe:
+            pipe.delete(session_index_key(session_id), session_expiry_key(session_id))
+            pipe.zrem(SESSIONS_SEEN, session_id)
+            pipe.zrem(SESSIONS_BYTES, session_id)
+            pipe.decrby(SESSIONS_TOTAL, int(freed or 0))
+            await pipe.execute()
+        stats["sessions"] += 1
+
+
+async def rebalance(old_nodes: Sequence[str], new_nodes: Sequence[str], dry_run: bool = False) -> dict:
+    """
+    Move every key of `old_nodes` that the ring of `new_nodes` places on another
+    node to that node. With `dry_run`, only count the keys that would move.
+    """
+    ring = HashRing(new_nodes)
+    clients = {node: _client(node) for node in {*old_nodes, *new_nodes}}
+    stats = {"scanned": 0, "keys": 0, "kept_newer": 0, "tag_entries": 0, "sessions": 0}
+    try:
+        for node in old_nodes:
+            source = clients[node]
+            moving: Dict[str, List[bytes]] = {}
+            async for key in source.scan_iter(count=SCAN_COUNT):
+                stats["scanned"] += 1
+                name = key.decode(errors="replace")
+                # per node indexes, moved entry by entry below
+                if name.startswith((SESSIONS, TAGS)):
+                    continue
+                owner = ring.node_for(name)
+                if owner == node:
+                    continue
+                if dry_run:
+                    stats["keys"] += 1
+                    continue
+                chunk = moving.setdefault(owner, [])
+                chunk.append(key)
+                if len(chunk) >= MOVE_CHUNK:
+                    await _move_keys(source, clients[owner], chunk, stats)
+                    chunk.clear()
+            for owner, chunk in moving.items():
+                if chunk:
+                    await _move_keys(source, clients[owner], chunk, stats)
+
+            if not dry_run:
+                await _move_tags(source, clients, node, ring, stats)
+                await _move_sessions(source, clients, node, ring, stats)
+            logger.info(f"Rebalanced {node}: {stats}")
+    finally:
+        for client in clients.values():
+            await client.aclose()
+    return stats
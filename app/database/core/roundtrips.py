@@ -0,0 +1,52 @@
+"""
+Redis round-trip instrumentation.
+Every command or pipeline written to a pooled connection counts as one
+round trip for the request that is currently being handled.
+"""
+
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+import redis.asyncio as redis
+
+
+class RoundTripCounter:
+    __slots__ = ("count",)
+
+    def __init__(self):
+        self.count = 0
+
+
+_current: ContextVar[Optional[RoundTripCounter]] = ContextVar("redis_round_trips", default=None)
+
+# per request outcome: number of requests and round trips they made
+round_trip_stats: Dict[str, Dict[str, int]] = {}
+
+
+def track_round_trips() -> RoundTripCounter:
+    """Start counting round trips for the current request."""
+    counter = RoundTripCounter()
+    _current.set(counter)
+    return counter
+
+
+def record_round_trips(outcome: str, count: int):
+    stats = round_trip_stats.setdefault(outcome, {"requests": 0, "round_trips": 0, "max": 0})
+    stats["requests"] += 1
+    stats["round_trips"] += count
+    stats["max"] = max(stats["max"], count)
+
+
+def get_round_trip_stats() -> dict:
+    return {
+        outcome: {**stats, "avg": round(stats["round_trips"] / stats["requests"], 2)}
+        for outcome, stats in round_trip_stats.items()
+    }
+
+
+class CountingConnection(redis.Connection):
+    async def send_packed_command(self, command, check_health: bool = True) -> None:
+        counter = _current.get()
+        if counter is not None:
+            counter.count += 1
+        await super().send_packed_command(command, check_health)
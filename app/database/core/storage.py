@@ -0,0 +1,65 @@
+import logging
+
+from app.database.backends import (
+    Codec,
+    CompressedBackend,
+    MemoryBackend,
+    RedisBackend,
+    ShardedBackend,
+    SqliteBackend,
+    StorageBackend,
+)
+
+from .config import settings
+from .connect import redis_nodes
+
+logger = logging.getLogger(__name__)
+
+_storage: StorageBackend | None = None
+
+
+def create_storage(backend: str) -> StorageBackend:
+    if backend == "memory":
+        storage = MemoryBackend()
+    elif backend == "sqlite":
+        storage = SqliteBackend(settings.STORAGE_SQLITE_PATH)
+    elif settings.REDIS_CLUSTER:
+        storage = RedisBackend(cluster=True)
+    else:
+        nodes = redis_nodes()
+        if len(nodes) > 1:
+            storage = ShardedBackend([RedisBackend(node=index) for index in range(len(nodes))], nodes)
+        else:
+            storage = RedisBackend()
+
+    if settings.STORAGE_COMPRESSION == "none":
+        return storage
+    codec = Codec(
+        settings.STORAGE_COMPRESSION, settings.STORAGE_COMPRESSION_MIN_BYTES, settings.STORAGE_COMPRESSION_LEVEL
+    )
+    return CompressedBackend(storage, codec)
+
+
+def init_storage() -> StorageBackend:
+    """Create the configured storage backend. Called once from the app lifespan."""
+    global _storage
+
+    if _storage is None:
+        # replayed responses come from the fixture files, nothing else needs a server
+        backend = "memory" if settings.FIXTURE_MODE == "replay" else settings.STORAGE_BACKEND
+        _storage = create_storage(backend)
+        logger.info(f"Storage backend: {_storage.name}")
+    return _storage
+
+
+async def close_storage():
+    global _storage
+
+    if _storage is not None:
+        await _storage.close()
+    _storage = None
+
+
+def get_storage() -> StorageBackend:
+    # outside of the app lifespan (CLI, scripts) the backend is created on first use
+    return _storage if _storage is not None else init_storage()
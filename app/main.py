@@ -1,6 +1,7 @@
 ﻿import asyncio
 import logging
 import random
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
@@ -8,17 +9,63 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
 from app.database.core.config import settings
+from app.database.core.storage import close_storage, init_storage
 from app.routes.additional.openapi_generate_router import router as openapi_router
 from app.routes.requestbased import catch_all
 from app.routes.ui import dashboard
 from app.routes.ui import default as ui_routes
 from app.routes.ui import health
 from app.services.ai.config import ai_settings
-
-app = FastAPI(title="Helix", description="AI-Powered API Mocking Platform", version="0.1.0")
+from app.services.ai.manager import ai_manager
+from app.services.ai.prompt import system_prompt
+from app.services.ai.templates import response_templates
+from app.services.cache import cache_service
+from app.services.fixtures import fixture_service
+from app.services.logger import logger_service
+from app.services.pools import response_pools
+from app.services.sessions import session_index
+from app.services.warmup import warm_from_spec
 
 logger = logging.getLogger("uvicorn.error")
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    fixture_service.start()
+    await init_storage().start()
+    await cache_service.start()
+    await system_prompt.start()
+    await response_templates.start()
+    logger_service.start()
+    session_index.start()
+    if not fixture_service.replaying:
+        await ai_manager.start()
+    warmup = None
+    if settings.WARMUP_SPEC and not fixture_service.replaying:
+        warmup = asyncio.create_task(
+            warm_from_spec(
+                settings.WARMUP_SPEC,
+                settings.WARMUP_SESSION,
+                settings.WARMUP_CONCURRENCY,
+                settings.WARMUP_METHODS.split(","),
+            )
+        )
+    yield
+    if warmup is not None:
+        warmup.cancel()
+    await session_index.stop()
+    await response_pools.stop()
+    await ai_manager.close()
+    await logger_service.stop()
+    await response_templates.stop()
+    await system_prompt.stop()
+    await cache_service.stop()
+    await close_storage()
+    fixture_service.stop()
+
+
+app = FastAPI(title="Helix", description="AI-Powered API Mocking Platform", version="0.1.0", lifespan=lifespan)
+
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
@@ -8,7 +8,7 @@ router = APIRouter()
 
 @router.get("/api/generate-spec", tags=["OpenAPI Generation"])
 async def get_openapi_spec(limit: int = Query(50, ge=10)):
-    check_logs = logger_service.get_recent_logs(limit=1)
+    check_logs = await logger_service.get_recent_logs(limit=1)
 
     if not check_logs:
         raise HTTPException(status_code=404, detail="No traffic recorded yet. Make some requests to the API first.")
@@ -1,60 +1,59 @@
-﻿import json
-import time
+﻿import time
 
-from fastapi import APIRouter, BackgroundTasks, Request
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Request
+from starlette.background import BackgroundTask
 
-from app.services.ai.manager import ai_manager
-from app.services.analyzer import request_analyzer
-from app.services.cache import cache_service
-from app.services.context import context_manager
+from app.database.core.roundtrips import record_round_trips, track_round_trips
+from app.services.cache import CachedResponse, cache_service
+from app.services.cache_policy import cache_policy
+from app.services.fixtures import fixture_service
 from app.services.logger import logger_service
+from app.services.responder import MockRequest, mock_responder
 
 router = APIRouter()
 
 
 @router.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"])
-async def catch_all_handler(path: str, request: Request, background_tasks: BackgroundTasks):
+async def catch_all_handler(path: str, request: Request):
     start_time = time.time()
+    round_trips = track_round_trips()
     method = request.method
-    session_id = request.headers.get("X-Session-ID", "default_session")
-
-    try:
-        body = await request.json()
-    except:
-        body = {}
-
-    cache_key = cache_service.get_cache_key(session_id, method, path, body)
-    cached = await cache_service.get(cache_key)
-    if cached:
-        duration = (time.time() - start_time) * 1000
-        background_tasks.add_task(
-            logger_service.log_request, method, path, cached["status_code"], duration, body, cached["body"]
-        )
-        return JSONResponse(content=cached["body"], status_code=cached["status_code"], headers=cached.get("headers"))
-
-    resource = request_analyzer.extract_resource(path)
-    operation = request_analyzer.get_operation_type(method, path)
-
-    context = await context_manager.get_context(session_id)
-
-    response_data = await ai_manager.generate_response(method=method, path=path, body=body, context=context)
-
-    await cache_service.set(cache_key, response_data)
-
-    await context_manager.add_to_context(
-        session_id, {"method": method, "path": path, "body": body, "response": response_data}
+    # an empty id would be an empty hash tag, which shards the session's keys apart
+    session_id = request.headers.get("X-Session-ID") or "default_session"
+    raw_body = await request.body()
+
+    # key from raw bytes, cached responses are sent as stored
+    rule = cache_policy.match(method, path)
+    cache_key = cache_service.get_cache_key(
+        session_id, method, path, raw_body, query=request.query_params, headers=request.headers, rule=rule
     )
 
-    duration = (time.time() - start_time) * 1000
-    background_tasks.add_task(
-        logger_service.log_request,
-        method,
-        path,
-        response_data.get("status_code", 200),
-        duration,
-        body,
-        response_data.get("body"),
+    if fixture_service.replaying:
+        outcome = fixture_service.respond(cache_key)
+    else:
+        outcome = await mock_responder.respond(MockRequest(session_id, method, path, raw_body, rule, cache_key))
+        if outcome.source == "stream":
+            streamed = outcome.response
+
+            async def finish():
+                # the body has been sent, log and record the response as cached
+                prepared = (await streamed.completed).response
+                if fixture_service.recording:
+                    fixture_service.record(cache_key, prepared)
+                complete(method, path, raw_body, prepared, "stream", round_trips.count, start_time)
+
+            return streamed.to_response(BackgroundTask(finish))
+        if fixture_service.recording:
+            fixture_service.record(cache_key, outcome.response)
+
+    prepared = outcome.response
+    complete(method, path, raw_body, prepared, outcome.source, round_trips.count, start_time)
+    return prepared.to_response()
+
+
+def complete(method: str, path: str, raw_body: bytes, prepared: CachedResponse, source: str, count: int, started):
+    record_round_trips(source, count)
+    duration = (time.time() - started) * 1000
+    logger_service.log_request(
+        method, path, prepared.status_code, duration, raw_body, prepared.body, source=source, round_trips=count
     )
-
-    return JSONResponse(content=response_data.get("body", {}), status_code=response_data.get("status_code", 200))
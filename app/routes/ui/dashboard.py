@@ -1,7 +1,13 @@
-from fastapi import APIRouter, Request
+from typing import Literal
+
+from fastapi import APIRouter, HTTPException, Query, Request
 from fastapi.templating import Jinja2Templates
 
+from app.services.ai.prompt import system_prompt
+from app.services.ai.templates import response_templates
+from app.services.cache import cache_service
 from app.services.logger import logger_service
+from app.services.sessions import session_index
 
 router = APIRouter(tags=["Dashboard"])
 templates = Jinja2Templates(directory="templates")
@@ -14,11 +20,58 @@ async def dashboard(request: Request):
 
 @router.get("/api/system/logs")
 async def return_logs(limit: int = 50):
-    logs = logger_service.get_recent_logs(limit)
+    logs = await logger_service.get_recent_logs(limit)
     return logs
 
 
 @router.delete("/api/system/logs")
 async def clear_logs():
-    logger_service.clear_logs()
+    await logger_service.clear_logs()
     return {"status": "success", "message": "Logs cleared."}
+
+
+@router.get("/api/system/sessions")
+async def top_sessions(limit: int = Query(10, ge=1, le=1000), by: Literal["bytes", "idle"] = "bytes"):
+    """Sessions using the most memory (by=bytes) or idle the longest (by=idle)."""
+    return {"sessions": await session_index.top_sessions(limit, by), "stats": session_index.get_stats()}
+
+
+@router.delete("/api/system/sessions/{session_id}")
+async def evict_session(session_id: str):
+    await session_index.flush()
+    keys = await session_index.evict([session_id])
+    return {"status": "success", "message": f"Session evicted, {keys} keys deleted."}
+
+
+@router.delete("/api/system/cache")
+async def purge_cache(path_prefix: str | None = None, method: str | None = None, prompt: str | None = None):
+    """
+    Delete cached responses under a path prefix (whole segments), for a method,
+    generated under a system prompt version, or matching several of these.
+    """
+    if path_prefix is None and not method and not prompt:
+        raise HTTPException(status_code=400, detail="Give a path_prefix, a method or a prompt version.")
+    deleted = await cache_service.purge(path_prefix, method, prompt)
+    return {"status": "success", "deleted": deleted}
+
+
+@router.post("/api/system/prompt/reload")
+async def reload_prompt(purge: bool = False):
+    """Re-read the system prompt on every worker; purge=true also deletes responses generated under the old one."""
+    previous = await system_prompt.reload_all()
+    deleted = 0
+    if purge and previous and previous != system_prompt.version:
+        deleted = await cache_service.purge(prompt=previous)
+    return {"status": "success", "version": system_prompt.version, "previous": previous, "deleted": deleted}
+
+
+@router.get("/api/system/templates")
+async def list_templates():
+    return {"templates": await response_templates.list()}
+
+
+@router.delete("/api/system/templates")
+async def invalidate_templates(route: str | None = None, method: str | None = None):
+    """Delete learned response templates on every worker: of a route (/api/users/123 or /api/users/{id}), or all."""
+    deleted = await response_templates.invalidate(route, method)
+    return {"status": "success", "deleted": deleted}
@@ -3,7 +3,7 @@ from app.services.logger import logger_service
 
 
 async def give_recent_logs(limit: int = 100):
-    logs = logger_service.get_recent_logs(limit=limit)
+    logs = await logger_service.get_recent_logs(limit=limit)
 
     if not logs:
         return {"error": "No logs available", "message": "Make some API requests first to generate traffic data"}
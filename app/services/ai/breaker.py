@@ -0,0 +1,107 @@
+import asyncio
+import time
+from collections import deque
+from typing import Optional
+
+import httpx
+
+from app.services.ai.config import ai_settings
+
+
+def is_timeout(error: BaseException) -> bool:
+    """Whether `error` is, or was raised while handling, a timeout."""
+    while error is not None:
+        if isinstance(error, (httpx.TimeoutException, asyncio.TimeoutError)):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class CircuitBreaker:
+    """
+    Keeps calls away from a failing provider.
+    Closed, it counts the outcome of the last `window` calls and opens when
+    at least `min_calls` of them were made and the share of failures reaches
+    `error_rate`, or at once on a timeout. Open, it refuses every call for
+    `cooldown` seconds, then lets a single probe through (half-open): the
+    probe's success closes it, its failure opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(
+        self,
+        window: Optional[int] = None,
+        error_rate: Optional[float] = None,
+        min_calls: Optional[int] = None,
+        cooldown: Optional[float] = None,
+        clock=time.monotonic,
+    ):
+        self.error_rate = ai_settings.AI_BREAKER_ERROR_RATE if error_rate is None else error_rate
+        self.min_calls = ai_settings.AI_BREAKER_MIN_CALLS if min_calls is None else min_calls
+        self.cooldown = ai_settings.AI_BREAKER_COOLDOWN if cooldown is None else cooldown
+        self.clock = clock
+        self.state = self.CLOSED
+        self.stats = {"calls": 0, "failures": 0, "rejected": 0, "trips": 0}
+        self.last_error: Optional[str] = None
+        self._outcomes = deque(maxlen=ai_settings.AI_BREAKER_WINDOW if window is None else window)
+        self._opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """Whether a call may go to the provider now; a True in the half-open state claims the probe."""
+        if self.state == self.OPEN and self.clock() - self._opened_at >= self.cooldown:
+            self.state = self.HALF_OPEN
+        if self.state == self.CLOSED or (self.state == self.HALF_OPEN and not self._probing):
+            self._probing = self.state == self.HALF_OPEN
+            return True
+        self.stats["rejected"] += 1
+        return False
+
+    def record_success(self):
+        self.stats["calls"] += 1
+        self._probing = False
+        if self.state != self.CLOSED:
+            self.state = self.CLOSED
+            self._outcomes.clear()
+        self._outcomes.append(True)
+
+    def record_failure(self, error: BaseException):
+        self.stats["calls"] += 1
+        self.stats["failures"] += 1
+        self.last_error = f"{type(error).__name__}: {error}"[:200]
+        self._probing = False
+        self._outcomes.append(False)
+
+        failures = self._outcomes.count(False)
+        if (
+            self.state == self.HALF_OPEN
+            or is_timeout(error)
+            or (len(self._outcomes) >= self.min_calls and failures >= self.error_rate * len(self._outcomes))
+        ):
+            self.trip()
+
+    def abandon(self):
+        """The call was cancelled before it had an outcome, let another one probe."""
+        self._probing = False
+
+    def trip(self):
+        if self.state != self.OPEN:
+            self.stats["trips"] += 1
+        self.state = self.OPEN
+        self._opened_at = self.clock()
+        self._probing = False
+
+    def get_stats(self) -> dict:
+        if self.state == self.OPEN and self.clock() - self._opened_at >= self.cooldown:
+            self.state = self.HALF_OPEN
+        window = len(self._outcomes)
+        return {
+            "state": self.state,
+            "error_rate": round(self._outcomes.count(False) / window, 4) if window else 0.0,
+            "retry_in": (
+                round(max(0.0, self._opened_at + self.cooldown - self.clock()), 1) if self.state == self.OPEN else 0.0
+            ),
+            "last_error": self.last_error,
+            **self.stats,
+        }
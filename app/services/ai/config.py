@@ -21,20 +21,73 @@ class AISettings(BaseSettings):
     # DeepSeek (OpenRouter)
     OPENROUTER_API_KEY: Optional[str] = Field(default=None, description="OpenRouter API key")
     OPENROUTER_MODEL: str = Field(default="deepseek/deepseek-chat", description="DeepSeek model")
+    OPENROUTER_RPM: Optional[int] = Field(default=20, ge=0, description="Requests per minute, 0 for no limit")
+    OPENROUTER_RPD: Optional[int] = Field(default=500, ge=0, description="Requests per day, 0 for no limit")
+    OPENROUTER_TPM: Optional[int] = Field(default=None, ge=0, description="Tokens per minute, 0 for no limit")
 
     # Ollama
     OLLAMA_HOST: str = Field(default="http://localhost:11434", description="Ollama server URL")
     OLLAMA_MODEL: str = Field(default="llama3", description="Ollama model")
+    OLLAMA_RPM: Optional[int] = Field(default=None, ge=0, description="Requests per minute, 0 for no limit")
+    OLLAMA_RPD: Optional[int] = Field(default=None, ge=0, description="Requests per day, 0 for no limit")
+    OLLAMA_TPM: Optional[int] = Field(default=None, ge=0, description="Tokens per minute, 0 for no limit")
 
     # Groq
     GROQ_API_KEY: Optional[str] = Field(default=None, description="Groq API key")
     GROQ_MODEL: str = Field(default="llama-3.1-70b-versatile", description="Groq model")
+    GROQ_RPM: Optional[int] = Field(default=30, ge=0, description="Requests per minute, 0 for no limit")
+    GROQ_RPD: Optional[int] = Field(default=14400, ge=0, description="Requests per day, 0 for no limit")
+    GROQ_TPM: Optional[int] = Field(default=None, ge=0, description="Tokens per minute, 0 for no limit")
 
     # General settings
     AI_TEMPERATURE: float = Field(default=0.7, ge=0.0, le=2.0)
     AI_MAX_TOKENS: int = Field(default=2000, gt=0)
     AI_TIMEOUT: int = Field(default=30, gt=0)
-    AI_AUTO_FALLBACK: bool = Field(default=True)
+    AI_AUTO_FALLBACK: bool = Field(default=True, description="Fall back to demo when the providers fail")
+
+    # providers tried in order, e.g. "groq,ollama,demo" (default: AI_PROVIDER, then demo with AI_AUTO_FALLBACK)
+    AI_PROVIDER_CHAIN: Optional[str] = Field(default=None)
+    # a provider's breaker opens when this share of its last AI_BREAKER_WINDOW calls failed
+    # (after at least AI_BREAKER_MIN_CALLS) or on a timeout, and lets a probe through after the cooldown
+    AI_BREAKER_WINDOW: int = Field(default=20, gt=0)
+    AI_BREAKER_MIN_CALLS: int = Field(default=5, gt=0)
+    AI_BREAKER_ERROR_RATE: float = Field(default=0.5, gt=0.0, le=1.0)
+    AI_BREAKER_COOLDOWN: float = Field(default=30.0, ge=0)
+
+    # send a call slower than this percentile of its provider's recent latencies to the next provider
+    # too, the first answer wins; at most AI_HEDGE_BUDGET of calls are hedged
+    AI_HEDGE: bool = Field(default=False)
+    AI_HEDGE_PERCENTILE: float = Field(default=95.0, gt=0.0, lt=100.0)
+    AI_HEDGE_BUDGET: float = Field(default=0.05, ge=0.0, le=1.0)
+    AI_HEDGE_MIN_SAMPLES: int = Field(default=20, gt=0)
+
+    # a call over its provider's quota waits for it in a queue of at most AI_LIMIT_QUEUE_SIZE calls,
+    # for up to AI_LIMIT_QUEUE_TIMEOUT seconds, before the next provider of the chain is tried
+    AI_LIMIT_QUEUE_SIZE: int = Field(default=100, ge=0)
+    AI_LIMIT_QUEUE_TIMEOUT: float = Field(default=10.0, ge=0)
+
+    # tokens of the user prompt (request body and context), e.g. "ollama=4000,groq:llama-3.1-8b-instant=800"
+    # for per provider or provider:model budgets; bodies are cut down and context entries picked to fit
+    AI_PROMPT_TOKEN_BUDGET: int = Field(default=1500, gt=0)
+    AI_PROMPT_TOKEN_BUDGETS: Optional[str] = Field(default=None)
+
+    # answer GETs of a route from a template learned from its first generated response, filled with Faker
+    AI_TEMPLATES: bool = Field(default=False)
+    AI_TEMPLATE_TTL: int = Field(default=7 * 86400, gt=0, description="Seconds a learned template is kept")
+
+    # stream misses to the client as the provider writes them, the whole response is still cached
+    AI_STREAMING: bool = Field(default=False)
+
+    # system prompt, kept in memory and read again when the file's mtime changes
+    AI_SYSTEM_PROMPT_FILE: str = Field(default="assets/AI/MOCKPILOT_SYSTEM.md")
+    AI_SYSTEM_PROMPT_CHECK_INTERVAL: float = Field(default=1.0, ge=0, description="Seconds between mtime checks")
+
+    # pooled HTTP client per provider, kept open for the lifetime of the server
+    AI_HTTP_MAX_CONNECTIONS: int = Field(default=100, gt=0)
+    AI_HTTP_MAX_KEEPALIVE: int = Field(default=20, ge=0)
+    AI_HTTP_KEEPALIVE_EXPIRY: float = Field(default=60.0, ge=0)
+    # needs the h2 package (pip install "httpx[http2]"), used over https only
+    AI_HTTP2: bool = Field(default=False)
 
     CHAOS_ENABLED: bool = False
     CHAOS_ERROR_RATE: float = 0.1
@@ -0,0 +1,84 @@
+from collections import deque
+from typing import Dict, Optional
+
+from app.services.ai.config import ai_settings
+
+# latencies kept per provider for the hedge delay
+LATENCY_WINDOW = 200
+# hedges that may be saved up while traffic is calm, so a burst of slow calls can still be hedged
+HEDGE_BURST = 10.0
+
+
+class LatencyWindow:
+    """Latencies of a provider's most recent calls."""
+
+    def __init__(self, size: int = LATENCY_WINDOW):
+        self._samples = deque(maxlen=size)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, percentile: float) -> float:
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+
+class HedgePolicy:
+    """
+    When to send a slow call to a second provider as well.
+    A call is hedged once it has taken longer than `percentile` of its
+    provider's recent latencies. Every call that could be hedged earns
+    `budget` of a hedge and every hedge spends a whole one, so hedges stay
+    within that fraction of traffic and quota is not doubled.
+    """
+
+    def __init__(
+        self,
+        enabled: Optional[bool] = None,
+        percentile: Optional[float] = None,
+        budget: Optional[float] = None,
+        min_samples: Optional[int] = None,
+    ):
+        self.enabled = ai_settings.AI_HEDGE if enabled is None else enabled
+        self.percentile = ai_settings.AI_HEDGE_PERCENTILE if percentile is None else percentile
+        self.budget = ai_settings.AI_HEDGE_BUDGET if budget is None else budget
+        self.min_samples = ai_settings.AI_HEDGE_MIN_SAMPLES if min_samples is None else min_samples
+        self.stats = {"hedged": 0, "hedge_wins": 0, "over_budget": 0}
+        self.latencies: Dict[str, LatencyWindow] = {}
+        self._tokens = 0.0
+
+    def record(self, provider: str, seconds: float):
+        self.latencies.setdefault(provider, LatencyWindow()).add(seconds)
+
+    def delay(self, provider: str) -> Optional[float]:
+        """Seconds to wait for `provider` before hedging, None when its call is not hedged."""
+        latencies = self.latencies.get(provider)
+        if not self.enabled or latencies is None or len(latencies) < self.min_samples:
+            return None
+        self._tokens = min(HEDGE_BURST, self._tokens + self.budget)
+        return latencies.percentile(self.percentile)
+
+    def admit(self) -> bool:
+        """Spend a hedge from the budget."""
+        if self._tokens < 1:
+            self.stats["over_budget"] += 1
+            return False
+        self._tokens -= 1
+        self.stats["hedged"] += 1
+        return True
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "percentile": self.percentile,
+            "budget": self.budget,
+            "delays": {
+                provider: round(latencies.percentile(self.percentile), 3)
+                for provider, latencies in self.latencies.items()
+                if len(latencies) >= self.min_samples
+            },
+            **self.stats,
+        }
@@ -0,0 +1,129 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, List, Optional
+
+from app.database.backends import Bucket
+from app.database.core.storage import get_storage
+from app.services.ai.config import ai_settings
+from app.services.ai.prompt_builder import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# limit name: seconds over which it refills
+WINDOWS = {"rpm": 60.0, "rpd": 86400.0, "tpm": 60.0}
+
+
+class RateLimited(Exception):
+    """The provider's quota would not allow the call before the queue timeout, or its queue is full."""
+
+
+def estimate_tokens(*parts) -> int:
+    """Rough count of the tokens a prompt made of `parts` (text or JSON-able values) takes."""
+    return sum(count_tokens(part if isinstance(part, str) else json.dumps(part, default=str)) for part in parts if part)
+
+
+def provider_limits(name: str) -> Dict[str, Optional[int]]:
+    """Configured requests per minute and per day and tokens per minute of a provider, None when unlimited."""
+    prefix = {"deepseek": "OPENROUTER"}.get(name, name.upper())
+    return {limit: getattr(ai_settings, f"{prefix}_{limit.upper()}", None) for limit in WINDOWS}
+
+
+class ProviderLimiter:
+    """
+    Keeps the calls of every worker to a provider within its quota.
+    Each limit is a token bucket in storage, shared by the workers, that
+    refills continuously over its window (a day's requests come back a few
+    at a time rather than all at midnight). A call takes one request from
+    each request bucket and its estimated prompt plus completion tokens from
+    the tokens bucket, all or nothing. A call over quota waits its turn, in
+    arrival order, until the buckets hold it again; it is refused when
+    `queue_size` calls are already waiting or it would still be waiting
+    after `timeout` seconds, so the manager can try the next provider.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rpm: Optional[int] = None,
+        rpd: Optional[int] = None,
+        tpm: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ):
+        self.name = name
+        self.limits = {limit: capacity for limit, capacity in {"rpm": rpm, "rpd": rpd, "tpm": tpm}.items() if capacity}
+        self.queue_size = ai_settings.AI_LIMIT_QUEUE_SIZE if queue_size is None else queue_size
+        self.timeout = ai_settings.AI_LIMIT_QUEUE_TIMEOUT if timeout is None else timeout
+        self.stats = {"admitted": 0, "waited": 0, "rejected": 0, "errors": 0}
+        # levels of the buckets after this worker's last take, for /status
+        self.remaining: Dict[str, float] = dict(self.limits)
+        self._waiting = 0
+        self._turn = asyncio.Lock()
+
+    @classmethod
+    def for_provider(cls, name: str) -> "ProviderLimiter":
+        return cls(name, **provider_limits(name))
+
+    @property
+    def storage(self):
+        return get_storage()
+
+    def _buckets(self, tokens: int) -> List[Bucket]:
+        buckets = []
+        for limit, capacity in self.limits.items():
+            # a call asking for more tokens than a minute holds would wait forever, it takes them all instead
+            cost = min(capacity, tokens) if limit == "tpm" else 1
+            # hash tag: the buckets of a provider live on one node and are taken from in one script
+            buckets.append(Bucket(f"helix:limits:{{{self.name}}}:{limit}", capacity, capacity / WINDOWS[limit], cost))
+        return buckets
+
+    async def acquire(self, tokens: int = 0):
+        """Wait until the call fits the provider's quota and take it, raises RateLimited if it does not in time."""
+        if not self.limits:
+            return
+        if self._waiting >= self.queue_size:
+            self._reject(f"{self._waiting} calls already waiting")
+        self._waiting += 1
+        deadline = time.monotonic() + self.timeout
+        try:
+            await asyncio.wait_for(self._take(self._buckets(tokens), deadline), self.timeout)
+        except asyncio.TimeoutError:
+            self._reject(f"no turn within {self.timeout}s")
+        finally:
+            self._waiting -= 1
+
+    async def _take(self, buckets: List[Bucket], deadline: float):
+        async with self._turn:
+            waited = False
+            while True:
+                try:
+                    wait, levels = await self.storage.take_tokens(buckets)
+                except Exception as e:
+                    # the quota cannot be checked, the provider answering is better than nobody answering
+                    self.stats["errors"] += 1
+                    logger.warning(f"⚠️ Could not check the {self.name} quota, letting the call through: {e}")
+                    return
+                self.remaining = {limit: level for limit, level in zip(self.limits, levels)}
+                if not wait:
+                    self.stats["admitted"] += 1
+                    self.stats["waited"] += waited
+                    return
+                if time.monotonic() + wait > deadline:
+                    # no use holding the queue up for a call that is refused anyway
+                    self._reject(f"quota back in {wait:.1f}s")
+                waited = True
+                await asyncio.sleep(wait)
+
+    def _reject(self, reason: str):
+        self.stats["rejected"] += 1
+        raise RateLimited(f"{self.name} rate limited: {reason}")
+
+    def get_stats(self) -> dict:
+        return {
+            "limits": self.limits,
+            "remaining": {limit: int(level) for limit, level in self.remaining.items()},
+            "queued": self._waiting,
+            **self.stats,
+        }
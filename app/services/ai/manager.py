@@ -1,57 +1,308 @@
+import asyncio
+import json
 import logging
+import time
+from collections import deque
+from typing import AsyncIterator, List, NamedTuple, Optional
 
-from app.services.ai.config import ai_settings
+from app.services.ai import prompt
+from app.services.ai.breaker import CircuitBreaker
+from app.services.ai.config import AIProvider, ai_settings
+from app.services.ai.hedging import HedgePolicy
+from app.services.ai.limiter import ProviderLimiter, RateLimited, estimate_tokens
+from app.services.ai.prompt_builder import count_prompt_tokens, prompt_budget
+from app.services.ai.providers.base import BaseAIProvider
 from app.services.ai.providers.deepseek import DeepSeekProvider
 from app.services.ai.providers.demo import DemoProvider
 from app.services.ai.providers.groq import GroqProvider
 from app.services.ai.providers.ollama import OllamaProvider
+from app.services.ai.templates import response_templates
 
 logger = logging.getLogger(__name__)
 
 
+class ProvidersUnavailable(Exception):
+    """Every provider of the chain failed or has its breaker open."""
+
+
+class ProviderFailed(Exception):
+    """A provider call failed, its breaker has been told."""
+
+
+class ChainLink(NamedTuple):
+    name: str
+    provider: object
+    breaker: CircuitBreaker
+    limiter: ProviderLimiter
+
+
 class AIManager:
     def __init__(self):
-        self.provider_name = ai_settings.AI_PROVIDER
-        self.provider = self._get_provider()
+        self.chain = self._build_chain()
+        self.hedging = HedgePolicy()
+        # the first provider of the chain, the one that answers while it is healthy
+        self.provider_name, self.provider = self.chain[0].name, self.chain[0].provider
+
+    def _chain_names(self) -> List[str]:
+        if ai_settings.AI_PROVIDER_CHAIN:
+            names = [name.strip().lower() for name in ai_settings.AI_PROVIDER_CHAIN.split(",") if name.strip()]
+        else:
+            names = [AIProvider(ai_settings.AI_PROVIDER).value]
+        if ai_settings.AI_AUTO_FALLBACK and AIProvider.DEMO.value not in names:
+            names.append(AIProvider.DEMO.value)
+        return list(dict.fromkeys(names))
 
-    def _get_provider(self):
+    def _build_chain(self) -> List[ChainLink]:
+        chain = []
+        for name in self._chain_names():
+            provider = self._get_provider(name)
+            if provider is not None:
+                chain.append(ChainLink(name, provider, CircuitBreaker(), ProviderLimiter.for_provider(name)))
+        if not chain:
+            demo = AIProvider.DEMO.value
+            chain.append(ChainLink(demo, DemoProvider(), CircuitBreaker(), ProviderLimiter.for_provider(demo)))
+        return chain
+
+    def _get_provider(self, name: str):
         try:
-            if self.provider_name == "deepseek":
+            if name == "deepseek":
                 if not ai_settings.OPENROUTER_API_KEY:
-                    logger.warning("DeepSeek key missing. Falling back to DEMO.")
-                    return DemoProvider()
+                    logger.warning("DeepSeek key missing. Skipping it.")
+                    return None
                 return DeepSeekProvider(api_key=ai_settings.OPENROUTER_API_KEY, model=ai_settings.OPENROUTER_MODEL)
 
-            elif self.provider_name == "ollama":
+            elif name == "ollama":
                 return OllamaProvider(host=ai_settings.OLLAMA_HOST, model=ai_settings.OLLAMA_MODEL)
 
-            elif self.provider_name == "groq":
+            elif name == "groq":
                 if not ai_settings.GROQ_API_KEY:
-                    logger.warning("Groq key missing. Falling back to DEMO.")
-                    return DemoProvider()
+                    logger.warning("Groq key missing. Skipping it.")
+                    return None
                 return GroqProvider(api_key=ai_settings.GROQ_API_KEY, model=ai_settings.GROQ_MODEL)
 
-            else:
+            elif name == "demo":
                 return DemoProvider()
 
+            logger.warning(f"⚠️ Unknown AI provider {name!r} in the provider chain")
+            return None
+
         except Exception as e:
-            logger.error(f"Failed to init provider {self.provider_name}: {e}")
-            return DemoProvider()
+            logger.error(f"Failed to init provider {name}: {e}")
+            return None
+
+    async def start(self):
+        """Open and warm each provider's pooled HTTP client. Called once from the app lifespan."""
+        for link in self.chain:
+            if isinstance(link.provider, BaseAIProvider) and not await link.provider.start():
+                # skip it from the first request on, it gets probed after the cooldown
+                link.breaker.trip()
+
+    async def close(self):
+        for link in self.chain:
+            if isinstance(link.provider, BaseAIProvider):
+                await link.provider.close()
 
     async def generate_response(
         self, method: str, path: str, body: dict = None, context: list = None, system_prompt: str = None
     ) -> dict:
-        return await self.provider.generate_response(method, path, body, context, system_prompt=system_prompt)
+        """
+        Generate with the first provider of the chain that works. Providers whose
+        breaker is open are skipped without being called, a failing one hands over
+        to the next at once, as does one still over its quota after the queue
+        timeout. With hedging on, a call slower than usual for its provider is
+        also sent to the next provider and the first answer wins. A route with a
+        learned template is answered from it without any provider call.
+        """
+        templated = await response_templates.respond(method, path, body, context)
+        if templated is not None:
+            return templated
+
+        remaining = deque(self.chain)
+        while remaining:
+            link = remaining.popleft()
+            if not link.breaker.allow():
+                continue
+            call = asyncio.ensure_future(self._call(link, method, path, body, context, system_prompt))
+            try:
+                delay = self.hedging.delay(link.name)
+                if delay is not None:
+                    await asyncio.wait((call,), timeout=delay)
+                    if not call.done():
+                        hedge = self._next_available(remaining)
+                        if hedge is not None:
+                            if self.hedging.admit():
+                                return await self._race(call, hedge, method, path, body, context, system_prompt)
+                            hedge.breaker.abandon()
+                            remaining.appendleft(hedge)
+                return await call
+            except (ProviderFailed, RateLimited):
+                continue
+            finally:
+                call.cancel()
+
+        raise ProvidersUnavailable(self._unavailable())
+
+    async def _race(self, call: asyncio.Future, hedge: ChainLink, *args) -> dict:
+        """First successful answer of the slow call and its hedge, the other one is cancelled."""
+        hedged = asyncio.ensure_future(self._call(hedge, *args))
+        pending = {call, hedged}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedged:
+                            self.hedging.stats["hedge_wins"] += 1
+                        return task.result()
+            raise ProviderFailed()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _call(self, link: ChainLink, method, path, body, context, system_prompt) -> dict:
+        await self._acquire(link, method, path, body, context, system_prompt)
+        started = time.monotonic()
+        try:
+            result = await link.provider.generate_response(method, path, body, context, system_prompt=system_prompt)
+        except Exception as e:
+            self._failed(link, e)
+            raise ProviderFailed() from e
+        except BaseException:
+            # cancelled, the other side of a hedge answered first or the client left: it took at least this long
+            self.hedging.record(link.name, time.monotonic() - started)
+            link.breaker.abandon()
+            raise
+        self.hedging.record(link.name, time.monotonic() - started)
+        link.breaker.record_success()
+        await self._learn(link, method, path, body, context, result)
+        return result
+
+    @staticmethod
+    async def _learn(link: ChainLink, method, path, body, context, result: dict):
+        # the demo provider's shapes are no better than the template's, and would stay once the model is back
+        if link.name != AIProvider.DEMO.value:
+            await response_templates.learn(method, path, body, context, result)
+
+    @staticmethod
+    async def _acquire(link: ChainLink, method, path, body, context, system_prompt):
+        """Wait for the provider's quota to allow the call, the breaker learns nothing from a call never made."""
+        # the user prompt is cut down to its budget, the completion may take up to AI_MAX_TOKENS
+        request_tokens = min(
+            estimate_tokens(context, method, path, body),
+            prompt_budget(link.name, getattr(link.provider, "model", None)),
+        )
+        # without an override the provider sends the shared system prompt
+        if system_prompt is None:
+            system_tokens = count_prompt_tokens(prompt.system_prompt.get())
+        else:
+            system_tokens = estimate_tokens(system_prompt)
+        tokens = system_tokens + request_tokens + ai_settings.AI_MAX_TOKENS
+        try:
+            await link.limiter.acquire(tokens)
+        except BaseException:
+            link.breaker.abandon()
+            raise
+
+    @staticmethod
+    def _next_available(remaining: deque) -> Optional[ChainLink]:
+        """Next provider a slow call may be hedged to, taken out of `remaining` with those whose breaker is open."""
+        for link in list(remaining):
+            # the demo provider answers at once, it would win every race it is hedged into with a canned response
+            if link.name == AIProvider.DEMO.value:
+                continue
+            remaining.remove(link)
+            if link.breaker.allow():
+                return link
+        return None
+
+    async def stream_response(
+        self, method: str, path: str, body: dict = None, context: list = None, system_prompt: str = None
+    ) -> AsyncIterator[str]:
+        """
+        Like generate_response, yielding the model's output as it is written. A provider
+        failing before its first token hands over to the next; once output has been
+        yielded there is no going back, the error is raised.
+        """
+        templated = await response_templates.respond(method, path, body, context)
+        if templated is not None:
+            yield json.dumps(templated)
+            return
+
+        for link in self.chain:
+            if not link.breaker.allow():
+                continue
+            try:
+                await self._acquire(link, method, path, body, context, system_prompt)
+            except RateLimited:
+                continue
+            started = False
+            try:
+                if isinstance(link.provider, BaseAIProvider):
+                    written = []
+                    async for text in link.provider.stream_response(
+                        method, path, body, context, system_prompt=system_prompt
+                    ):
+                        started = True
+                        written.append(text)
+                        yield text
+                else:
+                    response = await link.provider.generate_response(
+                        method, path, body, context, system_prompt=system_prompt
+                    )
+                    started = True
+                    yield json.dumps(response)
+            except Exception as e:
+                self._failed(link, e)
+                if started:
+                    raise
+                continue
+            except BaseException:
+                link.breaker.abandon()
+                raise
+            link.breaker.record_success()
+            if isinstance(link.provider, BaseAIProvider):
+                response = link.provider._validate_response(link.provider._parse_ai_response("".join(written)))
+            await self._learn(link, method, path, body, context, response)
+            return
+
+        raise ProvidersUnavailable(self._unavailable())
+
+    @staticmethod
+    def _failed(link: ChainLink, error: Exception):
+        link.breaker.record_failure(error)
+        logger.warning(f"⚠️ AI provider {link.name} failed ({link.breaker.state}): {error}")
+
+    def _unavailable(self) -> str:
+        states = ", ".join(f"{link.name}: {link.breaker.last_error or link.breaker.state}" for link in self.chain)
+        return f"No AI provider available ({states})"
+
+    @property
+    def streaming(self) -> bool:
+        """Whether misses are streamed to the client while the provider writes them."""
+        return ai_settings.AI_STREAMING and isinstance(self.provider, BaseAIProvider)
 
     def get_status(self) -> dict:
         """
         Returns the current status of the AI provider.
         Used by /health and /status endpoints.
         """
+        chain = [
+            {
+                "provider": link.name,
+                "model": getattr(link.provider, "model", "template-based"),
+                **link.breaker.get_stats(),
+                "quota": link.limiter.get_stats(),
+            }
+            for link in self.chain
+        ]
         return {
             "provider": self.provider_name,
             "model": getattr(self.provider, "model", "template-based"),
-            "status": "active",
+            "status": "active" if any(link["state"] != CircuitBreaker.OPEN for link in chain) else "down",
+            "streaming": self.streaming,
+            "chain": chain,
+            "hedging": self.hedging.get_stats(),
+            "templates": response_templates.get_stats(),
         }
 
 
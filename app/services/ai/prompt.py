@@ -0,0 +1,151 @@
+import asyncio
+import hashlib
+import logging
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+from app.database.backends import Batch
+from app.database.core.config import settings
+from app.database.core.storage import get_storage
+from app.services.ai.config import ai_settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROMPT = """You are MockPilot AI, an intelligent API mocking engine.
+Generate realistic JSON responses for API requests.
+
+Rules:
+1. Analyze the HTTP method and path
+2. Generate realistic data (use real names, emails, dates)
+3. Follow REST standards (GET -> array or object, POST -> 201, DELETE -> 204)
+4. Use data from request body when provided
+5. Keep responses consistent with context
+
+Output ONLY valid JSON in this format:
+{
+  "status_code": <int>,
+  "headers": {"Content-Type": "application/json"},
+  "body": <json_data>
+}"""
+
+
+class SystemPrompt:
+    """
+    The system prompt, read once and kept in memory.
+    The file is stat'ed at most once per check interval and read again only
+    when its mtime changes; reload_all() makes every worker read it again
+    through storage pub/sub. Each distinct prompt text has a short version
+    hash that generated responses are tagged with, see CacheService.purge.
+    """
+
+    def __init__(self, path: Optional[str] = None, check_interval: Optional[float] = None, clock=time.monotonic):
+        self.path = Path(path or ai_settings.AI_SYSTEM_PROMPT_FILE)
+        self.check_interval = ai_settings.AI_SYSTEM_PROMPT_CHECK_INTERVAL if check_interval is None else check_interval
+        self.clock = clock
+        self.channel = settings.PROMPT_RELOAD_CHANNEL
+        self.instance_id = uuid.uuid4().hex
+        self.stats = {"reloads": 0}
+        self._text: Optional[str] = None
+        self._version: Optional[str] = None
+        self._mtime: Optional[int] = None
+        self._checked_at = 0.0
+        self._listener: Optional[asyncio.Task] = None
+
+    @property
+    def storage(self):
+        return get_storage()
+
+    def get(self) -> str:
+        """The current prompt text, re-read only if the file changed since the last check."""
+        now = self.clock()
+        if self._text is None or now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            self._refresh()
+        return self._text
+
+    @property
+    def version(self) -> str:
+        self.get()
+        return self._version
+
+    def reload(self) -> str:
+        """Read the file again whatever its mtime, returns the previous version."""
+        previous = self._version
+        self._checked_at = self.clock()
+        self._refresh(force=True)
+        return previous
+
+    def _refresh(self, force: bool = False):
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except OSError:
+            mtime = None
+        if not force and self._text is not None and mtime == self._mtime:
+            return
+
+        text = DEFAULT_PROMPT
+        if mtime is not None:
+            try:
+                text = self.path.read_text(encoding="utf-8")
+            except OSError as e:
+                if self._text is not None:
+                    logger.warning(f"⚠️ Could not read system prompt {self.path}, keeping the loaded one: {e}")
+                    return
+                logger.warning(f"⚠️ Could not read system prompt {self.path}, using the built-in one: {e}")
+
+        previous = self._version
+        self._text, self._mtime = text, mtime
+        self._version = hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+        if previous is not None and previous != self._version:
+            self.stats["reloads"] += 1
+            logger.info(f"System prompt reloaded, version {previous} -> {self._version}")
+
+    async def reload_all(self) -> str:
+        """Reload here and tell every other worker to reload, returns the previous version."""
+        previous = self.reload()
+        batch = Batch()
+        batch.publish(self.channel, f"{self.instance_id}:{self._version}")
+        try:
+            await self.storage.apply(batch)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not publish the system prompt reload: {e}")
+        return previous
+
+    async def start(self):
+        """Load the prompt and start listening for reloads requested on other workers."""
+        self.get()
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    async def _listen(self):
+        while True:
+            try:
+                async for message in self.storage.listen(self.channel):
+                    origin, _, _ = message.partition(":")
+                    if origin != self.instance_id:
+                        self.reload()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ System prompt reload channel lost: {e}")
+
+            # a reload may have been missed while disconnected
+            self.reload()
+            await asyncio.sleep(1)
+
+    def get_stats(self) -> dict:
+        return {"file": str(self.path), "version": self.version, "bytes": len(self._text), **self.stats}
+
+
+system_prompt = SystemPrompt()
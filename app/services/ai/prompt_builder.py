@@ -0,0 +1,174 @@
+"""
+User prompts that fit a token budget.
+The request body is written as compact JSON with oversized strings and
+lists cut down, tighter and tighter until it fits its share of the budget.
+Session context entries are picked by relevance to the request (same
+resource, same ids, writes first) rather than by recency alone, and as many
+of them are written, with a summary of their response, as the rest of the
+budget holds. Token counts come from an approximate local tokenizer.
+"""
+
+import json
+import re
+from functools import lru_cache
+from typing import List, Optional, Set
+
+from app.services.ai.config import ai_settings
+from app.services.analyzer import WRITE_METHODS, request_analyzer
+
+# words, digit groups, other symbols one by one and line breaks; spaces ride along with the next word
+TOKEN_PATTERN = re.compile(r"[A-Za-z]+|\d{1,3}|\n\s*|[^\sA-Za-z\d]")
+# share of the budget the request body may take when there is context to write
+BODY_SHARE = 0.6
+# limits of the first pass over a request body, halved while it does not fit
+MAX_STRING_CHARS = 500
+MAX_LIST_ITEMS = 20
+MAX_DEPTH = 6
+# a context entry's response is only summarized
+CONTEXT_STRING_CHARS = 60
+CONTEXT_LIST_ITEMS = 3
+CONTEXT_DEPTH = 3
+
+
+def count_tokens(text: str) -> int:
+    """Approximate number of tokens of `text` for a BPE tokenizer, without loading one."""
+    count = 0
+    for piece in TOKEN_PATTERN.findall(text):
+        # long words split into several tokens
+        count += 1 + len(piece) // 8 if piece[0].isalpha() else 1
+    return count
+
+
+@lru_cache(maxsize=8)
+def count_prompt_tokens(text: str) -> int:
+    """count_tokens of a text sent with every request, such as the system prompt."""
+    return count_tokens(text)
+
+
+def prompt_budget(provider: str, model: Optional[str] = None) -> int:
+    """Token budget of the user prompt for a provider and model, see AI_PROMPT_TOKEN_BUDGETS."""
+    budgets = {}
+    for item in (ai_settings.AI_PROMPT_TOKEN_BUDGETS or "").split(","):
+        name, _, tokens = item.rpartition("=")
+        if name.strip() and tokens.strip().isdigit():
+            budgets[name.strip().lower()] = int(tokens)
+    return budgets.get(f"{provider}:{model}".lower(), budgets.get(provider, ai_settings.AI_PROMPT_TOKEN_BUDGET))
+
+
+def shrink(value, max_string: int, max_items: int, max_depth: int, depth: int = 0):
+    """`value` with long strings and lists cut and objects deeper than `max_depth` summarized."""
+    if isinstance(value, str) and len(value) > max_string:
+        return f"{value[:max_string]}...(+{len(value) - max_string} chars)"
+    if isinstance(value, list):
+        items = [shrink(item, max_string, max_items, max_depth, depth + 1) for item in value[:max_items]]
+        if len(value) > max_items:
+            items.append(f"...(+{len(value) - max_items} items)")
+        return items
+    if isinstance(value, dict):
+        if depth >= max_depth:
+            return f"{{{len(value)} fields: {', '.join(list(value)[:5])}}}"
+        return {key: shrink(item, max_string, max_items, max_depth, depth + 1) for key, item in value.items()}
+    return value
+
+
+def compact(value) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def encode(value, budget: int) -> str:
+    """Compact JSON of `value` cut down until it takes at most `budget` tokens."""
+    max_string, max_items, max_depth = MAX_STRING_CHARS, MAX_LIST_ITEMS, MAX_DEPTH
+    text = compact(shrink(value, max_string, max_items, max_depth))
+    while count_tokens(text) > budget and max_string > 8:
+        max_string, max_items, max_depth = max_string // 2, max(1, max_items // 2), max(1, max_depth - 1)
+        text = compact(shrink(value, max_string, max_items, max_depth))
+    return text
+
+
+class PromptBuilder:
+    def build(
+        self,
+        method: str,
+        path: str,
+        body: Optional[dict] = None,
+        context: Optional[list] = None,
+        budget: Optional[int] = None,
+    ) -> str:
+        """User prompt of a request, within `budget` tokens where the request line itself allows."""
+        budget = ai_settings.AI_PROMPT_TOKEN_BUDGET if budget is None else budget
+        head = f"Method: {method}\n\nPath: {path}"
+        tail = "\nGenerate appropriate JSON response:"
+        # a line break token joins each part to the one before
+        left = budget - count_tokens(head) - count_tokens(tail) - 1
+        parts = [head]
+
+        if body:
+            heading = "Request Body:\n"
+            body_budget = int(left * BODY_SHARE) if context else left
+            text = heading + encode(body, max(body_budget - count_tokens(heading) - 1, 0))
+            parts.append(text)
+            left -= count_tokens(text) + 1
+
+        if context:
+            lines = self._context_lines(path, context, left)
+            if lines:
+                parts.append("Context:\n" + "\n".join(lines))
+
+        parts.append(tail)
+        return "\n\n".join(parts)
+
+    def _context_lines(self, path: str, context: list, budget: int) -> List[str]:
+        """Lines of the most relevant context entries that fit `budget`, oldest first."""
+        resource = request_analyzer.extract_resource(path)
+        ids = self._ids(path, None)
+        ranked = sorted(
+            range(len(context)), key=lambda i: (self._relevance(context[i], resource, ids), i), reverse=True
+        )
+
+        chosen = {}
+        budget -= count_tokens("Context:\n") + 1
+        for index in ranked:
+            for line in self._entry_lines(context[index]):
+                tokens = count_tokens(line) + 1
+                if tokens <= budget:
+                    chosen[index] = line
+                    budget -= tokens
+                    break
+        return [chosen[index] for index in sorted(chosen)]
+
+    def _relevance(self, entry: dict, resource: str, ids: Set[str]) -> int:
+        entry_path = entry.get("path", "")
+        score = 0
+        if request_analyzer.extract_resource(entry_path) == resource:
+            score += 2
+        if ids & self._ids(entry_path, entry.get("response")):
+            score += 3
+        if entry.get("method") in WRITE_METHODS:
+            score += 1
+        return score
+
+    @staticmethod
+    def _ids(path: str, response: Optional[dict]) -> Set[str]:
+        ids = set(request_analyzer.path_ids(path))
+        body = response.get("body") if isinstance(response, dict) else None
+        if isinstance(body, dict) and body.get("id") is not None:
+            ids.add(str(body["id"]))
+        return ids
+
+    @staticmethod
+    def _entry_lines(entry: dict) -> List[str]:
+        """The entry with a summary of its bodies, then without them, for when the first does not fit."""
+        line = f"- {entry.get('method')} {entry.get('path')}"
+        response = entry.get("response") if isinstance(entry.get("response"), dict) else {}
+        details = []
+        if entry.get("body"):
+            details.append(
+                "body=" + compact(shrink(entry["body"], CONTEXT_STRING_CHARS, CONTEXT_LIST_ITEMS, CONTEXT_DEPTH))
+            )
+        if response.get("body"):
+            summary = shrink(response["body"], CONTEXT_STRING_CHARS, CONTEXT_LIST_ITEMS, CONTEXT_DEPTH)
+            details.append(f"-> {response.get('status_code', 200)} {compact(summary)}")
+        return [f"{line} {' '.join(details)}", line] if details else [line]
+
+
+prompt_builder = PromptBuilder()
@@ -4,9 +4,23 @@ All AI providers must inherit from this class
 """
 
 import json
+import logging
 import re
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Optional
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import httpx
+
+from ..config import ai_settings
+from ..prompt import system_prompt
+from ..prompt_builder import count_prompt_tokens, count_tokens, prompt_budget, prompt_builder
+
+try:
+    import h2  # noqa: F401
+except ImportError:  # optional, HTTP/1.1 keep-alive is always available
+    h2 = None
+
+logger = logging.getLogger(__name__)
 
 
 class BaseAIProvider(ABC):
@@ -15,6 +29,55 @@ class BaseAIProvider(ABC):
     Defines the interface that all providers must implement
     """
 
+    # provider name of AI_PROMPT_TOKEN_BUDGETS
+    name: str = "ai"
+    model: Optional[str] = None
+    _client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """
+        Pooled client shared by every request to the provider, so requests
+        reuse open (TLS) connections instead of handshaking each time
+        """
+        # outside of the app lifespan (CLI, scripts) the client is created on first use
+        if self._client is None or self._client.is_closed:
+            self._client = self._create_client()
+        return self._client
+
+    def _create_client(self) -> httpx.AsyncClient:
+        http2 = ai_settings.AI_HTTP2
+        if http2 and h2 is None:
+            logger.warning("⚠️ h2 is not installed, AI provider requests use HTTP/1.1")
+            http2 = False
+        return httpx.AsyncClient(
+            timeout=ai_settings.AI_TIMEOUT,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=ai_settings.AI_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=ai_settings.AI_HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=ai_settings.AI_HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+
+    async def start(self) -> bool:
+        """
+        Open the pooled client and its first connection. Called once from the app lifespan
+        """
+        if await self.check_health():
+            logger.info(f"{type(self).__name__} connection ready")
+            return True
+        logger.warning(f"⚠️ {type(self).__name__} is not reachable yet")
+        return False
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+        self._client = None
+
+    async def check_health(self) -> bool:
+        return True
+
     @abstractmethod
     async def generate_response(
         self,
@@ -38,52 +101,68 @@ class BaseAIProvider(ABC):
         """
         pass
 
+    async def stream_response(
+        self,
+        method: str,
+        path: str,
+        body: Optional[Dict] = None,
+        context: Optional[list] = None,
+        system_prompt: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Generate the same response as generate_response, yielding the model's
+        output text as it is written. Providers that cannot stream yield the
+        whole envelope at once.
+        """
+        yield json.dumps(await self.generate_response(method, path, body, context, system_prompt=system_prompt))
+
+    async def _stream_chat_completion(self, url: str, headers: Dict[str, str], payload: Dict) -> AsyncIterator[str]:
+        """
+        Content deltas of an OpenAI-compatible chat completion requested with stream=true
+        """
+        async with self.client.stream(
+            "POST", url, headers=headers, json={**payload, "stream": True}, timeout=self.timeout
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or [{}]
+                content = choices[0].get("delta", {}).get("content")
+                if content:
+                    yield content
+
     def _get_system_prompt(self) -> str:
         """
-        Load system prompt from assets/AI/MOCKPILOT_SYSTEM.md
-        """
-        try:
-            with open("assets/AI/MOCKPILOT_SYSTEM.md", "r", encoding="utf-8") as f:
-                return f.read()
-        except FileNotFoundError:
-            return """You are MockPilot AI, an intelligent API mocking engine.
-Generate realistic JSON responses for API requests.
-
-Rules:
-1. Analyze the HTTP method and path
-2. Generate realistic data (use real names, emails, dates)
-3. Follow REST standards (GET -> array or object, POST -> 201, DELETE -> 204)
-4. Use data from request body when provided
-5. Keep responses consistent with context
-
-Output ONLY valid JSON in this format:
-{
-  "status_code": <int>,
-  "headers": {"Content-Type": "application/json"},
-  "body": <json_data>
-}"""
+        System prompt from AI_SYSTEM_PROMPT_FILE, cached in memory until the file changes
+        """
+        return system_prompt.get()
 
     def _build_user_prompt(
         self, method: str, path: str, body: Optional[Dict] = None, context: Optional[list] = None
     ) -> str:
         """
-        Build user prompt with request details
+        Build user prompt with request details, within the provider's and model's token budget
         """
-        prompt_parts = [
-            f"Method: {method}",
-            f"Path: {path}",
-        ]
-
-        if body:
-            prompt_parts.append(f"Request Body:\n{json.dumps(body, indent=2)}")
-
-        if context and len(context) > 0:
-            context_str = "\n".join([f"- {req.get('method')} {req.get('path')}" for req in context[-5:]])
-            prompt_parts.append(f"Recent Context:\n{context_str}")
+        return prompt_builder.build(method, path, body, context, budget=prompt_budget(self.name, self.model))
 
-        prompt_parts.append("\nGenerate appropriate JSON response:")
-
-        return "\n\n".join(prompt_parts)
+    def _prompts(
+        self, method: str, path: str, body: Optional[Dict], context: Optional[list], system_prompt: Optional[str]
+    ) -> Tuple[str, str]:
+        """
+        System and user prompt of a request, their token counts logged
+        """
+        system = self._get_system_prompt() if system_prompt is None else system_prompt
+        user = self._build_user_prompt(method, path, body, context)
+        system_tokens, user_tokens = count_prompt_tokens(system), count_tokens(user)
+        logger.info(
+            f"{self.name} prompt for {method} {path}: {system_tokens + user_tokens} tokens "
+            f"(system {system_tokens}, request {user_tokens} of {prompt_budget(self.name, self.model)})"
+        )
+        return system, user
 
     def _parse_ai_response(self, text: str) -> Dict[str, Any]:
         """
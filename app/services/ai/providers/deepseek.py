@@ -5,7 +5,7 @@ Free tier: ~500 requests/day
 """
 
 import logging
-from typing import Any, Dict, Optional
+from typing import Any, AsyncIterator, Dict, Optional
 
 import httpx
 
@@ -25,6 +25,8 @@ class DeepSeekProvider(BaseAIProvider):
     3. Set HELIX_OPENROUTER_API_KEY in .env
     """
 
+    name = "deepseek"
+
     def __init__(self, api_key: str, model: str = "deepseek/deepseek-chat"):
         self.api_key = api_key
         self.model = model
@@ -43,42 +45,21 @@ class DeepSeekProvider(BaseAIProvider):
         Generate response using DeepSeek via OpenRouter
         """
         try:
-            if system_prompt is None:
-                sys_prompt_content = self._get_system_prompt()
-            else:
-                sys_prompt_content = system_prompt
-
-            user_prompt = self._build_user_prompt(method, path, body, context)
-
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json",
-                        "HTTP-Referer": "https://github.com/helix",
-                        "X-Title": "Helix Mock Server",
-                    },
-                    json={
-                        "model": self.model,
-                        "messages": [
-                            {"role": "system", "content": sys_prompt_content},
-                            {"role": "user", "content": user_prompt},
-                        ],
-                        "temperature": ai_settings.AI_TEMPERATURE,
-                        "max_tokens": ai_settings.AI_MAX_TOKENS,
-                        "response_format": {"type": "json_object"},
-                    },
-                )
-
-                response.raise_for_status()
-                data = response.json()
-
-                ai_text = data["choices"][0]["message"]["content"]
-
-                parsed = self._parse_ai_response(ai_text)
-
-                return self._validate_response(parsed)
+            response = await self.client.post(
+                f"{self.base_url}/chat/completions",
+                timeout=self.timeout,
+                headers=self._headers(),
+                json=self._payload(method, path, body, context, system_prompt),
+            )
+
+            response.raise_for_status()
+            data = response.json()
+
+            ai_text = data["choices"][0]["message"]["content"]
+
+            parsed = self._parse_ai_response(ai_text)
+
+            return self._validate_response(parsed)
 
         except httpx.HTTPStatusError as e:
             logger.error(f"OpenRouter API error: {e.response.status_code} - {e.response.text}")
@@ -92,6 +73,45 @@ class DeepSeekProvider(BaseAIProvider):
             logger.error(f"DeepSeek provider error: {str(e)}")
             raise
 
+    async def stream_response(
+        self,
+        method: str,
+        path: str,
+        body: Optional[Dict] = None,
+        context: Optional[list] = None,
+        system_prompt: str = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream the completion token by token
+        """
+        async for text in self._stream_chat_completion(
+            f"{self.base_url}/chat/completions",
+            self._headers(),
+            self._payload(method, path, body, context, system_prompt),
+        ):
+            yield text
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+            "HTTP-Referer": "https://github.com/helix",
+            "X-Title": "Helix Mock Server",
+        }
+
+    def _payload(self, method, path, body, context, system_prompt) -> Dict[str, Any]:
+        system, user = self._prompts(method, path, body, context, system_prompt)
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": system},
+                {"role": "user", "content": user},
+            ],
+            "temperature": ai_settings.AI_TEMPERATURE,
+            "max_tokens": ai_settings.AI_MAX_TOKENS,
+            "response_format": {"type": "json_object"},
+        }
+
     def _parse_ai_response(self, text: str) -> Dict[str, Any]:
         """
         Override parent method to handle OpenRouter-specific response format
@@ -108,11 +128,10 @@ class DeepSeekProvider(BaseAIProvider):
         Check if OpenRouter API is accessible
         """
         try:
-            async with httpx.AsyncClient(timeout=5) as client:
-                response = await client.get(
-                    f"{self.base_url}/models", headers={"Authorization": f"Bearer {self.api_key}"}
-                )
-                return response.status_code == 200
+            response = await self.client.get(
+                f"{self.base_url}/models", headers={"Authorization": f"Bearer {self.api_key}"}, timeout=5
+            )
+            return response.status_code == 200
         except Exception:
             return False
 
@@ -25,6 +25,9 @@ class DemoProvider:
         if body and body.get("task") == "generate_openapi_spec":
             return self._generate_openapi_spec(body.get("logs", []))
 
+        if body and body.get("task") == "generate_pool":
+            return self._generate_pool(body.get("resource") or self._extract_resource(path), body.get("count", 20))
+
         resource = self._extract_resource(path)
 
         if method == "GET":
@@ -158,6 +161,10 @@ class DemoProvider:
             "body": {resource: items, "total": len(items), "page": 1, "per_page": 10, "has_more": False},
         }
 
+    def _generate_pool(self, resource: str, count: int) -> Dict:
+        items = [self._generate_item(resource, self.fake.uuid4()[:8]) for _ in range(count)]
+        return {"status_code": 200, "headers": {"Content-Type": "application/json"}, "body": {resource: items}}
+
     def _generate_single(self, resource: str, path: str, context: Optional[list] = None) -> Dict:
         item_id = path.strip("/").split("/")[-1]
 
@@ -5,7 +5,7 @@ Free tier: 14,400 requests/day
 """
 
 import logging
-from typing import Any, Dict, Optional
+from typing import Any, AsyncIterator, Dict, Optional
 
 import httpx
 
@@ -31,6 +31,8 @@ class GroqProvider(BaseAIProvider):
     - gemma2-9b-it
     """
 
+    name = "groq"
+
     def __init__(self, api_key: str, model: str = "llama-3.1-70b-versatile"):
         self.api_key = api_key
         self.model = model
@@ -49,40 +51,24 @@ class GroqProvider(BaseAIProvider):
         Generate response using Groq's fast inference
         """
         try:
-            if system_prompt is None:
-                sys_prompt_content = self._get_system_prompt()
-            else:
-                sys_prompt_content = system_prompt
-
-            user_prompt = self._build_user_prompt(method, path, body, context)
-
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    headers={"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"},
-                    json={
-                        "model": self.model,
-                        "messages": [
-                            {"role": "system", "content": sys_prompt_content},
-                            {"role": "user", "content": user_prompt},
-                        ],
-                        "temperature": ai_settings.AI_TEMPERATURE,
-                        "max_tokens": ai_settings.AI_MAX_TOKENS,
-                        "response_format": {"type": "json_object"},  # Force JSON output
-                    },
-                )
-
-                response.raise_for_status()
-                data = response.json()
-
-                # Extract AI response text
-                ai_text = data["choices"][0]["message"]["content"]
-
-                # Parse JSON from response
-                parsed = self._parse_ai_response(ai_text)
-
-                # Validate and return
-                return self._validate_response(parsed)
+            response = await self.client.post(
+                f"{self.base_url}/chat/completions",
+                timeout=self.timeout,
+                headers=self._headers(),
+                json=self._payload(method, path, body, context, system_prompt),
+            )
+
+            response.raise_for_status()
+            data = response.json()
+
+            # Extract AI response text
+            ai_text = data["choices"][0]["message"]["content"]
+
+            # Parse JSON from response
+            parsed = self._parse_ai_response(ai_text)
+
+            # Validate and return
+            return self._validate_response(parsed)
 
         except httpx.HTTPStatusError as e:
             logger.error(f"Groq API error: {e.response.status_code} - {e.response.text}")
@@ -105,6 +91,40 @@ class GroqProvider(BaseAIProvider):
             logger.error(f"Groq provider error: {str(e)}")
             raise
 
+    async def stream_response(
+        self,
+        method: str,
+        path: str,
+        body: Optional[Dict] = None,
+        context: Optional[list] = None,
+        system_prompt: str = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream the completion token by token
+        """
+        async for text in self._stream_chat_completion(
+            f"{self.base_url}/chat/completions",
+            self._headers(),
+            self._payload(method, path, body, context, system_prompt),
+        ):
+            yield text
+
+    def _headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+
+    def _payload(self, method, path, body, context, system_prompt) -> Dict[str, Any]:
+        system, user = self._prompts(method, path, body, context, system_prompt)
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": system},
+                {"role": "user", "content": user},
+            ],
+            "temperature": ai_settings.AI_TEMPERATURE,
+            "max_tokens": ai_settings.AI_MAX_TOKENS,
+            "response_format": {"type": "json_object"},  # Force JSON output
+        }
+
     def _parse_ai_response(self, text: str) -> Dict[str, Any]:
         """
         Override parent method to handle Groq-specific response format
@@ -123,11 +143,10 @@ class GroqProvider(BaseAIProvider):
         Check if Groq API is accessible
         """
         try:
-            async with httpx.AsyncClient(timeout=5) as client:
-                response = await client.get(
-                    f"{self.base_url}/models", headers={"Authorization": f"Bearer {self.api_key}"}
-                )
-                return response.status_code == 200
+            response = await self.client.get(
+                f"{self.base_url}/models", headers={"Authorization": f"Bearer {self.api_key}"}, timeout=5
+            )
+            return response.status_code == 200
         except Exception:
             return False
 
@@ -136,17 +155,16 @@ class GroqProvider(BaseAIProvider):
         List available Groq models
         """
         try:
-            async with httpx.AsyncClient(timeout=5) as client:
-                response = await client.get(
-                    f"{self.base_url}/models", headers={"Authorization": f"Bearer {self.api_key}"}
-                )
-                response.raise_for_status()
-
-                models = response.json().get("data", [])
-                return [
-                    {"id": m.get("id"), "owned_by": m.get("owned_by"), "context_window": m.get("context_window")}
-                    for m in models
-                ]
+            response = await self.client.get(
+                f"{self.base_url}/models", headers={"Authorization": f"Bearer {self.api_key}"}, timeout=5
+            )
+            response.raise_for_status()
+
+            models = response.json().get("data", [])
+            return [
+                {"id": m.get("id"), "owned_by": m.get("owned_by"), "context_window": m.get("context_window")}
+                for m in models
+            ]
         except Exception:
             return []
 
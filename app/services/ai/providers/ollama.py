@@ -1,5 +1,6 @@
+import json
 import logging
-from typing import Any, Dict, Optional
+from typing import Any, AsyncIterator, Dict, Optional
 
 import httpx
 
@@ -14,6 +15,8 @@ class OllamaProvider(BaseAIProvider):
     Ollama provider for local AI models
     """
 
+    name = "ollama"
+
     def __init__(self, host: str = "http://localhost:11434", model: str = "llama3"):
         self.host = host.rstrip("/")
         self.model = model
@@ -31,38 +34,20 @@ class OllamaProvider(BaseAIProvider):
         Generate response using local Ollama model
         """
         try:
-            if system_prompt is None:
-                sys_prompt_content = self._get_system_prompt()
-            else:
-                sys_prompt_content = system_prompt
-
-            user_prompt = self._build_user_prompt(method, path, body, context)
-
-            full_prompt = f"{sys_prompt_content}\n\n{user_prompt}"
-
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.host}/api/generate",
-                    json={
-                        "model": self.model,
-                        "prompt": full_prompt,
-                        "stream": False,
-                        "options": {
-                            "temperature": ai_settings.AI_TEMPERATURE,
-                            "num_predict": ai_settings.AI_MAX_TOKENS,
-                        },
-                        "format": "json",
-                    },
-                )
+            response = await self.client.post(
+                f"{self.host}/api/generate",
+                timeout=self.timeout,
+                json=self._payload(method, path, body, context, system_prompt, stream=False),
+            )
 
-                response.raise_for_status()
-                data = response.json()
+            response.raise_for_status()
+            data = response.json()
 
-                ai_text = data.get("response", "")
+            ai_text = data.get("response", "")
 
-                parsed = self._parse_ai_response(ai_text)
+            parsed = self._parse_ai_response(ai_text)
 
-                return self._validate_response(parsed)
+            return self._validate_response(parsed)
 
         except httpx.ConnectError:
             logger.error(f"Cannot connect to Ollama at {self.host}")
@@ -85,21 +70,60 @@ class OllamaProvider(BaseAIProvider):
             logger.error(f"Ollama provider error: {str(e)}")
             raise
 
+    async def stream_response(
+        self,
+        method: str,
+        path: str,
+        body: Optional[Dict] = None,
+        context: Optional[list] = None,
+        system_prompt: str = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream the generation as Ollama writes it, one JSON line per chunk
+        """
+        async with self.client.stream(
+            "POST",
+            f"{self.host}/api/generate",
+            timeout=self.timeout,
+            json=self._payload(method, path, body, context, system_prompt, stream=True),
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line:
+                    data = json.loads(line)
+                    if data.get("response"):
+                        yield data["response"]
+                    if data.get("done"):
+                        break
+
+    def _payload(self, method, path, body, context, system_prompt, stream: bool) -> Dict[str, Any]:
+        sys_prompt_content, user_prompt = self._prompts(method, path, body, context, system_prompt)
+
+        return {
+            "model": self.model,
+            "prompt": f"{sys_prompt_content}\n\n{user_prompt}",
+            "stream": stream,
+            "options": {
+                "temperature": ai_settings.AI_TEMPERATURE,
+                "num_predict": ai_settings.AI_MAX_TOKENS,
+            },
+            "format": "json",
+        }
+
     async def check_health(self) -> bool:
         """
         Check if Ollama server is running and model is available
         """
         try:
-            async with httpx.AsyncClient(timeout=5) as client:
-                response = await client.get(f"{self.host}/api/tags")
-                if response.status_code != 200:
-                    return False
+            response = await self.client.get(f"{self.host}/api/tags", timeout=5)
+            if response.status_code != 200:
+                return False
 
-                models = response.json().get("models", [])
-                model_names = [m.get("name", "") for m in models]
+            models = response.json().get("models", [])
+            model_names = [m.get("name", "") for m in models]
 
-                model_base = self.model.split(":")[0]
-                return any(model_base in name for name in model_names)
+            model_base = self.model.split(":")[0]
+            return any(model_base in name for name in model_names)
 
         except Exception:
             return False
@@ -109,14 +133,11 @@ class OllamaProvider(BaseAIProvider):
         List available Ollama models
         """
         try:
-            async with httpx.AsyncClient(timeout=5) as client:
-                response = await client.get(f"{self.host}/api/tags")
-                response.raise_for_status()
-
-                models = response.json().get("models", [])
-                return [
-                    {"name": m.get("name"), "size": m.get("size"), "modified": m.get("modified_at")} for m in models
-                ]
+            response = await self.client.get(f"{self.host}/api/tags", timeout=5)
+            response.raise_for_status()
+
+            models = response.json().get("models", [])
+            return [{"name": m.get("name"), "size": m.get("size"), "modified": m.get("modified_at")} for m in models]
         except Exception:
             return []
 
@@ -139,8 +160,7 @@ class OllamaProvider(BaseAIProvider):
         Pull/download a model (if Ollama supports it via API)
         """
         try:
-            async with httpx.AsyncClient(timeout=300) as client:
-                response = await client.post(f"{self.host}/api/pull", json={"name": model_name})
-                return response.status_code == 200
+            response = await self.client.post(f"{self.host}/api/pull", json={"name": model_name}, timeout=300)
+            return response.status_code == 200
         except Exception:
             return False
@@ -0,0 +1,417 @@
+"""
+Response templates learned from the provider: generate once, fill locally.
+The first generated response of a route (GET /api/users/{id}) is reduced to
+a field-level template: the type of every value, its format (email, uuid,
+ISO date, url...), the values seen for enum-like fields and the ranges of
+numbers and list lengths. Later requests for the route are answered by
+filling the template with Faker, in about a millisecond and without a
+provider call. Templates are kept in storage, shared by the workers, tagged
+with the system prompt version they were learned under, and versioned by a
+hash of their content; invalidate() deletes them everywhere.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from faker import Faker
+
+from app.database.backends import Batch
+from app.database.core.config import settings
+from app.database.core.storage import get_storage
+from app.services.ai.config import ai_settings
+from app.services.ai.prompt import system_prompt
+from app.services.analyzer import request_analyzer
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_PREFIX = "helix:templates:"
+TEMPLATE_TAG = "template"
+# templates kept in process, least recently used dropped first, until they expire in storage
+MAX_LOCAL_TEMPLATES = 1024
+# an enum-like field seen with more distinct values than this is filled as free text
+MAX_ENUM_VALUES = 10
+
+FORMATS = [
+    ("uuid", re.compile(r"^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$")),
+    ("date-time", re.compile(r"^\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?(Z|[+-]\d{2}:?\d{2})?$")),
+    ("date", re.compile(r"^\d{4}-\d{2}-\d{2}$")),
+    ("email", re.compile(r"^[^@\s]+@[^@\s]+\.[A-Za-z]{2,}$")),
+    ("url", re.compile(r"^https?://\S+$")),
+    ("ipv4", re.compile(r"^(\d{1,3}\.){3}\d{1,3}$")),
+    ("phone", re.compile(r"^\+?[\d\s().-]{7,20}$")),
+]
+ENUM_LIKE = re.compile(r"^([a-z][a-z0-9_-]{0,23}|[A-Z][A-Z0-9_]{1,11})$")
+PERSON_NAME = re.compile(r"^[A-Z][a-z'.-]+( [A-Z][a-z'.-]+){1,2}$")
+
+# string fields filled by their name rather than by their example
+NAMED_FIELDS = {
+    "first_name": lambda fake, length: fake.first_name(),
+    "last_name": lambda fake, length: fake.last_name(),
+    "full_name": lambda fake, length: fake.name(),
+    "username": lambda fake, length: fake.user_name(),
+    "user_name": lambda fake, length: fake.user_name(),
+    "login": lambda fake, length: fake.user_name(),
+    "title": lambda fake, length: fake.sentence(nb_words=max(2, length // 8)).rstrip("."),
+    "description": lambda fake, length: fake.text(max_nb_chars=max(20, length)),
+    "content": lambda fake, length: fake.text(max_nb_chars=max(20, length)),
+    "text": lambda fake, length: fake.text(max_nb_chars=max(20, length)),
+    "body": lambda fake, length: fake.text(max_nb_chars=max(20, length)),
+    "bio": lambda fake, length: fake.text(max_nb_chars=max(20, length)),
+    "summary": lambda fake, length: fake.text(max_nb_chars=max(20, length)),
+    "company": lambda fake, length: fake.company(),
+    "company_name": lambda fake, length: fake.company(),
+    "address": lambda fake, length: fake.address().replace("\n", ", "),
+    "street": lambda fake, length: fake.street_address(),
+    "street_address": lambda fake, length: fake.street_address(),
+    "city": lambda fake, length: fake.city(),
+    "state": lambda fake, length: fake.state(),
+    "country": lambda fake, length: fake.country(),
+    "zip": lambda fake, length: fake.postcode(),
+    "zip_code": lambda fake, length: fake.postcode(),
+    "postal_code": lambda fake, length: fake.postcode(),
+    "slug": lambda fake, length: fake.slug(),
+    "sku": lambda fake, length: fake.bothify(text="???-########").upper(),
+    "color": lambda fake, length: fake.color_name(),
+}
+
+FORMAT_FILLERS = {
+    "uuid": lambda fake, node: fake.uuid4(),
+    "date-time": lambda fake, node: fake.iso8601() + node.get("suffix", ""),
+    "date": lambda fake, node: fake.date(),
+    "email": lambda fake, node: fake.email(),
+    "url": lambda fake, node: fake.image_url() if node.get("image") else fake.url(),
+    "ipv4": lambda fake, node: fake.ipv4(),
+    "phone": lambda fake, node: fake.phone_number(),
+}
+
+
+def infer(value, name: str = "") -> dict:
+    """Template of a JSON value; `name` is the field it was found under."""
+    if value is None:
+        return {"type": "null"}
+    if isinstance(value, bool):
+        return {"type": "boolean"}
+    if isinstance(value, int):
+        return {"type": "integer", "min": value, "max": value}
+    if isinstance(value, float):
+        decimals = len(repr(value).partition(".")[2]) if "e" not in repr(value) else 2
+        return {"type": "number", "min": value, "max": value, "decimals": min(decimals, 6)}
+    if isinstance(value, list):
+        items = None
+        for item in value:
+            items = infer(item, name) if items is None else merge(items, infer(item, name))
+        return {"type": "array", "items": items, "min_items": len(value), "max_items": len(value)}
+    if isinstance(value, dict):
+        return {"type": "object", "properties": {key: infer(item, key) for key, item in value.items()}}
+    return _infer_string(str(value), name.lower())
+
+
+def _infer_string(value: str, name: str) -> dict:
+    node = {"type": "string", "length": len(value)}
+    for fmt, pattern in FORMATS:
+        if pattern.match(value):
+            node["format"] = fmt
+            if fmt == "date-time" and value.endswith("Z"):
+                node["suffix"] = "Z"
+            if fmt == "url" and any(word in name for word in ("avatar", "image", "photo", "picture", "thumbnail")):
+                node["image"] = True
+            return node
+    if name in NAMED_FIELDS:
+        return node
+    if name.endswith("name") and PERSON_NAME.match(value):
+        node["person"] = True
+    elif ENUM_LIKE.match(value):
+        node["enum"] = [value]
+    elif any(char.isdigit() for char in value) and " " not in value:
+        # an identifier or code: keep its letters and separators, vary its digits
+        node["pattern"] = re.sub(r"\d", "#", value)
+    return node
+
+
+def merge(first: dict, second: dict) -> dict:
+    """Template covering the values of both templates."""
+    if first["type"] == "null":
+        return second
+    if first["type"] != second["type"] or second["type"] == "null":
+        return first
+    merged = dict(first)
+    kind = first["type"]
+    if kind in ("integer", "number"):
+        merged["min"], merged["max"] = min(first["min"], second["min"]), max(first["max"], second["max"])
+        if kind == "number":
+            merged["decimals"] = max(first["decimals"], second["decimals"])
+    elif kind == "string":
+        merged["length"] = max(first["length"], second["length"])
+        if "enum" in first:
+            values = list(dict.fromkeys(first["enum"] + second.get("enum", [])))
+            if "enum" not in second or len(values) > MAX_ENUM_VALUES:
+                merged.pop("enum")
+            else:
+                merged["enum"] = values
+    elif kind == "array":
+        merged["min_items"] = min(first["min_items"], second["min_items"])
+        merged["max_items"] = max(first["max_items"], second["max_items"])
+        if first["items"] is None or second["items"] is None:
+            merged["items"] = first["items"] or second["items"]
+        else:
+            merged["items"] = merge(first["items"], second["items"])
+    elif kind == "object":
+        properties = dict(first["properties"])
+        for key, node in second["properties"].items():
+            properties[key] = merge(properties[key], node) if key in properties else node
+        merged["properties"] = properties
+    return merged
+
+
+def fill(node: Optional[dict], fake: Faker, name: str = ""):
+    """A new value of the template."""
+    if node is None or node["type"] == "null":
+        return None
+    kind = node["type"]
+    if kind == "boolean":
+        return fake.boolean()
+    if kind == "integer":
+        low, high = node["min"], node["max"]
+        if low == high:
+            low, high = min(0, low), max(10, 2 * high)
+        return fake.random_int(min=low, max=high)
+    if kind == "number":
+        low, high = node["min"], node["max"]
+        if low == high:
+            low, high = min(0.0, low), max(10.0, 2 * high)
+        return round(fake.random.uniform(low, high), node["decimals"])
+    if kind == "array":
+        count = fake.random_int(min=node["min_items"], max=node["max_items"])
+        values = [fill(node["items"], fake, name) for _ in range(count)]
+        if node["items"] and node["items"]["type"] == "object":
+            if node["items"]["properties"].get("id", {}).get("type") == "integer":
+                # items of a collection keep distinct ids
+                start = fake.random_int(min=1, max=1000)
+                for offset, value in enumerate(values):
+                    value["id"] = start + offset
+        return values
+    if kind == "object":
+        return {key: fill(child, fake, key) for key, child in node["properties"].items()}
+    return _fill_string(node, fake, name.lower())
+
+
+def _fill_string(node: dict, fake: Faker, name: str) -> str:
+    if "format" in node:
+        return FORMAT_FILLERS[node["format"]](fake, node)
+    if "enum" in node:
+        return fake.random_element(node["enum"])
+    if name in NAMED_FIELDS:
+        return NAMED_FIELDS[name](fake, node["length"])
+    if node.get("person"):
+        return fake.name()
+    if "pattern" in node:
+        return fake.numerify(node["pattern"])
+    if node["length"] > 60:
+        return fake.text(max_nb_chars=node["length"])
+    if node["length"] > 20:
+        return fake.sentence(nb_words=max(3, node["length"] // 7))
+    return fake.word().capitalize()
+
+
+class ResponseTemplates:
+    """
+    Learned templates per route, kept in storage and cached in process.
+    Only GET requests are templated, and not for a session that wrote to
+    the route's collection: it should see its own changes, so it is still
+    answered by the provider.
+    """
+
+    def __init__(self, enabled: Optional[bool] = None):
+        self.enabled = ai_settings.AI_TEMPLATES if enabled is None else enabled
+        self.ttl = ai_settings.AI_TEMPLATE_TTL
+        self.channel = settings.TEMPLATE_INVALIDATION_CHANNEL
+        self.instance_id = uuid.uuid4().hex
+        self.fake = Faker()
+        self.stats = {"hits": 0, "learned": 0, "stale": 0, "invalidated": 0, "errors": 0}
+        # key -> (expires_at, template)
+        self._local: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        self._listener: Optional[asyncio.Task] = None
+
+    @property
+    def storage(self):
+        return get_storage()
+
+    @staticmethod
+    def key(method: str, path: str) -> str:
+        return f"{TEMPLATE_PREFIX}{method.upper()}:{request_analyzer.normalize_path(path)}"
+
+    def applies(self, method: str, path: str, body: Optional[dict], context: Optional[list]) -> bool:
+        if not self.enabled or method.upper() != "GET" or (isinstance(body, dict) and body.get("task")):
+            return False
+        collection = request_analyzer.collection_path(path)
+        return not request_analyzer.wrote_to(collection, context)
+
+    async def respond(self, method: str, path: str, body=None, context=None) -> Optional[dict]:
+        """The route's template filled with new values, None when the route has no template yet."""
+        if not self.applies(method, path, body, context):
+            return None
+        template = await self._get(self.key(method, path))
+        if template is None:
+            return None
+        if template["prompt"] != system_prompt.version:
+            # learned under another system prompt, the next generation replaces it
+            self.stats["stale"] += 1
+            return None
+
+        response_body = fill(template["body"], self.fake)
+        if isinstance(response_body, dict) and "id" in response_body and not request_analyzer.is_collection(path):
+            item_id = path.rstrip("/").rpartition("/")[2]
+            response_body["id"] = (
+                int(item_id) if isinstance(response_body["id"], int) and item_id.isdigit() else item_id
+            )
+        self.stats["hits"] += 1
+        return {"status_code": template["status_code"], "headers": dict(template["headers"]), "body": response_body}
+
+    async def learn(self, method: str, path: str, body, context, response: dict):
+        """Keep the template of a generated response, for the requests of its route that follow."""
+        if not self.applies(method, path, body, context):
+            return
+        status_code = response.get("status_code", 200)
+        if not isinstance(status_code, int) or not 200 <= status_code < 300:
+            return
+        if not isinstance(response.get("body"), (dict, list)):
+            return
+
+        template = {
+            "route": request_analyzer.normalize_path(path),
+            "status_code": status_code,
+            "headers": response.get("headers") or {},
+            "body": infer(response["body"]),
+        }
+        template["version"] = hashlib.sha256(json.dumps(template, sort_keys=True).encode()).hexdigest()[:12]
+        template["prompt"] = system_prompt.version
+        template["learned_at"] = time.time()
+
+        key = self.key(method, path)
+        self._keep(key, template)
+        batch = Batch()
+        batch.set(key, json.dumps(template).encode("utf-8"), ttl=self.ttl)
+        batch.tag(key, [TEMPLATE_TAG, f"prompt:{template['prompt']}"], ttl=self.ttl)
+        try:
+            await self.storage.apply(batch, atomic=True)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"⚠️ Could not store the response template of {template['route']}: {e}")
+            return
+        self.stats["learned"] += 1
+
+    async def _get(self, key: str) -> Optional[dict]:
+        entry = self._local.get(key)
+        if entry is not None:
+            if entry[0] > time.time():
+                self._local.move_to_end(key)
+                return entry[1]
+            # gone from storage as well, the route is generated and learned again
+            del self._local[key]
+        try:
+            data = await self.storage.get(key)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"⚠️ Could not read response template {key}: {e}")
+            return None
+        if not data:
+            return None
+        template = json.loads(data)
+        if template["learned_at"] + self.ttl <= time.time():
+            return None
+        self._keep(key, template)
+        return template
+
+    def _keep(self, key: str, template: dict):
+        """Keep the template in process until it expires in storage, AI_TEMPLATE_TTL seconds after it was learned."""
+        self._local[key] = (template["learned_at"] + self.ttl, template)
+        self._local.move_to_end(key)
+        while len(self._local) > MAX_LOCAL_TEMPLATES:
+            self._local.popitem(last=False)
+
+    async def list(self) -> List[dict]:
+        """Stored templates, without their field trees."""
+        templates = []
+        for key in sorted(await self.storage.tagged([TEMPLATE_TAG])):
+            data = await self.storage.get(key)
+            if data:
+                template = json.loads(data)
+                method = key[len(TEMPLATE_PREFIX) :].partition(":")[0]
+                templates.append(
+                    {
+                        "method": method,
+                        **{field: template[field] for field in ("route", "version", "prompt", "learned_at")},
+                    }
+                )
+        return templates
+
+    async def invalidate(self, route: Optional[str] = None, method: Optional[str] = None) -> int:
+        """Delete the templates of a route (all routes when None) on every worker, returns how many."""
+        keys = await self.storage.tagged([TEMPLATE_TAG])
+        if route is not None:
+            route = request_analyzer.normalize_path(route)
+            keys = [key for key in keys if key[len(TEMPLATE_PREFIX) :].partition(":")[2] == route]
+        if method:
+            keys = [key for key in keys if key.startswith(f"{TEMPLATE_PREFIX}{method.upper()}:")]
+
+        batch = Batch()
+        for key in keys:
+            tags = [TEMPLATE_TAG]
+            # the prompt version it was learned under tags it too, read back from the template
+            data = await self.storage.get(key)
+            if data:
+                tags.append(f"prompt:{json.loads(data)['prompt']}")
+            batch.delete(key)
+            batch.untag(key, tags)
+        batch.publish(self.channel, f"{self.instance_id}:{json.dumps(keys)}")
+        await self.storage.apply(batch, atomic=True)
+        self._forget(keys)
+        self.stats["invalidated"] += len(keys)
+        return len(keys)
+
+    def _forget(self, keys: List[str]):
+        for key in keys:
+            self._local.pop(key, None)
+
+    async def start(self):
+        """Start listening for templates invalidated on other workers."""
+        if self.enabled and self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    async def _listen(self):
+        while True:
+            try:
+                async for message in self.storage.listen(self.channel):
+                    origin, _, keys = message.partition(":")
+                    if origin != self.instance_id:
+                        self._forget(json.loads(keys))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ Response template invalidation channel lost: {e}")
+
+            # an invalidation may have been missed while disconnected
+            self._local.clear()
+            await asyncio.sleep(1)
+
+    def get_stats(self) -> dict:
+        return {"enabled": self.enabled, "local": len(self._local), **self.stats}
+
+
+response_templates = ResponseTemplates()
@@ -1,6 +1,8 @@
 import re
 from typing import Optional
 
+WRITE_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+
 
 class RequestAnalyzer:
     def __init__(self):
@@ -27,6 +29,28 @@ class RequestAnalyzer:
         last_segment = segments[-1]
         return not self._looks_like_id(last_segment)
 
+    def normalize_path(self, path: str) -> str:
+        """Route of a path, ids replaced: /api/users/123 -> /api/users/{id}."""
+        segments = [s for s in path.strip("/").split("/") if s]
+        return "/" + "/".join("{id}" if self._looks_like_id(segment) else segment for segment in segments)
+
+    def path_ids(self, path: str) -> list:
+        """Segments of a path that are ids."""
+        return [segment for segment in path.strip("/").split("/") if segment and self._looks_like_id(segment)]
+
+    def collection_path(self, path: str) -> str:
+        """Path of the collection a path lists or is an item of, without slashes around it."""
+        path = path.strip("/")
+        return path if self.is_collection(path) else path.rpartition("/")[0]
+
+    def wrote_to(self, collection: str, context: Optional[list]) -> bool:
+        """Whether a session with this context changed anything in the collection."""
+        return any(
+            entry.get("method") in WRITE_METHODS
+            and (entry.get("path", "").strip("/") + "/").startswith(collection + "/")
+            for entry in context or ()
+        )
+
     def get_operation_type(self, method: str, path: str) -> str:
         is_col = self.is_collection(path)
         method = method.upper()
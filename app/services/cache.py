@@ -1,39 +1,468 @@
-import hashlib
+import asyncio
 import json
 import logging
+import struct
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, NamedTuple, Optional, Sequence
 
-from app.database.core.connect import get_redis_connection
+from starlette.responses import Response
+
+from app.database.backends import Batch
+from app.database.core.config import settings
+from app.database.core.storage import get_storage
+from app.services.ai.prompt import system_prompt
+from app.services.cache_policy import CacheRule, cache_policy
 
 logger = logging.getLogger(__name__)
 
+# path prefixes indexed per response, deeper purges filter the deepest indexed prefix
+PATH_INDEX_DEPTH = 8
+# keys deleted per storage round trip when purging
+PURGE_CHUNK = 500
+
+
+class PreparedResponse(Response):
+    """
+    Response sent straight from pre-encoded status, headers and body.
+    Skips header normalization and body rendering done by regular responses.
+    """
+
+    def __init__(self, status_code: int, raw_headers: list, body: bytes):
+        self.status_code = status_code
+        self.raw_headers = raw_headers
+        self.body = body
+        self.background = None
+
+
+class CachedResponse:
+    """
+    Mock response stored as ready-to-send bytes.
+
+    Layout: MAGIC | status (u16) | created_at (f64) | headers length (u32) | headers | body
+    Headers are pre-lowercased `name: value` lines, content-length included.
+    """
+
+    MAGIC = b"HXR1"
+    HEADER = struct.Struct(">HdI")
+    NO_BODY_STATUSES = (204, 304)
+
+    __slots__ = ("status_code", "raw_headers", "body", "created_at")
+
+    def __init__(self, status_code: int, raw_headers: list, body: bytes, created_at: Optional[float] = None):
+        self.status_code = status_code
+        self.raw_headers = raw_headers
+        self.body = body
+        self.created_at = created_at if created_at is not None else time.time()
+
+    @classmethod
+    def from_data(cls, response_data: dict) -> "CachedResponse":
+        """Build from a provider result ({status_code, headers, body})."""
+        status_code = int(response_data.get("status_code", 200))
+
+        if status_code < 200 or status_code in cls.NO_BODY_STATUSES:
+            body = b""
+        else:
+            body = json.dumps(
+                response_data.get("body", {}), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+            ).encode("utf-8")
+
+        raw_headers = cls.encode_headers(response_data.get("headers"))
+        if body:
+            raw_headers.append((b"content-length", str(len(body)).encode()))
+        raw_headers.append((b"content-type", b"application/json"))
+
+        return cls(status_code, raw_headers, body)
+
+    @staticmethod
+    def encode_headers(headers: Optional[dict]) -> list:
+        """Provider headers as raw pairs, without the framing headers the response sets itself."""
+        raw_headers = []
+        for name, value in (headers or {}).items():
+            name = str(name).lower()
+            if name in ("content-length", "content-type", "transfer-encoding"):
+                continue
+            try:
+                raw_headers.append((name.encode("latin-1"), str(value).encode("latin-1")))
+            except UnicodeEncodeError:
+                logger.debug(f"Dropping non latin-1 header {name}")
+        return raw_headers
+
+    def encode(self) -> bytes:
+        headers = b"\r\n".join(name + b": " + value for name, value in self.raw_headers)
+        return self.MAGIC + self.HEADER.pack(self.status_code, self.created_at, len(headers)) + headers + self.body
+
+    @classmethod
+    def decode(cls, data: bytes) -> Optional["CachedResponse"]:
+        if not data.startswith(cls.MAGIC):
+            return None
+
+        offset = len(cls.MAGIC)
+        status_code, created_at, headers_len = cls.HEADER.unpack_from(data, offset)
+        offset += cls.HEADER.size
+        headers = data[offset : offset + headers_len]
+
+        raw_headers = [tuple(line.split(b": ", 1)) for line in headers.split(b"\r\n")] if headers else []
+        return cls(status_code, raw_headers, data[offset + headers_len :], created_at)
+
+    def to_response(self) -> PreparedResponse:
+        return PreparedResponse(self.status_code, self.raw_headers, self.body)
+
+
+class Lookup(NamedTuple):
+    cached: Optional["CachedResponse"]
+    locked: bool
+    context: list
+
+
+class LocalCache:
+    """
+    In-process LRU cache with per-entry TTL.
+    Bounded by the total serialized size of its entries, not by entry count.
+    """
+
+    def __init__(self, max_bytes: int, ttl: int):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self._entries: "OrderedDict[str, tuple[float, int, Any]]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, _, value = entry
+        if expires_at < time.monotonic():
+            self.delete(key)
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, size: int, ttl: Optional[float] = None):
+        self.delete(key)
+        if size > self.max_bytes:
+            return
+
+        ttl = min(ttl, self.ttl) if ttl else self.ttl
+        self._entries[key] = (time.monotonic() + ttl, size, value)
+        self.size += size
+
+        while self.size > self.max_bytes:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self.size -= evicted_size
+
+    def delete(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
 
 class CacheService:
     def __init__(self):
-        self.redis = get_redis_connection()
+        self.local = LocalCache(max_bytes=settings.CACHE_L1_MAX_BYTES, ttl=settings.CACHE_L1_TTL)
+        self.channel = settings.CACHE_INVALIDATION_CHANNEL
+        self.instance_id = uuid.uuid4().hex
+        self.stats = {"l1_hits": 0, "l2_hits": 0, "misses": 0}
+        self.swr_stats = {"stale_hits": 0, "revalidations": 0, "revalidation_errors": 0}
+        self._listener: Optional[asyncio.Task] = None
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+        self._revalidating: Dict[str, asyncio.Task] = {}
+
+    @property
+    def storage(self):
+        return get_storage()
+
+    def get_cache_key(
+        self,
+        session_id: str,
+        method: str,
+        path: str,
+        body: bytes = b"",
+        query: Optional[Mapping] = None,
+        headers: Optional[Mapping] = None,
+        rule: Optional[CacheRule] = None,
+    ):
+        rule = rule or cache_policy.match(method, path)
+        request_hash = rule.key.digest(body, query, headers)
+        # {session_id} is the hash tag the key is sharded by, see ShardedBackend
+        return f"{{{session_id}}}:{method}:{path}:{request_hash}"
+
+    @staticmethod
+    def index_tags(method: str, path: str) -> List[str]:
+        """Secondary index tags of a response: its method and each of its leading path segments."""
+        segments = path.strip("/").split("/")[:PATH_INDEX_DEPTH]
+        return [f"method:{method.upper()}"] + ["path:" + "/".join(segments[:i]) for i in range(1, len(segments) + 1)]
+
+    def key_tags(self, key: str) -> List[str]:
+        """
+        Tags a response cached under `key` is indexed by: those of its method and path,
+        and the current system prompt version's (entries under older ones expire with
+        their keys). None for keys that are not cached responses, such as a context.
+        """
+        session, _, rest = key.partition("}:")
+        method, _, rest = rest.partition(":")
+        path = rest.rpartition(":")[0]
+        if not session.startswith("{") or not method.isupper() or not path:
+            return []
+        return self.index_tags(method, path) + [f"prompt:{system_prompt.version}"]
+
+    def get_local(self, key: str) -> Optional[CachedResponse]:
+        value = self.local.get(key)
+        if value is not None:
+            self.stats["l1_hits"] += 1
+        return value
+
+    def _fill_local(self, key: str, data: Optional[bytes], ttl: Optional[int] = None) -> Optional[CachedResponse]:
+        """Decode a stored entry and keep it in L1, no longer than the `ttl` it was stored with has left."""
+        value = CachedResponse.decode(data) if data else None
+        if value is None:
+            self.stats["misses"] += 1
+            return None
 
-    def get_cache_key(self, session_id: str, method: str, path: str, body: dict = None):
-        body_hash = hashlib.md5(json.dumps(body or {}).encode()).hexdigest()
-        return f"{session_id}:{method}:{path}:{body_hash}"
+        self.stats["l2_hits"] += 1
+        left = value.created_at + ttl - time.time() if ttl else None
+        if left is None or left > 0:
+            self.local.set(key, value, len(data), left)
+        return value
+
+    async def get(self, key: str, ttl: Optional[int] = None) -> Optional[CachedResponse]:
+        """Response cached under `key`, from L1 or storage; `ttl` is the one it was stored with, when known."""
+        value = self.get_local(key)
+        if value is not None:
+            return value
 
-    async def get(self, key: str):
         try:
-            data = self.redis.get(key)
-            return json.loads(data) if data else None
+            data = await self.storage.get(key)
         except Exception as e:
-            logger.warning(f"⚠️ Redis is unavailable: {e}")
+            logger.warning(f"⚠️ Storage is unavailable: {e}")
             return None
 
-    async def set(self, key: str, value: dict, ttl: int = 86400):
+        return self._fill_local(key, data, ttl)
+
+    async def lookup(
+        self,
+        key: str,
+        lock_key: str,
+        lock_token: str,
+        context_key: str,
+        context_limit: int,
+        lock_ttl: int = settings.SINGLEFLIGHT_LOCK_TTL,
+        revalidate: bool = False,
+        ttl: Optional[int] = None,
+    ) -> Lookup:
+        """
+        Read the cached response from storage; on a miss also take the generation
+        lock (unless lock_token is empty) and read the session context, all in
+        one round trip. L1 is not consulted, callers check get_local() first.
+        A hit is kept in L1 until the `ttl` it was stored with runs out at the latest.
+        """
         try:
-            self.redis.setex(key, ttl, json.dumps(value))
+            result = await self.storage.lookup(
+                key,
+                lock_key,
+                lock_token,
+                lock_ttl,
+                context_key,
+                context_limit,
+                revalidate=revalidate,
+                magic=(CachedResponse.MAGIC,),
+            )
         except Exception as e:
-            logger.warning(f"⚠️ Could not write to Redis: {e}")
+            # generate without cache, lock or context, as if storage were empty
+            logger.warning(f"⚠️ Storage is unavailable: {e}")
+            return Lookup(None, True, [])
+
+        if result.cached is not None:
+            return Lookup(self._fill_local(key, result.cached, ttl), False, [])
+        if not revalidate:
+            self.stats["misses"] += 1
+        # entries in the old format are skipped by the lookup and overwritten by the caller
+        return Lookup(None, result.locked, result.context)
+
+    def queue_set(
+        self,
+        batch: Batch,
+        key: str,
+        value: CachedResponse,
+        ttl: int = settings.CACHE_DEFAULT_TTL,
+        tags: Sequence[str] = (),
+    ) -> int:
+        """Store `value` in L1 and add the shared write, tags and invalidation to `batch`; returns the stored size."""
+        data = value.encode()
+        self.local.set(key, value, len(data), ttl)
+        batch.set(key, data, ttl)
+        if tags:
+            batch.tag(key, tags, ttl)
+        batch.publish(self.channel, f"{self.instance_id}:{key}")
+        return len(data)
+
+    async def set(self, key: str, value: CachedResponse, ttl: int = settings.CACHE_DEFAULT_TTL):
+        batch = Batch()
+        self.queue_set(batch, key, value, ttl)
+        try:
+            await self.storage.apply(batch)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not write to storage: {e}")
 
     async def delete(self, key: str):
+        self.local.delete(key)
+        batch = Batch()
+        batch.delete(key)
+        batch.publish(self.channel, f"{self.instance_id}:{key}")
         try:
-            self.redis.delete(key)
+            await self.storage.apply(batch)
         except Exception:
             pass
 
+    async def purge(
+        self, path_prefix: Optional[str] = None, method: Optional[str] = None, prompt: Optional[str] = None
+    ) -> int:
+        """
+        Delete every cached response under `path_prefix` (whole segments), for `method`
+        and/or generated under the system prompt version `prompt`, matching all given.
+        Keys come from the secondary indexes, so the cost follows the number of keys deleted.
+        Each key leaves every index it is in; returns the number of keys that still existed.
+        """
+        tags = []
+        if method:
+            tags.append(f"method:{method.upper()}")
+        if path_prefix is not None:
+            segments = path_prefix.strip("/").split("/")
+            tags.append("path:" + "/".join(segments[:PATH_INDEX_DEPTH]))
+        if prompt:
+            tags.append(f"prompt:{prompt}")
+        if not tags:
+            raise ValueError("purge needs a path prefix, a method or a prompt version")
+
+        keys = await self.storage.tagged(tags)
+        if path_prefix is not None and len(segments) > PATH_INDEX_DEPTH:
+            prefix = "/".join(segments)
+            keys = [key for key in keys if f":{prefix}:" in key or f":{prefix}/" in key]
+
+        deleted = 0
+        for start in range(0, len(keys), PURGE_CHUNK):
+            batch = Batch()
+            for key in keys[start : start + PURGE_CHUNK]:
+                self.local.delete(key)
+                batch.delete(key)
+                batch.untag(key, list(dict.fromkeys(self.key_tags(key) + tags)))
+                batch.publish(self.channel, f"{self.instance_id}:{key}")
+            deleted += await self.storage.apply(batch)
+
+        logger.info(f"Purged {deleted} cached responses ({', '.join(tags)})")
+        return deleted
+
+    async def invalidate(self, keys: List[str]):
+        """Drop keys already deleted from storage from the indexes and from the L1 of every worker."""
+        batch = Batch()
+        for key in keys:
+            self.local.delete(key)
+            tags = self.key_tags(key)
+            if tags:
+                batch.untag(key, tags)
+            batch.publish(self.channel, f"{self.instance_id}:{key}")
+        if batch.ops:
+            try:
+                await self.storage.apply(batch)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not publish invalidations: {e}")
+
+    def revalidate(self, key: str, regenerate: Callable[[], Awaitable[Any]]):
+        """Regenerate a stale entry in the background, once per key at a time."""
+        self.swr_stats["stale_hits"] += 1
+        if key in self._revalidating:
+            return
+
+        task = asyncio.create_task(self._revalidate(key, regenerate))
+        self._revalidating[key] = task
+        task.add_done_callback(lambda _: self._revalidating.pop(key, None))
+
+    async def _revalidate(self, key: str, regenerate: Callable[[], Awaitable[Any]]):
+        self.swr_stats["revalidations"] += 1
+        try:
+            await regenerate()
+        except Exception as e:
+            # keep serving the stale copy until its hard TTL runs out
+            self.swr_stats["revalidation_errors"] += 1
+            logger.warning(f"⚠️ Background revalidation of {key} failed: {e}")
+
+    async def start(self):
+        """Start listening for invalidations published by other workers."""
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        for task in list(self._revalidating.values()):
+            task.cancel()
+
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        self.local.clear()
+
+    async def _listen(self):
+        while True:
+            try:
+                async for message in self.storage.listen(self.channel):
+                    origin, _, key = message.partition(":")
+                    if origin != self.instance_id:
+                        self.local.delete(key)
+                    self._notify_waiters(key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ Cache invalidation channel lost, dropping local cache: {e}")
+
+            # invalidations may have been missed while disconnected
+            self.local.clear()
+            await asyncio.sleep(1)
+
+    async def wait_for_write(self, key: str, timeout: float):
+        """Wait until any worker writes or deletes `key`, at most `timeout` seconds."""
+        future = asyncio.get_running_loop().create_future()
+        waiters = self._waiters.setdefault(key, [])
+        waiters.append(future)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            if future in waiters:
+                waiters.remove(future)
+            if not waiters and self._waiters.get(key) is waiters:
+                del self._waiters[key]
+
+    def _notify_waiters(self, key: str):
+        for future in self._waiters.pop(key, ()):
+            if not future.done():
+                future.set_result(None)
+
+    def get_stats(self) -> dict:
+        lookups = sum(self.stats.values())
+        l2_lookups = self.stats["l2_hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            **self.swr_stats,
+            "l1_hit_ratio": round(self.stats["l1_hits"] / lookups, 4) if lookups else 0.0,
+            "l2_hit_ratio": round(self.stats["l2_hits"] / l2_lookups, 4) if l2_lookups else 0.0,
+            "l1_entries": len(self.local),
+            "l1_bytes": self.local.size,
+            "l1_max_bytes": self.local.max_bytes,
+        }
+
 
 cache_service = CacheService()
@@ -0,0 +1,119 @@
+"""
+Declarative cache policy.
+Rules matched on method and path decide whether a response is cached,
+for how long, and which parts of the request make up its cache key.
+"""
+
+import fnmatch
+import hashlib
+import json
+import logging
+import re
+from pathlib import Path
+from typing import List, Literal, Mapping, Optional, Union
+
+import yaml
+from pydantic import BaseModel, Field, PrivateAttr
+
+from app.database.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CacheKeySpec(BaseModel):
+    """Request parts hashed into the cache key (session, method and path are always included)."""
+
+    query: Union[bool, List[str]] = Field(default=True, description="All query params, none, or listed names")
+    headers: List[str] = Field(default_factory=list, description="Header names to include")
+    body: Literal["raw", "canonical", "none"] = Field(default="canonical", description="Body hashing mode")
+
+    def digest(self, body: bytes = b"", query: Optional[Mapping] = None, headers: Optional[Mapping] = None) -> str:
+        """
+        Hash the selected request parts.
+        `canonical` decodes a JSON body and hashes it key-sorted, so key order and
+        spacing do not matter; requests without a body are not decoded. `raw` hashes
+        the body bytes as received, which saves that decode on hits for routes whose
+        clients always send the same bytes.
+        """
+        parts = [b""]
+
+        if self.body == "raw":
+            parts[0] = body
+        elif self.body == "canonical" and body:
+            try:
+                parts[0] = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode()
+            except ValueError:
+                parts[0] = body
+
+        if self.query and query:
+            items = query.multi_items() if hasattr(query, "multi_items") else query.items()
+            if isinstance(self.query, list):
+                items = [(k, v) for k, v in items if k in self.query]
+            parts.append("&".join(f"{k}={v}" for k, v in sorted(items)).encode())
+
+        if self.headers and headers:
+            parts.append("\n".join(f"{name.lower()}:{headers.get(name, '')}" for name in self.headers).encode())
+
+        return hashlib.md5(b"\x1f".join(parts)).hexdigest()
+
+
+class CacheMatch(BaseModel):
+    methods: List[str] = Field(default_factory=lambda: ["*"])
+    path: str = "*"
+
+
+class CacheRule(BaseModel):
+    match: CacheMatch = Field(default_factory=CacheMatch)
+    cache: bool = True
+    ttl: int = Field(default=settings.CACHE_DEFAULT_TTL, gt=0, description="Hard TTL, entry is gone afterwards")
+    soft_ttl: Optional[int] = Field(
+        default=settings.CACHE_SOFT_TTL, gt=0, description="Stale-while-revalidate after this many seconds"
+    )
+    key: CacheKeySpec = Field(default_factory=CacheKeySpec)
+
+    _path_re: re.Pattern = PrivateAttr()
+
+    def model_post_init(self, __context) -> None:
+        self.match.methods = [m.upper() for m in self.match.methods]
+        self._path_re = re.compile(fnmatch.translate(self.match.path))
+        if self.soft_ttl is not None and self.soft_ttl >= self.ttl:
+            self.soft_ttl = None
+
+    def is_stale(self, created_at: float, now: float) -> bool:
+        return self.soft_ttl is not None and now - created_at > self.soft_ttl
+
+    def matches(self, method: str, path: str) -> bool:
+        if "*" not in self.match.methods and method.upper() not in self.match.methods:
+            return False
+        return self._path_re.match(path) is not None
+
+
+class CachePolicy(BaseModel):
+    """First matching rule wins, `default` applies when nothing matches."""
+
+    default: CacheRule = Field(default_factory=CacheRule)
+    rules: List[CacheRule] = Field(default_factory=list)
+
+    def match(self, method: str, path: str) -> CacheRule:
+        path = "/" + path.lstrip("/")
+        for rule in self.rules:
+            if rule.matches(method, path):
+                return rule
+        return self.default
+
+
+def load_cache_policy(path: str) -> CachePolicy:
+    policy_file = Path(path)
+    if not policy_file.exists():
+        logger.info(f"No cache policy at {path}, caching everything for {settings.CACHE_DEFAULT_TTL}s")
+        return CachePolicy()
+
+    try:
+        data = yaml.safe_load(policy_file.read_text(encoding="utf-8")) or {}
+        return CachePolicy.model_validate(data)
+    except Exception as e:
+        logger.error(f"Invalid cache policy {path}, falling back to defaults: {e}")
+        return CachePolicy()
+
+
+cache_policy = load_cache_policy(settings.CACHE_POLICY_FILE)
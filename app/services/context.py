@@ -1,21 +1,67 @@
-from typing import Dict, List
+import json
+import logging
+from typing import Dict, List, Optional
 
-from app.services.cache import cache_service
+from app.database.backends import Batch
+from app.database.core.config import settings
+from app.database.core.storage import get_storage
+
+logger = logging.getLogger(__name__)
 
 
 class ContextManager:
-    async def get_context(self, session_id: str, limit: int = 5) -> List[Dict]:
-        """Get last N requests from session"""
-        key = f"context:{session_id}"
-        context = await cache_service.get(key)
-        return context[-limit:] if context else []
+    """
+    Session history kept as a capped list in storage, newest entry first.
+    Appends are a single atomic push that trims the list and refreshes its TTL.
+    """
+
+    def __init__(self):
+        self.window = settings.CONTEXT_WINDOW
+        self.ttl = settings.CONTEXT_TTL
+
+    @property
+    def storage(self):
+        return get_storage()
+
+    @staticmethod
+    def key(session_id: str) -> str:
+        # hash tag: a session's context lives on the shard (or cluster slot) of its cached responses
+        return f"context:{{{session_id}}}"
+
+    @staticmethod
+    def decode(entries: List[bytes]) -> List[Dict]:
+        """Stored entries (newest first) to context, oldest first"""
+        return [json.loads(entry) for entry in reversed(entries)]
+
+    async def get_context(self, session_id: str, limit: Optional[int] = None) -> List[Dict]:
+        """Get last N requests from session, oldest first"""
+        limit = min(limit or self.window, self.window)
+        try:
+            entries = await self.storage.range(self.key(session_id), limit)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not read session context: {e}")
+            return []
+
+        return self.decode(entries)
 
     async def add_to_context(self, session_id: str, request_data: Dict):
         """Add request to context history"""
-        key = f"context:{session_id}"
-        context = await cache_service.get(key) or []
-        context.append(request_data)
-        await cache_service.set(key, context, ttl=3600)
+        batch = Batch()
+        self.queue_append(batch, session_id, request_data)
+        try:
+            await self.storage.apply(batch, atomic=True)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not write session context: {e}")
+
+    def queue_append(self, batch: Batch, session_id: str, request_data: Dict) -> int:
+        """Add the append to a batch of writes, returns the size of the new entry"""
+        entry = json.dumps(request_data).encode()
+        batch.push(self.key(session_id), [entry], self.window, self.ttl)
+        return len(entry)
+
+    def stored_size(self, entry_size: int, previous: List[int]) -> int:
+        """Size of the list after an append, from the sizes of the entries before it (newest first)"""
+        return entry_size + sum(previous[: self.window - 1])
 
 
 context_manager = ContextManager()
@@ -0,0 +1,361 @@
+"""
+Record and replay of mock responses through fixture files.
+
+Record mode appends every request key and the response sent for it to
+append-only segment files. Replay mode answers from those files only: an
+open-addressing hash table written next to the segments is memory-mapped,
+so startup does not depend on the fixture size and a lookup is a few probes
+into the table plus one slice of a mapped segment.
+
+Segment: FILE_MAGIC, then records of key length (u32) | value length (u32) |
+crc32 of key and value (u32) | key | value. A torn record at the end of a
+segment (crash while recording) is cut off when recording resumes.
+A recording process holds an exclusive flock on the segment it appends to,
+so several workers recording at once each write a segment of their own.
+
+Index: INDEX_MAGIC | slots (u64) | records (u64), then `slots` slots of
+key hash (u64, 0 = empty) | segment number (u32) | record offset (u64).
+The newest record of a key wins.
+"""
+
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.database.core.config import settings
+from app.services.cache import CachedResponse
+from app.services.responder import Outcome
+
+logger = logging.getLogger(__name__)
+
+FILE_MAGIC = b"HXF1"
+INDEX_MAGIC = b"HXI1"
+RECORD = struct.Struct("<III")
+INDEX_HEADER = struct.Struct("<4sQQ")
+SLOT = struct.Struct("<QIQ")
+INDEX_NAME = "index.hxi"
+INDEX_LOCK_NAME = "index.lock"
+
+
+def segment_path(directory: Path, number: int) -> Path:
+    return directory / f"segment-{number:06d}.hxf"
+
+
+def list_segments(directory: Path) -> List[Tuple[int, Path]]:
+    segments = []
+    for path in directory.glob("segment-*.hxf"):
+        try:
+            segments.append((int(path.stem.split("-")[1]), path))
+        except ValueError:
+            continue
+    return sorted(segments)
+
+
+def key_hash(key: bytes) -> int:
+    # 0 marks an empty slot
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little") or 1
+
+
+def scan_segment(data: bytes) -> Iterator[Tuple[int, bytes, int]]:
+    """Offset, key and end offset of every intact record, stops at the first torn one."""
+    offset = len(FILE_MAGIC)
+    if data[:offset] != FILE_MAGIC:
+        return
+    while offset + RECORD.size <= len(data):
+        key_len, value_len, crc = RECORD.unpack_from(data, offset)
+        start = offset + RECORD.size
+        end = start + key_len + value_len
+        if end > len(data) or zlib.crc32(data[start:end]) != crc:
+            return
+        yield offset, bytes(data[start : start + key_len]), end
+        offset = end
+
+
+def build_index(directory: Path) -> int:
+    """Write the index of every segment in `directory`; returns the number of keys."""
+    # workers stopping together take turns, the last one indexes what all of them wrote
+    with open(directory / INDEX_LOCK_NAME, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return _build_index(directory)
+
+
+def index_is_current(directory: Path) -> bool:
+    """Whether the index was written after every segment last changed, a recording that did not stop leaves it stale."""
+    try:
+        indexed_at = (directory / INDEX_NAME).stat().st_mtime_ns
+    except FileNotFoundError:
+        return False
+    # a segment written in the same tick as the index may hold records after it
+    return all(path.stat().st_mtime_ns < indexed_at for _, path in list_segments(directory))
+
+
+def _build_index(directory: Path) -> int:
+    entries: Dict[bytes, Tuple[int, int]] = {}
+    for number, path in list_segments(directory):
+        with open(path, "rb") as f:
+            data = f.read()
+        for offset, key, _ in scan_segment(data):
+            entries[key] = (number, offset)
+
+    slots = 16
+    while slots < len(entries) * 2:
+        slots *= 2
+    mask = slots - 1
+    table = bytearray(INDEX_HEADER.size + slots * SLOT.size)
+    INDEX_HEADER.pack_into(table, 0, INDEX_MAGIC, slots, len(entries))
+    for key, (number, offset) in entries.items():
+        hashed = key_hash(key)
+        slot = hashed & mask
+        while SLOT.unpack_from(table, INDEX_HEADER.size + slot * SLOT.size)[0]:
+            slot = (slot + 1) & mask
+        SLOT.pack_into(table, INDEX_HEADER.size + slot * SLOT.size, hashed, number, offset)
+
+    # written aside and renamed, a replaying process never maps a half-written index
+    temporary = directory / f"{INDEX_NAME}.tmp"
+    temporary.write_bytes(table)
+    os.replace(temporary, directory / INDEX_NAME)
+    return len(entries)
+
+
+class FixtureWriter:
+    """
+    Appends records to the newest segment, starting a new one once it is full
+    or when another process is appending to the newest one.
+    """
+
+    def __init__(self, directory: Path, segment_bytes: int):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.records = 0
+        self._file = None
+        self._number = 0
+        self._size = 0
+
+    def open(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        segments = list_segments(self.directory)
+        if not segments:
+            self._start_segment(1)
+            return
+
+        self._number, path = segments[-1]
+        file = open(path, "r+b")
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # another worker is appending to it
+            file.close()
+            self._start_segment(self._number + 1)
+            return
+
+        data = file.read()
+        if data[: len(FILE_MAGIC)] != FILE_MAGIC:
+            # not a segment, or one another worker has only just created
+            file.close()
+            self._start_segment(self._number + 1)
+            return
+
+        end = len(FILE_MAGIC)
+        for _, _, end in scan_segment(data):
+            pass
+        if end < len(data):
+            logger.warning(f"⚠️ Dropping {len(data) - end} bytes of a torn record at the end of {path.name}")
+        self._file = file
+        self._file.truncate(end)
+        self._file.seek(end)
+        self._size = end
+
+    def append(self, key: bytes, value: bytes):
+        if self._size >= self.segment_bytes:
+            self._file.close()
+            self._start_segment(self._number + 1)
+
+        payload = key + value
+        self._file.write(RECORD.pack(len(key), len(value), zlib.crc32(payload)) + payload)
+        self._file.flush()
+        self._size += RECORD.size + len(payload)
+        self.records += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _start_segment(self, number: int):
+        while True:
+            try:
+                file = open(segment_path(self.directory, number), "xb")
+                break
+            except FileExistsError:
+                number += 1
+        # a worker opening it in between only holds the lock until it sees no FILE_MAGIC
+        fcntl.flock(file, fcntl.LOCK_EX)
+        self._number, self._file = number, file
+        self._file.write(FILE_MAGIC)
+        self._file.flush()
+        self._size = len(FILE_MAGIC)
+
+
+class FixtureReader:
+    """Lookups through the memory-mapped index and segments."""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self._index: Optional[mmap.mmap] = None
+        self._segments: Dict[int, mmap.mmap] = {}
+        self.slots = 0
+        self.records = 0
+
+    def open(self):
+        with open(self.directory / INDEX_NAME, "rb") as f:
+            self._index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.slots, self.records = INDEX_HEADER.unpack_from(self._index, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{self.directory / INDEX_NAME} is not a fixture index")
+
+    def get(self, key: str) -> Optional[bytes]:
+        encoded = key.encode()
+        hashed = key_hash(encoded)
+        mask = self.slots - 1
+        slot = hashed & mask
+        while True:
+            stored, number, offset = SLOT.unpack_from(self._index, INDEX_HEADER.size + slot * SLOT.size)
+            if not stored:
+                return None
+            if stored == hashed:
+                data = self._segment(number)
+                key_len, value_len, _ = RECORD.unpack_from(data, offset)
+                start = offset + RECORD.size
+                if data[start : start + key_len] == encoded:
+                    return data[start + key_len : start + key_len + value_len]
+            slot = (slot + 1) & mask
+
+    def close(self):
+        for mapped in [self._index, *self._segments.values()]:
+            if mapped is not None:
+                mapped.close()
+        self._index = None
+        self._segments = {}
+
+    def _segment(self, number: int) -> mmap.mmap:
+        mapped = self._segments.get(number)
+        if mapped is None:
+            with open(segment_path(self.directory, number), "rb") as f:
+                mapped = self._segments[number] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return mapped
+
+
+class FixtureService:
+    """
+    Fixture mode of the catch-all route: off, record (serve as usual and append
+    what was sent) or replay (serve from the fixtures only, no storage or provider).
+    """
+
+    def __init__(self):
+        self.mode = settings.FIXTURE_MODE
+        self.directory = Path(settings.FIXTURE_DIR)
+        self.segment_bytes = settings.FIXTURE_SEGMENT_BYTES
+        self.stats = {"recorded": 0, "unchanged": 0, "hits": 0, "misses": 0, "lookup_s": 0.0}
+        self._writer: Optional[FixtureWriter] = None
+        self._reader: Optional[FixtureReader] = None
+        # crc of the last response recorded per key, repeats are not appended again
+        self._recorded: Dict[bytes, int] = {}
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def start(self):
+        if self.recording:
+            self._writer = FixtureWriter(self.directory, self.segment_bytes)
+            self._writer.open()
+            logger.info(f"Recording fixtures to {self.directory}")
+        elif self.replaying:
+            if not list_segments(self.directory):
+                raise FileNotFoundError(f"No fixtures to replay in {self.directory}, record them first")
+            if not index_is_current(self.directory):
+                logger.warning(
+                    f"⚠️ The fixture index in {self.directory} is missing or older than its segments, building it"
+                )
+                build_index(self.directory)
+            self._reader = FixtureReader(self.directory)
+            self._reader.open()
+            logger.info(f"Replaying {self._reader.records} fixtures from {self.directory}")
+
+    def stop(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            count = build_index(self.directory)
+            logger.info(f"Fixture index written: {count} keys")
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+    def record(self, key: str, response: CachedResponse):
+        encoded = key.encode()
+        value = response.encode()
+        # status, headers and body: created_at differs on every generation of the same response
+        crc = zlib.crc32(value[len(CachedResponse.MAGIC) + CachedResponse.HEADER.size :], response.status_code)
+        if self._recorded.get(encoded) == crc:
+            self.stats["unchanged"] += 1
+            return
+        try:
+            self._writer.append(encoded, value)
+        except OSError as e:
+            logger.warning(f"⚠️ Could not record fixture: {e}")
+            return
+        self._recorded[encoded] = crc
+        self.stats["recorded"] += 1
+
+    def respond(self, key: str) -> Outcome:
+        """Replayed response, or a 404 naming the key when nothing was recorded for it."""
+        response = self.replay(key)
+        if response is not None:
+            return Outcome(response, "fixture")
+        missing = CachedResponse.from_data(
+            {
+                "status_code": 404,
+                "headers": {"X-Helix-Fixture": "miss"},
+                "body": {"error": "No recorded response for this request", "key": key},
+            }
+        )
+        return Outcome(missing, "fixture_miss")
+
+    def replay(self, key: str) -> Optional[CachedResponse]:
+        started = time.perf_counter()
+        value = self._reader.get(key)
+        self.stats["lookup_s"] += time.perf_counter() - started
+        if value is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return CachedResponse.decode(value)
+
+    def get_stats(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        stats = {"mode": self.mode, "directory": str(self.directory)}
+        if self.recording:
+            stats.update(recorded=self.stats["recorded"], unchanged=self.stats["unchanged"])
+        elif self.replaying:
+            stats.update(
+                fixtures=self._reader.records if self._reader else 0,
+                hits=self.stats["hits"],
+                misses=self.stats["misses"],
+                lookup_us=round(self.stats["lookup_s"] / lookups * 1e6, 2) if lookups else 0.0,
+            )
+        return stats
+
+
+fixture_service = FixtureService()
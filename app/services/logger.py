@@ -1,57 +1,184 @@
+import asyncio
+import contextvars
 import json
 import logging
+import random
 import time
-from datetime import datetime
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, Optional
 
-from app.database.core.connect import get_redis_connection
+from app.database.backends import Batch
+from app.database.core.config import settings
+from app.database.core.storage import get_storage
 
 logger = logging.getLogger(__name__)
 
 
 class LoggerService:
+    """
+    Request log for the dashboard, newest entry first in a capped list in storage.
+    log_request only queues the entry; a background writer serialises queued
+    entries and writes them in batches, one capped push per batch.
+    """
+
     def __init__(self):
-        self.redis = get_redis_connection()
         self.log_key = "helix:request_logs"
-        self.max_logs = 100
+        self.max_logs = settings.LOG_MAX_ENTRIES
+        self.queue_size = settings.LOG_QUEUE_SIZE
+        self.batch_size = settings.LOG_BATCH_SIZE
+        self.flush_interval = settings.LOG_FLUSH_INTERVAL
+        self.overflow_policy = settings.LOG_OVERFLOW_POLICY
+        self.stats = {"written": 0, "dropped": 0, "batches": 0, "errors": 0}
+        self._queue: Deque[tuple] = deque()
+        # requests offered since the queue last filled up, for sampling
+        self._seen = 0
+        self._wakeup = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+        self._closing = False
+
+    @property
+    def storage(self):
+        return get_storage()
 
-    def log_request(self, method: str, path: str, status: int, duration_ms: float, body: dict, response: dict):
+    @staticmethod
+    def _as_json(value):
+        """Request and response bodies may arrive as raw bytes from the cache fast path."""
+        if not isinstance(value, (bytes, bytearray)):
+            return value
+        if not value:
+            return {}
         try:
-            log_entry = {
-                "id": str(time.time()),
-                "timestamp": datetime.utcnow().strftime("%H:%M:%S"),
-                "method": method,
-                "path": path,
-                "status": status,
-                "duration": round(duration_ms, 2),
-                "body": body,
-                "response": response,
-            }
+            return json.loads(value)
+        except ValueError:
+            return value.decode("utf-8", "replace")
+
+    def log_request(
+        self,
+        method: str,
+        path: str,
+        status: int,
+        duration_ms: float,
+        body: dict | bytes,
+        response: dict | bytes,
+        source: str | None = None,
+        round_trips: int | None = None,
+    ):
+        """Queue a request for the log, never waits on storage."""
+        entry = (time.time(), method, path, status, duration_ms, body, response, source, round_trips)
 
-            self.redis.lpush(self.log_key, json.dumps(log_entry))
+        if len(self._queue) >= self.queue_size:
+            self.stats["dropped"] += 1
+            if self.overflow_policy == "drop":
+                return
+            if self.overflow_policy == "sample":
+                # reservoir sampling: every request offered since the queue filled up
+                # has the same chance to be in it
+                self._seen = max(self._seen, len(self._queue)) + 1
+                slot = random.randrange(self._seen)
+                if slot < len(self._queue):
+                    self._queue[slot] = entry
+                return
+            self._queue.popleft()
 
-            self.redis.ltrim(self.log_key, 0, self.max_logs - 1)
+        self._seen = 0
+        self._queue.append(entry)
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+        if self._writer is None and not self._closing:
+            self.start()
 
+    def _format(self, entry: tuple) -> bytes:
+        logged_at, method, path, status, duration_ms, body, response, source, round_trips = entry
+        log_entry = {
+            "id": str(logged_at),
+            "timestamp": datetime.fromtimestamp(logged_at, timezone.utc).strftime("%H:%M:%S"),
+            "method": method,
+            "path": path,
+            "status": status,
+            "duration": round(duration_ms, 2),
+            "body": self._as_json(body),
+            "response": self._as_json(response),
+        }
+        if source is not None:
+            log_entry["source"] = source
+            log_entry["redis_round_trips"] = round_trips
+        return json.dumps(log_entry).encode()
+
+    async def flush(self):
+        """Write up to one batch of queued entries."""
+        batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.batch_size))]
+        if not batch:
+            return
+
+        # only the newest max_logs entries would survive the trim
+        writes = Batch()
+        writes.push(self.log_key, [self._format(entry) for entry in batch[-self.max_logs :]], self.max_logs)
+        try:
+            await self.storage.apply(writes)
+            self.stats["written"] += len(batch)
+            self.stats["batches"] += 1
         except Exception as e:
+            self.stats["errors"] += 1
+            self.stats["dropped"] += len(batch)
             logger.error(f"Failed to log request: {e}")
 
-    def get_recent_logs(self, limit: int = 50):
+    async def _run(self):
+        while self._queue or not self._closing:
+            if len(self._queue) < self.batch_size and not self._closing:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            await self.flush()
+
+    def start(self):
+        """Start the background writer (also started by the first logged request)."""
+        self._closing = False
+        if self._writer is None:
+            # fresh context: the writer must not inherit the request's round-trip counter
+            self._writer = asyncio.get_running_loop().create_task(self._run(), context=contextvars.Context())
+
+    async def stop(self, timeout: float = 10.0):
+        """Write everything still queued, then stop the writer."""
+        self._closing = True
+        self._wakeup.set()
+        if self._writer is None:
+            return
+        try:
+            await asyncio.wait_for(self._writer, timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Request log not flushed in {timeout}s, dropping {len(self._queue)} entries")
+            self.stats["dropped"] += len(self._queue)
+            self._queue.clear()
+        finally:
+            self._writer = None
+
+    def get_stats(self) -> dict:
+        return {"queued": len(self._queue), "overflow_policy": self.overflow_policy, **self.stats}
+
+    async def get_recent_logs(self, limit: int = 50):
         try:
-            logs_raw = self.redis.lrange(self.log_key, 0, limit - 1)
+            logs_raw = await self.storage.range(self.log_key, limit)
             return [json.loads(log) for log in logs_raw]
         except Exception as e:
             logger.error(f"Failed to fetch logs: {e}")
             return []
 
-    def get_raw_logs_as_string(self):
-        logs_raw = self.redis.lrange(self.log_key, 0, -1)
-        return "[" + ",".join(logs_raw) + "]"
+    async def get_raw_logs_as_string(self):
+        logs_raw = await self.storage.range(self.log_key)
+        return "[" + b",".join(logs_raw).decode() + "]"
 
-    def get_raw_logs_as_string_wlimit(self, limit: int = 50):
-        logs_raw = self.redis.lrange(self.log_key, 0, limit - 1)
-        return "[" + ",".join(logs_raw) + "]"
+    async def get_raw_logs_as_string_wlimit(self, limit: int = 50):
+        logs_raw = await self.storage.range(self.log_key, limit)
+        return "[" + b",".join(logs_raw).decode() + "]"
 
-    def clear_logs(self):
-        self.redis.delete(self.log_key)
+    async def clear_logs(self):
+        self._queue.clear()
+        batch = Batch()
+        batch.delete(self.log_key)
+        await self.storage.apply(batch)
 
 
 logger_service = LoggerService()
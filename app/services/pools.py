@@ -0,0 +1,154 @@
+"""
+Pools of pre-generated items per collection, so that a miss on a plain GET
+costs no provider call. A background task asks the provider for a batch of
+items of the collection at a time; collection requests get a random page
+of them and item requests a random one under the requested id. Every item
+is served up to POOL_ITEM_USES times, and the pool is topped up in the
+background when fewer than POOL_MIN_ITEMS are left. A session that has
+written to the collection gets its responses generated as before, so it
+sees its own changes.
+"""
+
+import asyncio
+import copy
+import logging
+import random
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from app.database.core.config import settings
+from app.services.ai.manager import ai_manager
+from app.services.analyzer import request_analyzer
+
+logger = logging.getLogger(__name__)
+
+
+class PoolItem:
+    __slots__ = ("data", "uses")
+
+    def __init__(self, data: dict):
+        self.data = data
+        self.uses = 0
+
+
+class ResponsePools:
+    def __init__(self):
+        self.enabled = settings.POOL_ENABLED
+        self.batch_size = settings.POOL_BATCH_SIZE
+        self.min_items = settings.POOL_MIN_ITEMS
+        self.item_uses = settings.POOL_ITEM_USES
+        self.page_size = settings.POOL_PAGE_SIZE
+        self.max_pools = settings.POOL_MAX_COLLECTIONS
+        self.fill_backoff = settings.POOL_FILL_BACKOFF
+        self.stats = {"served": 0, "empty": 0, "fills": 0, "items_generated": 0, "errors": 0}
+        # collection path -> items, least recently sampled first
+        self._pools: "OrderedDict[str, List[PoolItem]]" = OrderedDict()
+        self._filling: Dict[str, asyncio.Task] = {}
+        # collection path -> monotonic time until which it is not filled, after a failed or empty fill
+        self._backoff: Dict[str, float] = {}
+
+    def sample(self, method: str, path: str, context: Optional[list] = None) -> Optional[dict]:
+        """
+        Response to `method` `path` made from the pool of its collection, None when it
+        is not served from a pool or the pool is empty (it is then filled in the background).
+        """
+        if not self.enabled or method != "GET":
+            return None
+        collection = request_analyzer.collection_path(path)
+        if not collection or request_analyzer.wrote_to(collection, context):
+            return None
+
+        items = self._pools.get(collection)
+        if items is not None:
+            self._pools.move_to_end(collection)
+        if not items or len(items) < self.min_items:
+            self._fill(collection)
+        if not items:
+            self.stats["empty"] += 1
+            return None
+
+        if request_analyzer.is_collection(path.strip("/")):
+            picked = random.sample(items, random.randint(min(len(items), 3), min(len(items), self.page_size)))
+            resource = request_analyzer.extract_resource(collection)
+            page = [self._use(collection, item) for item in picked]
+            body = {resource: page, "total": len(page), "page": 1, "per_page": self.page_size, "has_more": False}
+        else:
+            body = self._use(collection, random.choice(items))
+            body["id"] = path.rstrip("/").rpartition("/")[2]
+
+        self.stats["served"] += 1
+        return {"status_code": 200, "headers": {"Content-Type": "application/json"}, "body": body}
+
+    def _use(self, collection: str, item: PoolItem) -> dict:
+        item.uses += 1
+        if item.uses >= self.item_uses:
+            self._pools[collection].remove(item)
+        return copy.deepcopy(item.data)
+
+    def _fill(self, collection: str):
+        if collection in self._filling:
+            return
+        if collection in self._backoff:
+            if time.monotonic() < self._backoff[collection]:
+                return
+            del self._backoff[collection]
+        task = asyncio.create_task(self.fill(collection))
+        self._filling[collection] = task
+        task.add_done_callback(lambda _: self._filling.pop(collection, None))
+
+    async def fill(self, collection: str) -> int:
+        """Add a batch of items generated by the provider to the collection's pool, returns how many."""
+        try:
+            response = await ai_manager.generate_response(
+                "GET",
+                collection,
+                body={
+                    "task": "generate_pool",
+                    "resource": request_analyzer.extract_resource(collection),
+                    "count": self.batch_size,
+                },
+            )
+            generated = self._extract_items(response.get("body"))
+            if not generated:
+                raise ValueError("the response holds no items")
+        except Exception as e:
+            self.stats["errors"] += 1
+            self._backoff[collection] = time.monotonic() + self.fill_backoff
+            logger.warning(f"⚠️ Could not fill the response pool of {collection}: {e}")
+            return 0
+
+        self.stats["fills"] += 1
+        self.stats["items_generated"] += len(generated)
+        self._pools.setdefault(collection, []).extend(PoolItem(item) for item in generated)
+        self._pools.move_to_end(collection)
+        while len(self._pools) > self.max_pools:
+            self._pools.popitem(last=False)
+        return len(generated)
+
+    @staticmethod
+    def _extract_items(body) -> List[dict]:
+        """Objects of the generated collection, whether the body is the list or wraps it."""
+        if isinstance(body, dict):
+            body = next((value for value in body.values() if isinstance(value, list)), [])
+        if not isinstance(body, list):
+            return []
+        return [item for item in body if isinstance(item, dict)]
+
+    async def stop(self):
+        tasks = list(self._filling.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "collections": len(self._pools),
+            "items": sum(len(items) for items in self._pools.values()),
+            "filling": len(self._filling),
+            **self.stats,
+        }
+
+
+response_pools = ResponsePools()
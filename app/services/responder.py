@@ -0,0 +1,270 @@
+"""
+Mock response lookup and generation for the catch-all route.
+A miss costs at most two storage round trips around the provider call:
+one lookup that reads the cache, takes the generation lock and reads the
+session context, and one atomic batch that stores the response, appends
+to the context and releases the lock. Embedded backends make no hops at all.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, NamedTuple, Optional, Union
+
+from app.database.backends import Batch
+from app.database.core.storage import get_storage
+from app.services.ai.manager import ai_manager
+from app.services.ai.prompt import system_prompt
+from app.services.cache import CachedResponse, cache_service
+from app.services.cache_policy import CacheRule
+from app.services.context import context_manager
+from app.services.pools import response_pools
+from app.services.sessions import session_index
+from app.services.singleflight import single_flight
+from app.services.streaming import EnvelopeParser, StreamedResponse
+
+logger = logging.getLogger(__name__)
+
+
+class MockRequest(NamedTuple):
+    session_id: str
+    method: str
+    path: str
+    raw_body: bytes
+    rule: CacheRule
+    cache_key: str
+
+
+class Outcome(NamedTuple):
+    response: Union[CachedResponse, StreamedResponse]
+    # l1, l2, stale, miss, coalesced, uncached or stream
+    source: str
+
+
+class MockResponder:
+    @property
+    def storage(self):
+        return get_storage()
+
+    async def respond(self, request: MockRequest) -> Outcome:
+        session_index.touch(request.session_id)
+        if not request.rule.cache:
+            return await self._uncached(request)
+
+        cached = cache_service.get_local(request.cache_key)
+        if cached is not None:
+            return self._hit(request, cached, "l1")
+
+        if single_flight.inflight(request.cache_key):
+            outcome = await single_flight.run(request.cache_key, lambda: self._miss(request))
+            return Outcome(outcome.response, "coalesced")
+        if ai_manager.streaming:
+            return await self._streamed(request)
+        return await single_flight.run(request.cache_key, lambda: self._miss(request))
+
+    async def _streamed(self, request: MockRequest) -> Outcome:
+        """
+        Run the miss in its own task and answer as soon as the provider's output
+        reaches the body. The task goes on to cache the whole response even if
+        the client goes away; hits and coalesced misses are returned whole.
+        """
+        head = asyncio.get_running_loop().create_future()
+        miss = asyncio.create_task(single_flight.run(request.cache_key, lambda: self._miss(request, stream=head)))
+        # its error is raised to the stream's reader, or nobody if the client left
+        miss.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+        await asyncio.wait((head, miss), return_when=asyncio.FIRST_COMPLETED)
+        if not head.done():
+            return miss.result()
+        streamed = head.result()
+        streamed.completed = miss
+        return Outcome(streamed, "stream")
+
+    def _hit(self, request: MockRequest, cached: CachedResponse, source: str) -> Outcome:
+        if request.rule.is_stale(cached.created_at, time.time()):
+            cache_service.revalidate(
+                request.cache_key, lambda: single_flight.run(request.cache_key, lambda: self._miss(request, True))
+            )
+            source = "stale"
+        return Outcome(cached, source)
+
+    async def _miss(
+        self, request: MockRequest, revalidate: bool = False, stream: Optional[asyncio.Future] = None
+    ) -> Outcome:
+        lock_key, token = single_flight.new_lock(request.cache_key)
+
+        while True:
+            # round trip 1: cache, lock and context
+            lookup = await cache_service.lookup(
+                request.cache_key,
+                lock_key,
+                token,
+                context_manager.key(request.session_id),
+                context_manager.window,
+                lock_ttl=single_flight.lock_ttl,
+                revalidate=revalidate,
+                ttl=request.rule.ttl,
+            )
+            if lookup.cached is not None:
+                return self._hit(request, lookup.cached, "l2")
+            if lookup.locked:
+                break
+
+            cached = await single_flight.wait_for_peer(request.cache_key, lock_key, request.rule.ttl)
+            if cached is not None:
+                return Outcome(cached, "coalesced")
+            # the other worker failed or gave up, compete for the lock again
+
+        single_flight.stats["leaders"] += 1
+        context = context_manager.decode(lookup.context)
+        try:
+            if stream is None:
+                body, response_data = await self._generate(request, context)
+            else:
+                body, response_data = await self._generate_streamed(request, context, stream)
+        except BaseException:
+            await single_flight.release(lock_key, token)
+            raise
+
+        prepared = CachedResponse.from_data(response_data)
+
+        # round trip 2: response, context and lock release
+        batch = Batch()
+        size = cache_service.queue_set(
+            batch, request.cache_key, prepared, ttl=request.rule.ttl, tags=self._tags(request)
+        )
+        entry_size = context_manager.queue_append(
+            batch, request.session_id, self._context_entry(request, body, response_data)
+        )
+        single_flight.queue_release(batch, lock_key, token)
+        try:
+            await self.storage.apply(batch, atomic=True)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not write to storage: {e}")
+        else:
+            session_index.record(request.session_id, request.cache_key, size, request.rule.ttl)
+            session_index.record(
+                request.session_id,
+                context_manager.key(request.session_id),
+                context_manager.stored_size(entry_size, [len(entry) for entry in lookup.context]),
+                context_manager.ttl,
+            )
+
+        return Outcome(prepared, "miss")
+
+    async def prefill(self, request: MockRequest, force: bool = False) -> Outcome:
+        """
+        Generate and store a response before anyone asks for it (cache warm-up).
+        Unlike a miss it leaves the session context alone. Returns an l2 outcome
+        when the entry is already cached and a coalesced one, without a response,
+        when another worker is generating it.
+        """
+        lock_key, token = single_flight.new_lock(request.cache_key)
+        lookup = await cache_service.lookup(
+            request.cache_key,
+            lock_key,
+            token,
+            context_manager.key(request.session_id),
+            1,
+            lock_ttl=single_flight.lock_ttl,
+            revalidate=force,
+            ttl=request.rule.ttl,
+        )
+        if lookup.cached is not None:
+            return Outcome(lookup.cached, "l2")
+        if not lookup.locked:
+            return Outcome(None, "coalesced")
+
+        try:
+            _, response_data = await self._generate(request, [])
+        except BaseException:
+            await single_flight.release(lock_key, token)
+            raise
+
+        prepared = CachedResponse.from_data(response_data)
+        batch = Batch()
+        size = cache_service.queue_set(
+            batch, request.cache_key, prepared, ttl=request.rule.ttl, tags=self._tags(request)
+        )
+        single_flight.queue_release(batch, lock_key, token)
+        try:
+            await self.storage.apply(batch, atomic=True)
+        except BaseException:
+            await single_flight.release(lock_key, token)
+            raise
+        session_index.record(request.session_id, request.cache_key, size, request.rule.ttl)
+
+        return Outcome(prepared, "miss")
+
+    async def _uncached(self, request: MockRequest) -> Outcome:
+        context = await context_manager.get_context(request.session_id)
+        body, response_data = await self._generate(request, context)
+
+        entry = self._context_entry(request, body, response_data)
+        await context_manager.add_to_context(request.session_id, entry)
+        session_index.record(
+            request.session_id,
+            context_manager.key(request.session_id),
+            context_manager.stored_size(
+                len(json.dumps(entry)), [len(json.dumps(previous)) for previous in reversed(context)]
+            ),
+            context_manager.ttl,
+        )
+
+        return Outcome(CachedResponse.from_data(response_data), "uncached")
+
+    @staticmethod
+    def _decode_body(request: MockRequest):
+        # the body is only decoded when a response has to be generated
+        try:
+            return json.loads(request.raw_body) if request.raw_body else {}
+        except ValueError:
+            return {}
+
+    async def _generate(self, request: MockRequest, context: list):
+        body = self._decode_body(request)
+        response_data = response_pools.sample(request.method, request.path, context)
+        if response_data is None:
+            response_data = await ai_manager.generate_response(
+                method=request.method, path=request.path, body=body, context=context
+            )
+        return body, response_data
+
+    async def _generate_streamed(self, request: MockRequest, context: list, head: asyncio.Future):
+        """Like _generate, handing `head` a StreamedResponse as soon as status and headers are known."""
+        body = self._decode_body(request)
+        pooled = response_pools.sample(request.method, request.path, context)
+        if pooled is not None:
+            return body, pooled
+        parser = EnvelopeParser()
+        streamed = None
+        try:
+            async for text in ai_manager.stream_response(request.method, request.path, body, context):
+                chunk = parser.feed(text)
+                if streamed is None and parser.head_ready:
+                    streamed = StreamedResponse(parser.status_code, parser.headers)
+                    head.set_result(streamed)
+                if streamed is not None:
+                    streamed.write(chunk)
+            response_data = parser.result()
+        except BaseException as e:
+            if streamed is not None:
+                streamed.fail(e)
+            raise
+
+        if streamed is not None:
+            streamed.close()
+        return body, response_data
+
+    @staticmethod
+    def _tags(request: MockRequest):
+        # the prompt version lets responses generated under an older system prompt be purged
+        return cache_service.index_tags(request.method, request.path) + [f"prompt:{system_prompt.version}"]
+
+    @staticmethod
+    def _context_entry(request: MockRequest, body, response_data: Dict) -> Dict:
+        return {"method": request.method, "path": request.path, "body": body, "response": response_data}
+
+
+mock_responder = MockResponder()
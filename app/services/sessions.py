@@ -0,0 +1,172 @@
+import asyncio
+import contextvars
+import logging
+import time
+from typing import Dict, List, Optional
+
+from app.database.backends import IndexedKey
+from app.database.core.config import settings
+from app.database.core.storage import get_storage
+from app.services.cache import cache_service
+
+logger = logging.getLogger(__name__)
+
+# sessions listed and dropped per storage call while enforcing budgets
+EVICT_BATCH = 100
+# over the global budget, evict down to this share of it so eviction does not run on every pass
+LOW_WATERMARK = 0.9
+
+
+class SessionIndex:
+    """
+    Memory accounting and eviction of mock state, whole sessions at a time.
+    Requests only note the keys they wrote and when their session was seen;
+    a background task adds them to the storage-side session index and then
+    evicts sessions that are idle, over their own quota, or least recently
+    seen while all sessions together are over the global budget.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.ttl = settings.SESSION_TTL
+        self.max_bytes = settings.SESSION_MAX_BYTES
+        self.max_count = settings.SESSION_MAX_COUNT
+        self.max_total_bytes = settings.SESSION_MAX_TOTAL_BYTES
+        self.interval = settings.SESSION_INDEX_INTERVAL
+        self.stats = {"flushes": 0, "evicted_idle": 0, "evicted_quota": 0, "evicted_lru": 0, "errors": 0}
+        self.sessions = 0
+        self.total_bytes = 0
+        self._writes: Dict[str, Dict[str, IndexedKey]] = {}
+        self._seen: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    @property
+    def storage(self):
+        return get_storage()
+
+    def touch(self, session_id: str):
+        """Note that the session was used, never waits on storage."""
+        self._seen[session_id] = self.clock()
+        if self._task is None and not self._closing:
+            self.start()
+
+    def record(self, session_id: str, key: str, size: int, ttl: Optional[int] = None):
+        """Note a key written for the session, its size in bytes and its TTL in seconds."""
+        expires_at = self.clock() + ttl if ttl else None
+        self._writes.setdefault(session_id, {})[key] = IndexedKey(size, expires_at)
+        self.touch(session_id)
+
+    async def flush(self):
+        """Add everything noted since the last flush to the index."""
+        writes, seen = self._writes, self._seen
+        if not writes and not seen:
+            return
+        self._writes, self._seen = {}, {}
+
+        try:
+            await self.storage.index_sessions(writes, seen)
+            self.stats["flushes"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"⚠️ Could not update the session index: {e}")
+            # retry with the next flush, newer notes win
+            for session_id, sizes in writes.items():
+                self._writes[session_id] = {**sizes, **self._writes.get(session_id, {})}
+            for session_id, at in seen.items():
+                self._seen.setdefault(session_id, at)
+
+    async def enforce(self):
+        """Evict idle sessions, sessions over quota, then LRU sessions while over the global budget."""
+        while True:
+            idle = await self.storage.list_sessions("idle", EVICT_BATCH, seen_before=self.clock() - self.ttl)
+            await self._evict([session.session_id for session in idle], "idle")
+            if len(idle) < EVICT_BATCH:
+                break
+
+        largest = await self.storage.list_sessions("bytes", EVICT_BATCH)
+        await self._evict([session.session_id for session in largest if session.bytes > self.max_bytes], "quota")
+
+        count, total = await self.storage.session_totals()
+        if count > self.max_count or total > self.max_total_bytes:
+            target_count, target_bytes = self.max_count * LOW_WATERMARK, self.max_total_bytes * LOW_WATERMARK
+            while count > target_count or total > target_bytes:
+                oldest = await self.storage.list_sessions("idle", EVICT_BATCH)
+                if not oldest:
+                    break
+                victims = []
+                for session in oldest:
+                    if count <= target_count and total <= target_bytes:
+                        break
+                    victims.append(session.session_id)
+                    count -= 1
+                    total -= session.bytes
+                await self._evict(victims, "lru")
+
+        self.sessions, self.total_bytes = count, total
+
+    async def evict(self, session_ids: List[str]) -> int:
+        """Drop the sessions now; returns the number of keys deleted."""
+        return await self._evict(session_ids, None)
+
+    async def _evict(self, session_ids: List[str], reason: Optional[str]) -> int:
+        if not session_ids:
+            return 0
+
+        dropped = await self.storage.drop_sessions(session_ids)
+        keys = [key for session_keys in dropped.values() for key in session_keys]
+        await cache_service.invalidate(keys)
+        if reason is not None:
+            self.stats[f"evicted_{reason}"] += len(dropped)
+            logger.info(f"Evicted {len(dropped)} sessions ({reason}), {len(keys)} keys")
+        return len(keys)
+
+    async def top_sessions(self, limit: int = 10, by: str = "bytes") -> List[dict]:
+        await self.flush()
+        sessions = await self.storage.list_sessions(by, limit)
+        return [session._asdict() for session in sessions]
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.sleep(self.interval)
+                await self.flush()
+                await self.enforce()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.warning(f"⚠️ Session budget enforcement failed: {e}")
+
+    def start(self):
+        """Start the background indexer (also started by the first request)."""
+        self._closing = False
+        if self._task is None:
+            # fresh context: the indexer must not inherit the request's round-trip counter
+            self._task = asyncio.get_running_loop().create_task(self._run(), context=contextvars.Context())
+
+    async def stop(self):
+        """Index what is still pending, then stop the indexer."""
+        self._closing = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def get_stats(self) -> dict:
+        return {
+            "sessions": self.sessions,
+            "bytes": self.total_bytes,
+            "pending": len(self._writes.keys() | self._seen.keys()),
+            "max_session_bytes": self.max_bytes,
+            "max_sessions": self.max_count,
+            "max_total_bytes": self.max_total_bytes,
+            **self.stats,
+        }
+
+
+session_index = SessionIndex()
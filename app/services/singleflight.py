@@ -0,0 +1,108 @@
+"""
+Single-flight coalescing of identical in-flight generations.
+Concurrent misses for the same cache key share one provider call:
+within a worker through a shared future, across workers through a
+short-lived lock in storage while the others wait for the cached result.
+The lock is taken and released as part of the responder's lookup and
+write-back round trips rather than with commands of its own.
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.database.backends import Batch
+from app.database.core.config import settings
+from app.database.core.storage import get_storage
+from app.services.cache import CachedResponse, cache_service
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    def __init__(self):
+        self.lock_ttl = settings.SINGLEFLIGHT_LOCK_TTL
+        self.poll_interval = settings.SINGLEFLIGHT_POLL_INTERVAL
+        self.stats = {"leaders": 0, "local_waiters": 0, "remote_waiters": 0}
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @property
+    def storage(self):
+        return get_storage()
+
+    def inflight(self, key: str) -> bool:
+        return key in self._inflight
+
+    async def run(self, key: str, generate: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Return the result of `generate` for `key`, running it at most once at a
+        time in this worker. Across workers `generate` is expected to take the
+        generation lock itself (see new_lock / wait_for_peer). When the running
+        generation is cancelled (its client went away) the waiting callers are
+        not: the first of them runs its own `generate` and the others wait for it.
+        """
+        while (inflight := self._inflight.get(key)) is not None:
+            self.stats["local_waiters"] += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled() or asyncio.current_task().cancelling():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await generate()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # followers re-raise it, nobody has to retrieve it
+            raise
+        finally:
+            del self._inflight[key]
+
+    @staticmethod
+    def new_lock(key: str) -> Tuple[str, str]:
+        """Lock key and owner token for the generation of `key`."""
+        return f"lock:{key}", uuid.uuid4().hex
+
+    async def wait_for_peer(self, key: str, lock_key: str, ttl: Optional[int] = None) -> Optional[CachedResponse]:
+        """Wait for the worker holding `lock_key` to cache `key` for `ttl` seconds, None if it gave up."""
+        self.stats["remote_waiters"] += 1
+        deadline = time.monotonic() + self.lock_ttl
+        while time.monotonic() < deadline:
+            cached = await cache_service.get(key, ttl)
+            if cached is not None:
+                return cached
+            try:
+                peer_done = not await self.storage.exists(lock_key)
+            except Exception as e:
+                # generate here rather than wait on a lock that cannot be read
+                logger.warning(f"⚠️ Could not check generation lock {lock_key}: {e}")
+                return None
+            if peer_done:
+                return await cache_service.get(key, ttl)
+            # woken early by the cache invalidation message for this key
+            await cache_service.wait_for_write(key, timeout=self.poll_interval)
+        return None
+
+    @staticmethod
+    def queue_release(batch: Batch, lock_key: str, token: str):
+        batch.release_lock(lock_key, token)
+
+    async def release(self, lock_key: str, token: str):
+        batch = Batch()
+        batch.release_lock(lock_key, token)
+        try:
+            await self.storage.apply(batch)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not release generation lock {lock_key}: {e}")
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,183 @@
+"""
+Streaming of generated responses to the client while the provider is still writing them.
+The model writes a {"status_code", "headers", "body"} envelope token by token;
+EnvelopeParser picks the status code and headers out of it as soon as the body
+starts (the system prompt asks for them first) and hands out the body's JSON
+text as it arrives. StreamedResponse carries those chunks from the generation,
+which keeps running in its own task, to the client's response.
+"""
+
+import asyncio
+import json
+from typing import AsyncIterator, Awaitable, Optional
+
+from starlette.background import BackgroundTask
+from starlette.responses import StreamingResponse
+
+from app.services.cache import CachedResponse
+
+_DONE = object()
+
+
+class EnvelopeParser:
+    """
+    Incremental parser of the response envelope written by a model.
+    Text before the opening brace (a markdown fence, say) is skipped. Status code
+    and headers written after the body has started are ignored, the client already
+    has them.
+    """
+
+    def __init__(self):
+        self.status_code = 200
+        self.headers: dict = {}
+        self.head_ready = False
+        self.done = False
+        self._state = "start"
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key: list = []
+        self._value: list = []
+        self._body: Optional[list] = None
+
+    def feed(self, text: str) -> str:
+        """Add model output, returns the part of the body's JSON text it contains."""
+        chunk = []
+        for char in text:
+            if self._state == "before_value":
+                if char.isspace():
+                    continue
+                self._start_value()
+            state = self._state
+            if state == "value":
+                if self._in_string:
+                    if self._escape:
+                        self._escape = False
+                    elif char == "\\":
+                        self._escape = True
+                    elif char == '"':
+                        self._in_string = False
+                elif char == '"':
+                    self._in_string = True
+                elif self._depth == 1 and char in ",}":
+                    self._end_value()
+                    if char == "}":
+                        self._state, self.done = "done", True
+                        break
+                    continue
+                elif char in "{[":
+                    self._depth += 1
+                elif char in "}]":
+                    self._depth -= 1
+                if self._key == "body":
+                    chunk.append(char)
+                self._value.append(char)
+            elif state == "key":
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._key, self._state = json.loads('"' + "".join(self._key) + '"'), "colon"
+                    continue
+                self._key.append(char)
+            elif state == "next":
+                if char == '"':
+                    self._key, self._state = [], "key"
+                elif char == "}":
+                    self._state, self.done = "done", True
+                    break
+            elif state == "colon":
+                if char == ":":
+                    self._state = "before_value"
+            elif state == "start":
+                if char == "{":
+                    self._state, self._depth = "next", 1
+        text = "".join(chunk)
+        if self._body is not None:
+            self._body.append(text)
+        return text
+
+    def _start_value(self):
+        self._state, self._value = "value", []
+        if self._key == "body":
+            self._body = []
+            self.head_ready = True
+
+    def _end_value(self):
+        self._state = "next"
+        if self._key == "body" or self.head_ready:
+            return
+        try:
+            value = json.loads("".join(self._value))
+        except ValueError:
+            return
+        if self._key == "status_code":
+            try:
+                self.status_code = int(value)
+            except (TypeError, ValueError):
+                pass
+        elif self._key == "headers" and isinstance(value, dict):
+            self.headers = value
+
+    def result(self) -> dict:
+        """The whole envelope, once the model has finished writing it."""
+        if not self.done:
+            raise ValueError("Streamed response ended before the envelope was complete")
+        body = json.loads("".join(self._body)) if self._body is not None else {}
+        return {"status_code": self.status_code, "headers": self.headers, "body": body}
+
+
+class PreparedStreamingResponse(StreamingResponse):
+    """Streaming response sent with pre-encoded status and headers, see PreparedResponse."""
+
+    def __init__(
+        self, status_code: int, raw_headers: list, content: AsyncIterator[bytes], background: BackgroundTask = None
+    ):
+        self.status_code = status_code
+        self.raw_headers = raw_headers
+        self.body_iterator = content
+        self.background = background
+
+
+class StreamedResponse:
+    """
+    A response whose head is known and whose body is still being generated.
+    `completed` resolves to the outcome of the generation once the whole
+    response is cached, and raises if it failed.
+    """
+
+    def __init__(self, status_code: int, headers: dict):
+        self.status_code = status_code
+        self.raw_headers = CachedResponse.encode_headers(headers) + [(b"content-type", b"application/json")]
+        self.has_body = status_code >= 200 and status_code not in CachedResponse.NO_BODY_STATUSES
+        self.completed: Optional[Awaitable] = None
+        self._chunks: asyncio.Queue = asyncio.Queue()
+
+    def write(self, text: str):
+        if text and self.has_body:
+            self._chunks.put_nowait(text)
+
+    def close(self):
+        self._chunks.put_nowait(_DONE)
+
+    def fail(self, error: BaseException):
+        self._chunks.put_nowait(error)
+
+    async def body(self) -> AsyncIterator[bytes]:
+        while True:
+            parts = [await self._chunks.get()]
+            # one write for everything generated since the last one, not one per token
+            while not self._chunks.empty() and isinstance(parts[-1], str):
+                parts.append(self._chunks.get_nowait())
+            end = parts.pop() if not isinstance(parts[-1], str) else None
+            if parts:
+                yield "".join(parts).encode("utf-8")
+            if isinstance(end, BaseException):
+                # the client sees a truncated response rather than a complete-looking one
+                raise end
+            if end is _DONE:
+                return
+
+    def to_response(self, background: BackgroundTask = None) -> PreparedStreamingResponse:
+        return PreparedStreamingResponse(self.status_code, self.raw_headers, self.body(), background)
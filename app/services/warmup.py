@@ -0,0 +1,236 @@
+"""
+Cache warm-up from an OpenAPI document.
+Every operation is turned into the request a client would send (example
+path parameters, required query parameters, header parameters that are
+required or have an example, and the example body), and its response is
+generated and stored under the cache key that request computes.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+from urllib.parse import urlparse
+
+import yaml
+from starlette.datastructures import Headers
+
+from app.services.cache import cache_service
+from app.services.cache_policy import cache_policy
+from app.services.responder import MockRequest, mock_responder
+
+logger = logging.getLogger(__name__)
+
+HTTP_METHODS = ("get", "post", "put", "patch", "delete", "options")
+
+# example values by schema type and format when the spec has none
+EXAMPLE_VALUES = {
+    "integer": 1,
+    "number": 1,
+    "boolean": "true",
+    "uuid": "00000000-0000-4000-8000-000000000001",
+    "date": "2024-01-01",
+    "date-time": "2024-01-01T00:00:00Z",
+    "email": "user@example.com",
+}
+
+
+class WarmupOperation(NamedTuple):
+    method: str
+    # as the catch-all route sees it: no leading slash, parameters filled in
+    path: str
+    query: Dict[str, str]
+    body: bytes
+    headers: Dict[str, str]
+
+
+class WarmupResult(NamedTuple):
+    operation: WarmupOperation
+    # warmed, cached, busy (another worker is generating it), skipped (not cached by policy) or failed
+    status: str
+    duration_ms: float
+    error: Optional[str] = None
+
+
+def load_spec(source: str) -> dict:
+    """OpenAPI document (JSON or YAML) from a file path or an http(s) URL."""
+    if source.startswith(("http://", "https://")):
+        import httpx
+
+        response = httpx.get(source, timeout=30, follow_redirects=True)
+        response.raise_for_status()
+        text = response.text
+    else:
+        text = Path(source).read_text(encoding="utf-8")
+    spec = yaml.safe_load(text)
+    if not isinstance(spec, dict) or "paths" not in spec:
+        raise ValueError(f"{source} is not an OpenAPI document")
+    return spec
+
+
+def _resolve(spec: dict, node):
+    """Follow a local $ref (#/components/...)."""
+    seen = 0
+    while isinstance(node, dict) and "$ref" in node and seen < 16:
+        target = spec
+        for part in node["$ref"].lstrip("#/").split("/"):
+            target = target.get(part, {}) if isinstance(target, dict) else {}
+        node, seen = target, seen + 1
+    return node if isinstance(node, dict) else {}
+
+
+def _example(spec: dict, node: dict):
+    """Example of a parameter, media type or schema, None when the spec gives none."""
+    if "example" in node:
+        return node["example"]
+    examples = node.get("examples")
+    if isinstance(examples, dict):
+        for example in examples.values():
+            example = _resolve(spec, example)
+            if "value" in example:
+                return example["value"]
+    schema = _resolve(spec, node.get("schema", {}))
+    if schema:
+        if "example" in schema:
+            return schema["example"]
+        if schema.get("enum"):
+            return schema["enum"][0]
+        if "default" in schema:
+            return schema["default"]
+    return None
+
+
+def _parameter_value(spec: dict, parameter: dict) -> str:
+    value = _example(spec, parameter)
+    if value is None:
+        schema = _resolve(spec, parameter.get("schema", {}))
+        value = EXAMPLE_VALUES.get(schema.get("format")) or EXAMPLE_VALUES.get(schema.get("type"), 1)
+    if isinstance(value, bool):
+        return str(value).lower()
+    return str(value)
+
+
+def _base_path(spec: dict) -> str:
+    servers = spec.get("servers") or [{}]
+    return urlparse(servers[0].get("url", "")).path.rstrip("/")
+
+
+def list_operations(spec: dict, methods: Iterable[str] = ("GET",)) -> List[WarmupOperation]:
+    """One request per operation with one of `methods` ("*" for all)."""
+    methods = {method.lower() for method in methods}
+    base_path = _base_path(spec)
+    operations = []
+
+    for template, path_item in (spec.get("paths") or {}).items():
+        path_item = _resolve(spec, path_item)
+        for method in HTTP_METHODS:
+            if method not in path_item or ("*" not in methods and method not in methods):
+                continue
+            operation = path_item[method] or {}
+
+            # operation parameters override path-level ones with the same name and location
+            parameters = {}
+            for parameter in [*path_item.get("parameters", []), *operation.get("parameters", [])]:
+                parameter = _resolve(spec, parameter)
+                parameters[(parameter.get("name"), parameter.get("in"))] = parameter
+
+            path = base_path + template
+            query, headers = {}, {}
+            for (name, location), parameter in parameters.items():
+                if location == "path":
+                    path = path.replace(f"{{{name}}}", _parameter_value(spec, parameter))
+                elif location == "query" and parameter.get("required"):
+                    query[name] = _parameter_value(spec, parameter)
+                elif location == "header" and (parameter.get("required") or _example(spec, parameter) is not None):
+                    headers[name] = _parameter_value(spec, parameter)
+
+            body = b""
+            content = _resolve(spec, operation.get("requestBody", {})).get("content", {})
+            if "application/json" in content:
+                example = _example(spec, content["application/json"])
+                if example is not None:
+                    body = json.dumps(example).encode()
+
+            operations.append(WarmupOperation(method.upper(), path.lstrip("/"), query, body, headers))
+
+    return operations
+
+
+async def warm_operation(operation: WarmupOperation, session_id: str, force: bool = False) -> WarmupResult:
+    started = time.perf_counter()
+    rule = cache_policy.match(operation.method, operation.path)
+    if not rule.cache:
+        return WarmupResult(operation, "skipped", 0.0)
+
+    headers = Headers(headers=operation.headers)
+    missing = [name for name in rule.key.headers if name not in headers]
+    if missing:
+        # real requests would send these headers, a key without them would never be hit
+        return WarmupResult(operation, "skipped", 0.0, f"cache key uses headers the spec has no value for: {missing}")
+
+    cache_key = cache_service.get_cache_key(
+        session_id, operation.method, operation.path, operation.body, query=operation.query, headers=headers, rule=rule
+    )
+    request = MockRequest(session_id, operation.method, operation.path, operation.body, rule, cache_key)
+    try:
+        outcome = await mock_responder.prefill(request, force=force)
+    except Exception as e:
+        return WarmupResult(operation, "failed", (time.perf_counter() - started) * 1000, str(e))
+
+    status = {"miss": "warmed", "l2": "cached", "coalesced": "busy"}[outcome.source]
+    return WarmupResult(operation, status, (time.perf_counter() - started) * 1000)
+
+
+async def warm_cache(
+    operations: List[WarmupOperation],
+    session_id: str,
+    concurrency: int = 4,
+    force: bool = False,
+    on_result: Optional[Callable[[WarmupResult], None]] = None,
+) -> List[WarmupResult]:
+    """Generate responses for `operations`, at most `concurrency` provider calls at a time."""
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def warm(operation: WarmupOperation) -> WarmupResult:
+        async with semaphore:
+            result = await warm_operation(operation, session_id, force)
+        if on_result is not None:
+            on_result(result)
+        return result
+
+    return await asyncio.gather(*(warm(operation) for operation in operations))
+
+
+def summarize(results: List[WarmupResult], elapsed: float) -> dict:
+    summary = {"operations": len(results), "elapsed_s": round(elapsed, 2)}
+    for result in results:
+        summary[result.status] = summary.get(result.status, 0) + 1
+    return summary
+
+
+async def warm_from_spec(
+    source: str, session_id: str, concurrency: int = 4, methods: Iterable[str] = ("GET",), force: bool = False
+) -> dict:
+    """Warm-up run at startup; progress goes to the log."""
+
+    def report(result: WarmupResult):
+        operation = result.operation
+        message = f"Warm-up {operation.method} /{operation.path}: {result.status} in {result.duration_ms:.0f}ms"
+        if result.error:
+            logger.warning(f"⚠️ {message}: {result.error}")
+        else:
+            logger.info(message)
+
+    started = time.perf_counter()
+    try:
+        operations = list_operations(await asyncio.to_thread(load_spec, source), methods)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not read warm-up spec {source}: {e}")
+        return {}
+
+    results = await warm_cache(operations, session_id, concurrency, force, on_result=report)
+    summary = summarize(results, time.perf_counter() - started)
+    logger.info(f"Cache warm-up finished: {summary}")
+    return summary
@@ -0,0 +1,90 @@
+"""
+Concurrent-request throughput of the mock hot path.
+
+Fires N requests from C concurrent clients at the catch-all route through an
+in-process ASGI transport. All requests share one cache key, so after the first
+(miss) request the numbers isolate the cost of Redis I/O on the event loop.
+
+With --backend redis (the default) it needs a reachable Redis
+(HELIX_REDIS_HOST / HELIX_REDIS_PORT); memory and sqlite run standalone.
+
+Usage:
+    python benchmarks/bench_concurrency.py --requests 2000 --concurrency 200
+    python benchmarks/bench_concurrency.py --backend memory
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+
+from app.database.core import storage  # noqa: E402
+from app.database.core.config import settings  # noqa: E402
+from app.routes.requestbased import catch_all  # noqa: E402
+
+
+async def run(total: int, concurrency: int, path: str) -> dict:
+    app = FastAPI()
+    app.include_router(catch_all.router)
+
+    await storage.init_storage().start()
+
+    transport = httpx.ASGITransport(app=app)
+    latencies = []
+    queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(None)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        headers = {"X-Session-ID": "bench_session"}
+        await client.get(path, headers=headers)  # prime the cache
+
+        async def worker():
+            while not queue.empty():
+                queue.get_nowait()
+                started = time.perf_counter()
+                response = await client.get(path, headers=headers)
+                latencies.append((time.perf_counter() - started) * 1000)
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    await storage.close_storage()
+
+    latencies.sort()
+    return {
+        "backend": settings.STORAGE_BACKEND,
+        "requests": total,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--path", default="/api/users")
+    parser.add_argument("--backend", choices=["redis", "memory", "sqlite"], default=settings.STORAGE_BACKEND)
+    args = parser.parse_args()
+    settings.STORAGE_BACKEND = args.backend
+
+    result = asyncio.run(run(args.requests, args.concurrency, args.path))
+    for key, value in result.items():
+        print(f"{key:>12}: {value}")
+
+
+if __name__ == "__main__":
+    main()
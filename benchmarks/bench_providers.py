@@ -0,0 +1,135 @@
+"""
+AI provider request latency with and without the pooled HTTP client.
+
+Runs a local stand-in for an OpenAI-compatible API (answering instantly, so
+only connection setup and transport are measured) and sends the same
+generation through the Groq provider, once with a fresh client per request
+(loading the CA bundle, then a TCP and, with --tls, a TLS handshake each
+time) and once through the provider's pooled keep-alive client.
+
+--tls serves https with a throwaway self-signed certificate made with the
+openssl command line tool, trusted next to the usual CA bundle.
+
+Usage:
+    python benchmarks/bench_providers.py --requests 200
+    python benchmarks/bench_providers.py --tls
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import certifi  # noqa: E402
+import uvicorn  # noqa: E402
+
+from app.services.ai.providers import GroqProvider  # noqa: E402
+
+COMPLETION = json.dumps(
+    {"choices": [{"message": {"content": json.dumps({"status_code": 200, "body": {"id": 1, "name": "Ann"}})}}]}
+).encode()
+
+
+async def stand_in(scope, receive, send):
+    """OpenAI-compatible chat completions and model list, answered at once."""
+    if scope["type"] != "http":
+        return
+    while (await receive()).get("more_body"):
+        pass
+    body = COMPLETION if scope["path"].endswith("/chat/completions") else b'{"data": []}'
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": body})
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def self_signed(workdir: str):
+    key, cert = str(Path(workdir) / "key.pem"), str(Path(workdir) / "cert.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-keyout", key, "-out", cert,
+         "-subj", "/CN=localhost", "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1"],
+        check=True,
+        capture_output=True,
+    )  # fmt: skip
+    return key, cert
+
+
+def serve(port: int, key: str = None, cert: str = None) -> uvicorn.Server:
+    config = uvicorn.Config(stand_in, port=port, log_level="warning", ssl_keyfile=key, ssl_certfile=cert)
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def measure(provider: GroqProvider, total: int, pooled: bool) -> list:
+    latencies = []
+    for _ in range(total):
+        if not pooled:
+            # what every request paid before: a new client, so a new connection
+            await provider.close()
+        started = time.perf_counter()
+        await provider.generate_response("GET", "/api/users/1", system_prompt="bench")
+        latencies.append((time.perf_counter() - started) * 1000)
+    await provider.close()
+    return latencies
+
+
+async def run(total: int, tls: bool) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        port = free_port()
+        key = cert = None
+        if tls:
+            key, cert = self_signed(workdir)
+            # the providers' clients verify against the default CA bundle, or this file when it is set
+            bundle = Path(workdir) / "bundle.pem"
+            bundle.write_text(Path(certifi.where()).read_text() + Path(cert).read_text())
+            os.environ["SSL_CERT_FILE"] = str(bundle)
+        server = serve(port, key, cert)
+
+        provider = GroqProvider(api_key="bench", model="bench")
+        provider.base_url = f"{'https' if tls else 'http'}://localhost:{port}"
+        # first connection, imports and prompt building out of the way
+        await provider.generate_response("GET", "/api/users/1", system_prompt="bench")
+
+        per_request = await measure(provider, total, pooled=False)
+        pooled = await measure(provider, total, pooled=True)
+        server.should_exit = True
+
+    result = {"requests": total, "transport": "https" if tls else "http"}
+    for name, latencies in (("new_client", per_request), ("pooled", pooled)):
+        latencies.sort()
+        result[f"{name}_p50_ms"] = round(statistics.median(latencies), 3)
+        result[f"{name}_p99_ms"] = round(latencies[int(len(latencies) * 0.99) - 1], 3)
+    result["saved_per_request_ms"] = round(statistics.mean(per_request) - statistics.mean(pooled), 3)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--tls", action="store_true", help="serve https with a self-signed certificate")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.requests, args.tls))
+    for key, value in result.items():
+        print(f"{key:>22}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Storage primitives per backend.
+
+Times the two operations every cache miss makes (the combined lookup and the
+atomic write-back batch) and the single read of an L2 hit, against each
+storage backend. The Redis backend needs a reachable server
+(HELIX_REDIS_HOST / HELIX_REDIS_PORT) and is skipped otherwise.
+
+Usage:
+    python benchmarks/bench_storage.py --ops 5000
+    python benchmarks/bench_storage.py --backend sqlite --backend memory
+"""
+
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.database.backends import Batch, MemoryBackend, RedisBackend, SqliteBackend  # noqa: E402
+
+
+def create(name: str, workdir: str):
+    if name == "memory":
+        return MemoryBackend()
+    if name == "sqlite":
+        return SqliteBackend(str(Path(workdir) / "bench.db"))
+    return RedisBackend()
+
+
+async def run(name: str, ops: int, workdir: str) -> dict:
+    backend = create(name, workdir)
+    if not await backend.ping():
+        return {"backend": name, "skipped": "not reachable"}
+    await backend.start()
+
+    payload = b"HXR1" + b"x" * 2048
+    entry = b'{"method": "GET", "path": "/api/users"}' * 10
+    timings = {}
+
+    started = time.perf_counter()
+    for i in range(ops):
+        await backend.lookup(f"bench:{i}", f"bench:lock:{i}", "token", 30, "bench:context", 5, magic=(b"HXR1",))
+    timings["lookup_us"] = (time.perf_counter() - started) / ops * 1e6
+
+    started = time.perf_counter()
+    for i in range(ops):
+        batch = Batch()
+        batch.set(f"bench:{i}", payload, 60)
+        batch.publish("bench:channel", f"bench:{i}")
+        batch.push("bench:context", [entry], 5, 60)
+        batch.release_lock(f"bench:lock:{i}", "token")
+        await backend.apply(batch, atomic=True)
+    timings["write_back_us"] = (time.perf_counter() - started) / ops * 1e6
+
+    started = time.perf_counter()
+    for i in range(ops):
+        await backend.get(f"bench:{i}")
+    timings["get_us"] = (time.perf_counter() - started) / ops * 1e6
+
+    cleanup = Batch()
+    for i in range(ops):
+        cleanup.delete(f"bench:{i}")
+    cleanup.delete("bench:context")
+    await backend.apply(cleanup)
+    await backend.close()
+
+    return {"backend": name, "ops": ops, **{key: round(value, 1) for key, value in timings.items()}}
+
+
+async def main_async(backends: list, ops: int) -> list:
+    with tempfile.TemporaryDirectory() as workdir:
+        return [await run(name, ops, workdir) for name in backends]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ops", type=int, default=5000)
+    parser.add_argument("--backend", action="append", choices=["redis", "memory", "sqlite"])
+    args = parser.parse_args()
+
+    for result in asyncio.run(main_async(args.backend or ["memory", "sqlite", "redis"], args.ops)):
+        print("  ".join(f"{key}: {value}" for key, value in result.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,9 @@ from unittest.mock import MagicMock, patch
 
 import pytest
 
+from app.database.backends import MemoryBackend
+from app.database.core import storage
+
 
 @pytest.fixture
 def mock_env_vars():
@@ -23,3 +26,11 @@ def sample_data():
         "user": {"id": 1, "username": "testuser", "email": "test@example.com"},
         "project": {"id": 1, "name": "Test Project", "description": "A test project"},
     }
+
+
+@pytest.fixture
+def memory_storage(monkeypatch):
+    """Fixture replacing the configured storage backend with an in-memory one."""
+    backend = MemoryBackend()
+    monkeypatch.setattr(storage, "_storage", backend)
+    return backend
@@ -58,3 +58,17 @@ class TestSampleData:
         assert "id" in project
         assert "name" in project
         assert len(project["name"]) > 0
+
+
+class TestHealth:
+    """Tests for the /health payload."""
+
+    @pytest.mark.asyncio
+    async def test_health_keeps_redis_key(self, memory_storage):
+        """Test that probes reading services.redis keep working with any storage backend."""
+        from app.routes.ui.health import health_check
+
+        payload = await health_check()
+
+        assert payload["services"]["redis"] == "up"
+        assert payload["services"]["storage"] == memory_storage.name
@@ -0,0 +1,184 @@
+"""
+Tests for the in-process (L1) response cache.
+"""
+
+import json
+import time
+
+import pytest
+
+from app.database.backends import Batch
+from app.services.cache import CachedResponse, LocalCache, cache_service
+
+
+class TestLocalCache:
+    """Tests for the byte-budgeted LRU/TTL cache."""
+
+    def test_get_returns_stored_value(self):
+        """Test that a stored value is returned."""
+        cache = LocalCache(max_bytes=100, ttl=60)
+        cache.set("a", {"id": 1}, size=10)
+        assert cache.get("a") == {"id": 1}
+        assert cache.size == 10
+
+    def test_evicts_least_recently_used_by_size(self):
+        """Test that the byte budget evicts the least recently used entries."""
+        cache = LocalCache(max_bytes=25, ttl=60)
+        cache.set("a", "A", size=10)
+        cache.set("b", "B", size=10)
+        cache.get("a")
+        cache.set("c", "C", size=10)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == "A"
+        assert cache.get("c") == "C"
+        assert cache.size == 20
+
+    def test_oversized_entry_is_not_stored(self):
+        """Test that an entry larger than the whole budget is skipped."""
+        cache = LocalCache(max_bytes=10, ttl=60)
+        cache.set("a", "A", size=11)
+        assert cache.get("a") is None
+        assert cache.size == 0
+
+    def test_expired_entry_is_dropped(self, monkeypatch):
+        """Test that entries expire after their TTL."""
+        cache = LocalCache(max_bytes=100, ttl=60)
+        cache.set("a", "A", size=1, ttl=5)
+
+        now = time.monotonic()
+        monkeypatch.setattr(time, "monotonic", lambda: now + 6)
+        assert cache.get("a") is None
+        assert len(cache) == 0
+
+    def test_overwrite_keeps_size_accounting(self):
+        """Test that overwriting a key does not double count its size."""
+        cache = LocalCache(max_bytes=100, ttl=60)
+        cache.set("a", "A", size=10)
+        cache.set("a", "AA", size=20)
+        assert cache.size == 20
+        cache.delete("a")
+        assert cache.size == 0
+
+
+class TestCachedResponse:
+    """Tests for the pre-serialized response envelope."""
+
+    def test_round_trip(self):
+        """Test that encode/decode keeps status, headers and body bytes."""
+        prepared = CachedResponse.from_data(
+            {"status_code": 201, "headers": {"Location": "/users/1"}, "body": {"id": "1", "name": "Zoë"}}
+        )
+        restored = CachedResponse.decode(prepared.encode())
+
+        assert restored.status_code == 201
+        assert restored.body == prepared.body
+        assert json.loads(restored.body) == {"id": "1", "name": "Zoë"}
+        assert (b"location", b"/users/1") in restored.raw_headers
+        assert (b"content-length", str(len(prepared.body)).encode()) in restored.raw_headers
+        assert restored.created_at == prepared.created_at
+
+    def test_no_content_has_empty_body(self):
+        """Test that 204 responses carry no body or content-length."""
+        prepared = CachedResponse.from_data({"status_code": 204, "body": {}})
+        assert prepared.body == b""
+        assert all(name != b"content-length" for name, _ in prepared.raw_headers)
+
+    def test_unknown_payload_is_a_miss(self):
+        """Test that values not written by this format decode to None."""
+        assert CachedResponse.decode(b'{"status_code": 200}') is None
+
+
+class TestL2Fill:
+    """Tests for keeping responses read from storage in L1."""
+
+    @pytest.mark.asyncio
+    async def test_l1_copy_expires_with_the_stored_entry(self, memory_storage, monkeypatch):
+        """Test that a response read from storage stays in L1 no longer than its hard TTL has left."""
+        monkeypatch.setattr(cache_service, "local", LocalCache(max_bytes=10000, ttl=60))
+        now = time.time()
+        keys = {"fresh": 0, "aging": 90, "expired": 120}
+        batch = Batch()
+        for key, age in keys.items():
+            batch.set(key, CachedResponse(200, [], b"{}", created_at=now - age).encode(), 600)
+        await memory_storage.apply(batch)
+
+        for key in keys:
+            assert await cache_service.get(key, ttl=100) is not None
+
+        started = time.monotonic()
+        monkeypatch.setattr(time, "monotonic", lambda: started + 11)
+        assert cache_service.get_local("fresh") is not None
+        assert cache_service.get_local("aging") is None
+        assert cache_service.get_local("expired") is None
+
+
+async def store(method, path, session="s1"):
+    key = f"{{{session}}}:{method}:{path}:0"
+    batch = Batch()
+    cache_service.queue_set(
+        batch, key, CachedResponse.from_data({"body": {}}), tags=cache_service.index_tags(method, path)
+    )
+    await cache_service.storage.apply(batch)
+    return key
+
+
+class TestPurge:
+    """Tests for purging through the secondary indexes."""
+
+    @pytest.mark.asyncio
+    async def test_purge_by_path_prefix_and_method(self, memory_storage):
+        """Test that purges match whole path segments and can be narrowed to a method."""
+        users = await store("GET", "api/users")
+        user = await store("GET", "api/users/1")
+        created = await store("POST", "api/users")
+        usernames = await store("GET", "api/usernames")
+
+        assert await cache_service.purge("/api/users/", "post") == 1
+        assert await memory_storage.get(created) is None
+        assert await memory_storage.get(users) is not None
+
+        assert await cache_service.purge("api/users") == 2
+        assert [await memory_storage.get(key) for key in (users, user)] == [None, None]
+        assert cache_service.get_local(user) is None
+        assert await memory_storage.get(usernames) is not None
+
+    @pytest.mark.asyncio
+    async def test_purged_keys_leave_every_index(self, memory_storage):
+        """Test that later purges neither find nor count keys an earlier purge deleted."""
+        await store("GET", "users/1")
+        await store("GET", "users/2")
+        posts = await store("GET", "posts/1")
+
+        assert await cache_service.purge("users") == 2
+        assert await memory_storage.tagged(["method:GET"]) == [posts]
+        assert await cache_service.purge(method="GET") == 1
+        assert await memory_storage.tagged(["path:posts"]) == []
+
+    @pytest.mark.asyncio
+    async def test_purge_counts_only_existing_keys(self, memory_storage):
+        """Test that index entries of keys already gone are cleaned up without being counted."""
+        gone = await store("GET", "users/1")
+        batch = Batch()
+        batch.delete(gone)
+        await memory_storage.apply(batch)
+
+        assert await cache_service.purge("users") == 0
+        assert await memory_storage.tagged(["path:users"]) == []
+
+    @pytest.mark.asyncio
+    async def test_purge_below_indexed_depth(self, memory_storage):
+        """Test that prefixes deeper than the index are filtered from the deepest indexed one."""
+        deep = "/".join(f"p{i}" for i in range(10))
+        kept = await store("GET", deep[:-3])
+        purged = await store("GET", deep + "/leaf")
+
+        assert await cache_service.purge(deep) == 1
+        assert await memory_storage.get(purged) is None
+        assert await memory_storage.get(kept) is not None
+
+    @pytest.mark.asyncio
+    async def test_purge_needs_a_filter(self, memory_storage):
+        """Test that an empty purge is refused rather than flushing everything."""
+        with pytest.raises(ValueError):
+            await cache_service.purge()
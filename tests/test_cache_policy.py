@@ -0,0 +1,93 @@
+"""
+Tests for declarative cache policy rules.
+"""
+
+from app.services.cache_policy import CacheKeySpec, CachePolicy, load_cache_policy
+
+
+class TestCachePolicyMatching:
+    """Tests for rule selection."""
+
+    def test_first_matching_rule_wins(self):
+        """Test that rules are checked in order."""
+        policy = CachePolicy.model_validate(
+            {
+                "rules": [
+                    {"match": {"methods": ["get"], "path": "/api/reports*"}, "ttl": 60},
+                    {"match": {"methods": ["*"], "path": "/api/*"}, "ttl": 120},
+                ]
+            }
+        )
+        assert policy.match("GET", "api/reports/daily").ttl == 60
+        assert policy.match("POST", "api/reports/daily").ttl == 120
+
+    def test_default_rule_applies_without_match(self):
+        """Test that the default rule is used when nothing matches."""
+        policy = CachePolicy.model_validate({"default": {"ttl": 30}, "rules": [{"match": {"path": "/x"}}]})
+        assert policy.match("GET", "/users").ttl == 30
+
+    def test_shipped_policy_skips_post(self):
+        """Test that the bundled policy file never caches creates."""
+        policy = load_cache_policy("assets/cache/policy.yaml")
+        assert policy.match("POST", "/api/users").cache is False
+        assert policy.match("GET", "/api/users").cache is True
+
+    def test_missing_policy_file_uses_defaults(self):
+        """Test that a missing policy file caches everything."""
+        policy = load_cache_policy("does/not/exist.yaml")
+        assert policy.match("POST", "/api/users").cache is True
+
+
+class TestCacheKeySpec:
+    """Tests for cache key composition."""
+
+    def test_raw_body_is_hashed_as_sent(self):
+        """Test that raw mode hashes body bytes without decoding."""
+        spec = CacheKeySpec(body="raw")
+        assert spec.digest(b'{"a":1}') == spec.digest(b'{"a":1}')
+        assert spec.digest(b'{"a":1}') != spec.digest(b'{"a": 1}')
+
+    def test_body_is_canonicalized(self):
+        """Test that key order in the body does not change a canonical key."""
+        spec = CacheKeySpec()
+        assert spec.body == "canonical"
+        assert spec.digest(b'{"a": 1, "b": 2}') == spec.digest(b'{"b":2,"a":1}')
+        assert spec.digest(b"not json") == spec.digest(b"not json")
+
+    def test_query_params_change_the_key(self):
+        """Test that query strings are part of the key by default."""
+        spec = CacheKeySpec()
+        assert spec.digest(query={"page": "1"}) != spec.digest(query={"page": "2"})
+        assert spec.digest(query={"a": "1", "b": "2"}) == spec.digest(query={"b": "2", "a": "1"})
+
+    def test_selected_query_params_only(self):
+        """Test that only listed query params are hashed."""
+        spec = CacheKeySpec(query=["page"])
+        assert spec.digest(query={"page": "1", "ts": "1"}) == spec.digest(query={"page": "1", "ts": "2"})
+
+    def test_selected_headers(self):
+        """Test that listed headers are part of the key."""
+        spec = CacheKeySpec(headers=["Accept-Language"])
+        assert spec.digest(headers={"Accept-Language": "en"}) != spec.digest(headers={"Accept-Language": "de"})
+
+    def test_body_can_be_ignored(self):
+        """Test that body mode 'none' ignores the body."""
+        spec = CacheKeySpec(body="none")
+        assert spec.digest(b'{"a": 1}') == spec.digest(b'{"a": 2}')
+
+
+class TestStaleWhileRevalidate:
+    """Tests for soft TTL handling."""
+
+    def test_entry_is_stale_after_soft_ttl(self):
+        """Test that entries older than the soft TTL are stale."""
+        policy = CachePolicy.model_validate({"default": {"ttl": 600, "soft_ttl": 60}})
+        rule = policy.match("GET", "/users")
+        assert not rule.is_stale(created_at=1000, now=1050)
+        assert rule.is_stale(created_at=1000, now=1061)
+
+    def test_soft_ttl_not_below_hard_ttl_is_ignored(self):
+        """Test that a soft TTL at or above the hard TTL disables SWR."""
+        policy = CachePolicy.model_validate({"default": {"ttl": 60, "soft_ttl": 60}})
+        assert policy.default.soft_ttl is None
+        assert not policy.default.is_stale(created_at=0, now=59)
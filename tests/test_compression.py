@@ -0,0 +1,73 @@
+"""
+Tests for compression of stored values.
+"""
+
+import os
+
+import pytest
+
+from app.database.backends import Batch, Codec, CompressedBackend, MemoryBackend
+from app.database.backends.compression import MARKER
+
+LARGE = b'{"items": [' + b",".join(b'{"id": %d, "name": "user"}' % i for i in range(200)) + b"]}"
+
+
+class TestCodec:
+    """Tests for encoding and decoding single values."""
+
+    def test_large_values_round_trip_compressed(self):
+        """Test that values over the threshold are compressed and tagged."""
+        codec = Codec("zlib", min_bytes=1024)
+
+        stored = codec.encode(LARGE)
+
+        assert stored.startswith(MARKER)
+        assert len(stored) < len(LARGE)
+        assert codec.decode(stored) == LARGE
+        assert codec.get_stats()["ratio"] > 1
+
+    def test_small_and_incompressible_values_are_stored_as_is(self):
+        """Test that compression is skipped when it does not pay off."""
+        codec = Codec("zlib", min_bytes=1024)
+        noise = os.urandom(2048)
+
+        assert codec.encode(b'{"id": 1}') == b'{"id": 1}'
+        assert codec.encode(noise) == noise
+        assert codec.stats["skipped"] == 1
+
+    def test_uncompressed_values_are_read_unchanged(self):
+        """Test that values written before compression was enabled are still readable."""
+        codec = Codec("zlib")
+
+        assert codec.decode(b'{"legacy": true}') == b'{"legacy": true}'
+        assert codec.decode(b"HXR1envelope") == b"HXR1envelope"
+        assert codec.decode(None) is None
+
+    def test_corrupt_values_read_as_missing(self):
+        """Test that an undecodable value is reported, not raised."""
+        codec = Codec("zlib")
+
+        assert codec.decode(MARKER + b"\x01not zlib") is None
+        assert codec.stats["errors"] == 1
+
+
+class TestCompressedBackend:
+    """Tests for compression applied through the storage layer."""
+
+    @pytest.mark.asyncio
+    async def test_cached_envelopes_and_context_entries(self):
+        """Test that compressed envelopes pass the lookup magic check and context is decoded."""
+        inner = MemoryBackend()
+        backend = CompressedBackend(inner, Codec("zlib", min_bytes=1024))
+        envelope = b"HXR1" + LARGE
+
+        batch = Batch()
+        batch.set("k", envelope, 60)
+        batch.push("ctx", [LARGE, b'{"small": 1}'], 5)
+        await backend.apply(batch)
+
+        assert (await inner.get("k")).startswith(MARKER)
+        hit = await backend.lookup("k", "lock", "t", 30, "ctx", 5, magic=(b"HXR1",))
+        assert hit.cached == envelope
+        miss = await backend.lookup("other", "lock", "t", 30, "ctx", 5, magic=(b"HXR1",))
+        assert miss.context == [b'{"small": 1}', LARGE]
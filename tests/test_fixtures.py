@@ -0,0 +1,150 @@
+"""
+Tests for recording and replaying responses through fixture files.
+"""
+
+import pytest
+
+from app.services.cache import CachedResponse
+from app.services.fixtures import FixtureReader, FixtureService, FixtureWriter, build_index, list_segments
+
+
+def replay(directory):
+    build_index(directory)
+    reader = FixtureReader(directory)
+    reader.open()
+    return reader
+
+
+@pytest.fixture
+def service_for(tmp_path):
+    def make(mode):
+        service = FixtureService()
+        service.mode, service.directory = mode, tmp_path
+        service.start()
+        return service
+
+    return make
+
+
+class TestFixtureFiles:
+    """Tests for the segment and index format."""
+
+    def test_newest_record_wins_across_segments(self, tmp_path):
+        """Test lookups over several segments, with a key recorded twice."""
+        writer = FixtureWriter(tmp_path, segment_bytes=64)
+        writer.open()
+        for i in range(20):
+            writer.append(f"k{i}".encode(), b"v%d" % i)
+        writer.append(b"k3", b"newer")
+        writer.close()
+
+        reader = replay(tmp_path)
+
+        assert len(list_segments(tmp_path)) > 1
+        assert reader.records == 20
+        assert reader.get("k7") == b"v7"
+        assert reader.get("k3") == b"newer"
+        assert reader.get("missing") is None
+        reader.close()
+
+    def test_torn_record_is_dropped_when_recording_resumes(self, tmp_path):
+        """Test that a crash mid-record loses that record only."""
+        writer = FixtureWriter(tmp_path, segment_bytes=1024)
+        writer.open()
+        writer.append(b"kept", b"value")
+        writer.close()
+        (segment,) = [path for _, path in list_segments(tmp_path)]
+        with open(segment, "ab") as f:
+            f.write(b"\x05\x00\x00\x00\xff\xff")
+
+        writer = FixtureWriter(tmp_path, segment_bytes=1024)
+        writer.open()
+        writer.append(b"after", b"crash")
+        writer.close()
+
+        reader = replay(tmp_path)
+        assert (reader.get("kept"), reader.get("after")) == (b"value", b"crash")
+        reader.close()
+
+    def test_concurrent_writers_get_a_segment_each(self, tmp_path):
+        """Test that workers recording at once never write over each other's records."""
+        first = FixtureWriter(tmp_path, segment_bytes=1024)
+        first.open()
+        first.append(b"first-0", b"a")
+        second = FixtureWriter(tmp_path, segment_bytes=1024)
+        second.open()
+        for i in range(1, 10):
+            first.append(b"first-%d" % i, b"a")
+            second.append(b"second-%d" % i, b"b")
+        first.close()
+        second.close()
+
+        reader = replay(tmp_path)
+
+        assert len(list_segments(tmp_path)) == 2
+        assert reader.records == 19
+        assert reader.get("first-0") == b"a" and reader.get("second-9") == b"b"
+        reader.close()
+
+        # once nobody holds it, the newest segment is appended to again
+        writer = FixtureWriter(tmp_path, segment_bytes=1024)
+        writer.open()
+        writer.close()
+        assert len(list_segments(tmp_path)) == 2
+
+
+class TestFixtureService:
+    """Tests for record and replay modes."""
+
+    def test_recorded_responses_replay_as_sent(self, service_for):
+        """Test a record run followed by a replay run, repeats recorded once."""
+        recorder = service_for("record")
+        response = CachedResponse.from_data({"status_code": 201, "headers": {"X-Id": "7"}, "body": {"id": 7}})
+        recorder.record("s:POST:api/users:abc", response)
+        recorder.record("s:POST:api/users:abc", CachedResponse(201, response.raw_headers, response.body))
+        recorder.stop()
+
+        player = service_for("replay")
+        outcome = player.respond("s:POST:api/users:abc")
+        player.stop()
+
+        assert recorder.stats["recorded"] == 1 and recorder.stats["unchanged"] == 1
+        assert outcome.source == "fixture"
+        assert (outcome.response.status_code, outcome.response.body) == (201, b'{"id":7}')
+        assert (b"x-id", b"7") in outcome.response.raw_headers
+
+    def test_replay_rebuilds_an_index_older_than_its_segments(self, service_for):
+        """Test that records written after the index, by a recording that never stopped cleanly, still replay."""
+        recorder = service_for("record")
+        recorder.record("first", CachedResponse.from_data({"body": {"n": 1}}))
+        recorder.stop()
+        # the second run is killed: its records are on disk, the index is the first run's
+        crashed = service_for("record")
+        crashed.record("second", CachedResponse.from_data({"body": {"n": 2}}))
+        crashed._writer.close()
+
+        player = service_for("replay")
+        outcome = player.respond("second")
+        player.stop()
+
+        assert outcome.source == "fixture"
+        assert outcome.response.body == b'{"n":2}'
+
+    def test_unrecorded_request_is_a_404(self, service_for):
+        """Test that replay never falls back to generating a response."""
+        recorder = service_for("record")
+        recorder.record("known", CachedResponse.from_data({"body": {}}))
+        recorder.stop()
+
+        player = service_for("replay")
+        outcome = player.respond("unknown")
+        player.stop()
+
+        assert outcome.source == "fixture_miss"
+        assert outcome.response.status_code == 404
+        assert player.get_stats()["misses"] == 1
+
+    def test_replay_without_fixtures_fails_at_startup(self, service_for):
+        """Test that an empty fixture directory is an error, not a server that 404s everything."""
+        with pytest.raises(FileNotFoundError):
+            service_for("replay")
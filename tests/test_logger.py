@@ -0,0 +1,116 @@
+"""
+Tests for the batched request-log writer.
+"""
+
+import random
+
+import pytest
+
+from app.database.backends import MemoryBackend
+from app.database.core import storage
+from app.services.logger import LoggerService
+
+
+class CountingStorage(MemoryBackend):
+    """In-memory storage that records every batch written."""
+
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    async def apply(self, batch, atomic=False):
+        self.batches.append(batch)
+        await super().apply(batch, atomic)
+
+
+@pytest.fixture
+def stub_storage(monkeypatch):
+    backend = CountingStorage()
+    monkeypatch.setattr(storage, "_storage", backend)
+    return backend
+
+
+def log(service, n):
+    for i in range(n):
+        service.log_request("GET", f"/api/{i}", 200, 1.0, b"", b'{"i": %d}' % i)
+
+
+class TestLogWriter:
+    """Tests for batching, overflow and shutdown."""
+
+    @pytest.mark.asyncio
+    async def test_stop_flushes_queue_in_batches(self, stub_storage):
+        """Test that shutdown writes every queued entry, one pipeline per batch."""
+        service = LoggerService()
+        service.batch_size = 10
+        service.flush_interval = 60
+
+        log(service, 25)
+        await service.stop()
+
+        assert len(stub_storage.batches) == 3
+        assert service.stats["written"] == 25
+        assert not service._queue
+        assert b'"path": "/api/24"' in (await stub_storage.range(service.log_key))[0]
+
+    @pytest.mark.asyncio
+    async def test_only_newest_entries_are_serialised(self, stub_storage):
+        """Test that a batch larger than the log only pushes what LTRIM keeps."""
+        service = LoggerService()
+        service.max_logs = 5
+        service.flush_interval = 60
+
+        log(service, 20)
+        await service.stop()
+
+        entries = await stub_storage.range(service.log_key)
+        assert len(stub_storage.batches[0].ops[0][2]) == 5
+        assert len(entries) == 5
+        assert b'"path": "/api/19"' in entries[0]
+
+    @pytest.mark.parametrize(
+        "policy, first_path",
+        [("drop", "/api/0"), ("drop_oldest", "/api/5")],
+    )
+    def test_overflow_policy(self, policy, first_path):
+        """Test which entries survive a full queue."""
+        service = LoggerService()
+        service._closing = True  # no writer, no event loop needed
+        service.queue_size = 5
+        service.overflow_policy = policy
+
+        log(service, 10)
+
+        assert len(service._queue) == 5
+        assert service._queue[0][2] == first_path
+        assert service.stats["dropped"] == 5
+
+    def test_sample_policy_keeps_queue_bounded(self):
+        """Test that sampling replaces queued entries instead of growing the queue."""
+        service = LoggerService()
+        service._closing = True
+        service.queue_size = 5
+        service.overflow_policy = "sample"
+
+        log(service, 100)
+
+        assert len(service._queue) == 5
+        assert service.stats["dropped"] == 95
+
+    def test_sample_policy_keeps_every_request_equally_likely(self):
+        """Test that sampling does not favour the most recent requests."""
+        service = LoggerService()
+        service._closing = True
+        service.queue_size = 10
+        service.overflow_policy = "sample"
+        random.seed(7)
+
+        kept = []
+        for _ in range(200):
+            service._queue.clear()
+            service._seen = 0
+            log(service, 100)
+            kept.extend(entry[2] for entry in service._queue)
+
+        early = sum(1 for path in kept if int(path.rpartition("/")[2]) < 50)
+        assert 0.4 < early / len(kept) < 0.6
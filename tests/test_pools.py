@@ -0,0 +1,121 @@
+"""
+Tests for answering misses from pools of pre-generated items.
+"""
+
+import asyncio
+
+import pytest
+
+from app.services.ai.manager import ai_manager
+from app.services.ai.providers import DemoProvider
+from app.services.cache import cache_service
+from app.services.cache_policy import cache_policy
+from app.services.pools import ResponsePools
+from app.services.responder import MockRequest, mock_responder
+from app.services.sessions import session_index
+
+
+@pytest.fixture
+def pools(monkeypatch):
+    """Fixture of enabled pools generating with the demo provider, counting provider calls."""
+    demo = DemoProvider()
+    calls = []
+
+    async def generate_response(method, path, body=None, context=None, system_prompt=None):
+        calls.append((method, path, body))
+        return await demo.generate_response(method, path, body, context)
+
+    monkeypatch.setattr(ai_manager, "generate_response", generate_response)
+    pools = ResponsePools()
+    pools.enabled, pools.batch_size, pools.min_items, pools.item_uses = True, 10, 4, 2
+    pools.calls = calls
+    return pools
+
+
+class TestResponsePools:
+    """Tests for sampling responses from a collection's pool."""
+
+    @pytest.mark.asyncio
+    async def test_cold_pool_fills_in_the_background(self, pools):
+        """Test that the first request is not served, and later ones are sampled without a provider call each."""
+        assert pools.sample("GET", "api/users") is None
+        await asyncio.gather(*pools._filling.values())
+        assert pools.calls == [("GET", "api/users", {"task": "generate_pool", "resource": "users", "count": 10})]
+
+        page = pools.sample("GET", "api/users")["body"]
+        assert 3 <= len(page["users"]) <= 5
+        assert len({user["id"] for user in page["users"]}) == len(page["users"])
+
+        item = pools.sample("GET", "api/users/42")["body"]
+        assert item["id"] == "42" and "email" in item
+        assert len(pools.calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_pool_is_topped_up_when_it_runs_low(self, pools):
+        """Test that items are retired after their uses, and a refill starts below the minimum."""
+        pools.item_uses = 1
+        await pools.fill("api/orders")
+        served = 0
+        while not pools._filling:
+            assert pools.sample("GET", "api/orders/1") is not None
+            served += 1
+
+        assert served == 10 - 4 + 2
+        await asyncio.gather(*pools._filling.values())
+        assert pools.get_stats()["items"] == 2 + 10
+        assert pools.stats["fills"] == 2
+
+    @pytest.mark.asyncio
+    async def test_session_that_wrote_is_not_pooled(self, pools):
+        """Test that a session that changed the collection gets generated responses, others still get the pool."""
+        await pools.fill("api/users")
+        context = [{"method": "POST", "path": "api/users", "response": {}}]
+
+        assert pools.sample("GET", "api/users", context) is None
+        assert pools.sample("GET", "api/users_archive", context) is None
+        assert pools.sample("GET", "api/users", [{"method": "POST", "path": "api/users_archive"}]) is not None
+        assert pools.sample("POST", "api/users") is None
+
+    @pytest.mark.asyncio
+    async def test_empty_fill_backs_off(self, pools, monkeypatch):
+        """Test that a fill yielding no items is an error, and the collection is not filled again until the backoff."""
+
+        async def generate_response(method, path, body=None, context=None, system_prompt=None):
+            pools.calls.append((method, path, body))
+            return {"status_code": 200, "body": {"message": "nothing to list"}}
+
+        monkeypatch.setattr(ai_manager, "generate_response", generate_response)
+        for _ in range(3):
+            assert pools.sample("GET", "api/users") is None
+            await asyncio.gather(*pools._filling.values())
+
+        assert len(pools.calls) == 1
+        assert (pools.stats["errors"], pools.stats["fills"]) == (1, 0)
+
+        pools._backoff["api/users"] = 0
+        pools.sample("GET", "api/users")
+        await asyncio.gather(*pools._filling.values())
+        assert len(pools.calls) == 2
+
+
+class TestPooledMiss:
+    """Tests for misses answered from a pool."""
+
+    @pytest.mark.asyncio
+    async def test_sessions_get_varied_cached_responses(self, pools, memory_storage, monkeypatch):
+        """Test that each session's miss is sampled from the pool and cached for that session."""
+        monkeypatch.setattr("app.services.responder.response_pools", pools)
+        monkeypatch.setattr(session_index, "record", lambda *args: None)
+        await pools.fill("api/products")
+        rule = cache_policy.match("GET", "api/products")
+
+        bodies = []
+        for session in ("s1", "s2", "s3"):
+            key = cache_service.get_cache_key(session, "GET", "api/products", rule=rule)
+            outcome = await mock_responder.respond(MockRequest(session, "GET", "api/products", b"", rule, key))
+            assert outcome.source == "miss"
+            assert (await cache_service.get(key)).body == outcome.response.body
+            bodies.append(outcome.response.body)
+
+        assert len(pools.calls) == 1
+        assert len(set(bodies)) > 1
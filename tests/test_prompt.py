@@ -0,0 +1,97 @@
+"""
+Tests for the in-memory, hot-reloadable system prompt.
+"""
+
+import asyncio
+import os
+
+import pytest
+
+from app.database.backends import Batch
+from app.services.ai.prompt import DEFAULT_PROMPT, SystemPrompt
+from app.services.cache import CachedResponse, cache_service
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def write(path, text, mtime):
+    path.write_text(text, encoding="utf-8")
+    os.utime(path, ns=(mtime, mtime))
+
+
+class TestSystemPrompt:
+    """Tests for loading the prompt once and reloading it on change."""
+
+    def test_file_is_read_again_only_when_its_mtime_changes(self, tmp_path, monkeypatch):
+        """Test that the prompt is served from memory until the file changes and the check interval passes."""
+        path, clock = tmp_path / "system.md", Clock()
+        write(path, "first", 1_000_000_000)
+        prompt = SystemPrompt(str(path), check_interval=1.0, clock=clock)
+        reads = []
+        read_text = type(path).read_text
+        monkeypatch.setattr(type(path), "read_text", lambda self, **kw: reads.append(1) or read_text(self, **kw))
+
+        assert [prompt.get() for _ in range(5)] == ["first"] * 5
+        first = prompt.version
+
+        write(path, "second", 2_000_000_000)
+        assert prompt.get() == "first"
+        clock.now += 1
+        assert prompt.get() == "second"
+        clock.now += 1
+        prompt.get()
+
+        assert len(reads) == 2
+        assert prompt.version != first
+        assert prompt.stats["reloads"] == 1
+
+    def test_missing_file_uses_the_built_in_prompt(self, tmp_path):
+        """Test that a missing prompt file falls back to the built-in prompt."""
+        prompt = SystemPrompt(str(tmp_path / "missing.md"))
+        assert prompt.get() == DEFAULT_PROMPT
+        assert len(prompt.version) == 12
+
+    @pytest.mark.asyncio
+    async def test_reload_reaches_every_worker(self, tmp_path, memory_storage):
+        """Test that a reload requested on one worker makes the others read the file again."""
+        path = tmp_path / "system.md"
+        write(path, "first", 1_000_000_000)
+        workers = [SystemPrompt(str(path), check_interval=3600) for _ in range(2)]
+        for worker in workers:
+            await worker.start()
+        await asyncio.sleep(0)
+
+        # same mtime, so only an explicit reload picks the new text up
+        write(path, "second", 1_000_000_000)
+        previous = await workers[0].reload_all()
+        await asyncio.sleep(0.05)
+
+        assert [worker.get() for worker in workers] == ["second", "second"]
+        assert previous != workers[1].version
+        for worker in workers:
+            await worker.stop()
+
+
+class TestPurgeByPrompt:
+    """Tests for invalidating responses generated under an older prompt."""
+
+    @pytest.mark.asyncio
+    async def test_purge_by_prompt_version(self, memory_storage):
+        """Test that only responses tagged with the given prompt version are purged."""
+        keys = {}
+        for version in ("old", "new"):
+            keys[version] = f"{{s1}}:GET:api/{version}:0"
+            batch = Batch()
+            tags = cache_service.index_tags("GET", f"api/{version}") + [f"prompt:{version}"]
+            cache_service.queue_set(batch, keys[version], CachedResponse.from_data({"body": {}}), tags=tags)
+            await memory_storage.apply(batch)
+
+        assert await cache_service.purge(prompt="old") == 1
+        assert await memory_storage.get(keys["old"]) is None
+        assert await memory_storage.get(keys["new"]) is not None
@@ -0,0 +1,71 @@
+"""
+Tests for building user prompts within a token budget.
+"""
+
+import logging
+
+from app.services.ai.config import ai_settings
+from app.services.ai.prompt_builder import count_tokens, prompt_budget, prompt_builder
+from app.services.ai.providers import GroqProvider
+
+
+def entry(method, path, body=None, response_body=None):
+    return {"method": method, "path": path, "body": body, "response": {"status_code": 200, "body": response_body}}
+
+
+class TestPromptBuilder:
+    """Tests for the prompt builder."""
+
+    def test_token_count_is_close_to_a_bpe_tokenizer(self):
+        """Test that words, digit groups and symbols are counted the way BPE tokenizers split them."""
+        assert count_tokens("hello world") == 2
+        assert count_tokens('{"id":12345}') == 8
+        assert count_tokens("internationalization") == 3
+
+    def test_large_body_is_cut_down_to_the_budget(self):
+        """Test that a body far over the budget is sent compact, with its long fields shortened."""
+        body = {"document": "x" * 20000, "rows": [{"id": i, "name": f"row {i}"} for i in range(500)]}
+
+        prompt = prompt_builder.build("POST", "/api/imports", body, budget=300)
+
+        assert count_tokens(prompt) <= 300
+        assert '"rows":[{"id":0,"name":"row 0"}' in prompt
+        assert "items)" in prompt and "chars)" in prompt
+        assert "\n  " not in prompt
+
+    def test_context_is_chosen_by_relevance(self):
+        """Test that entries about the same resource and id win over more recent unrelated ones, in order."""
+        context = [
+            entry("POST", "/api/users", {"name": "Ada"}, {"id": 42, "name": "Ada"}),
+            entry("GET", "/api/users/42/orders", None, {"orders": []}),
+            entry("GET", "/api/products", None, {"products": [{"id": i} for i in range(50)]}),
+            entry("GET", "/api/stats", None, {"visits": 12}),
+            entry("GET", "/api/products/7", None, {"id": 7}),
+        ]
+
+        prompt = prompt_builder.build("GET", "/api/users/42", context=context, budget=75)
+
+        lines = [line for line in prompt.splitlines() if line.startswith("- ")]
+        assert lines == [
+            '- POST /api/users body={"name":"Ada"} -> 200 {"id":42,"name":"Ada"}',
+            "- GET /api/users/42/orders",
+        ]
+        assert count_tokens(prompt) <= 75
+
+    def test_budget_per_provider_and_model(self, monkeypatch):
+        """Test that a model's budget wins over its provider's, which wins over the default."""
+        monkeypatch.setattr(ai_settings, "AI_PROMPT_TOKEN_BUDGETS", "ollama=4000, groq:llama-3.1-8b-instant=800")
+        monkeypatch.setattr(ai_settings, "AI_PROMPT_TOKEN_BUDGET", 1500)
+
+        assert prompt_budget("groq", "llama-3.1-8b-instant") == 800
+        assert prompt_budget("groq", "llama-3.1-70b-versatile") == 1500
+        assert prompt_budget("ollama", "llama3") == 4000
+
+    def test_token_count_is_logged(self, caplog):
+        """Test that building a provider's request logs the prompt's token count."""
+        provider = GroqProvider(api_key="test", model="test")
+        with caplog.at_level(logging.INFO, logger="app.services.ai.providers.base"):
+            provider._payload("GET", "/api/users", None, None, "You mock APIs.")
+
+        assert "groq prompt for GET /api/users: " in caplog.text
+        assert "(system 4, request " in caplog.text
@@ -0,0 +1,312 @@
+"""
+Tests for the AI providers' pooled HTTP client and the provider chain.
+"""
+
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+from app.services.ai import prompt
+from app.services.ai.breaker import CircuitBreaker
+from app.services.ai.config import AIProvider, ai_settings
+from app.services.ai.hedging import HedgePolicy
+from app.services.ai.limiter import ProviderLimiter, RateLimited, estimate_tokens
+from app.services.ai.manager import AIManager, ChainLink, ProvidersUnavailable
+from app.services.ai.prompt_builder import count_prompt_tokens
+from app.services.ai.providers import DemoProvider, GroqProvider
+
+
+def completion(request):
+    content = json.dumps({"status_code": 200, "body": {"path": json.loads(request.content)["messages"][1]["content"]}})
+    return httpx.Response(200, json={"choices": [{"message": {"content": content}}]})
+
+
+class TestPooledClient:
+    """Tests for sharing one client across provider requests."""
+
+    @pytest.mark.asyncio
+    async def test_requests_share_the_client_until_closed(self):
+        """Test that generations reuse one client, and closing it lets the next request open a new one."""
+        provider = GroqProvider(api_key="test", model="test")
+        clients = []
+
+        def create_client():
+            clients.append(httpx.AsyncClient(transport=httpx.MockTransport(completion)))
+            return clients[-1]
+
+        provider._create_client = create_client
+
+        for _ in range(3):
+            response = await provider.generate_response("GET", "/api/users", system_prompt="test")
+            assert response["status_code"] == 200
+        assert len(clients) == 1
+
+        await provider.close()
+        assert clients[0].is_closed
+        await provider.generate_response("GET", "/api/users", system_prompt="test")
+        assert len(clients) == 2
+        await provider.close()
+
+    @pytest.mark.asyncio
+    async def test_start_opens_the_client_generations_use(self):
+        """Test that startup's health check goes through the client later generations reuse."""
+        provider = GroqProvider(api_key="test", model="test")
+        paths, clients = [], []
+
+        def handler(request):
+            paths.append(request.url.path)
+            return (
+                httpx.Response(200, json={"data": []}) if request.url.path.endswith("/models") else completion(request)
+            )
+
+        def create_client():
+            clients.append(httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+            return clients[-1]
+
+        provider._create_client = create_client
+
+        await provider.start()
+        await provider.generate_response("GET", "/api/users", system_prompt="test")
+        await provider.close()
+
+        assert paths == ["/openai/v1/models", "/openai/v1/chat/completions"]
+        assert len(clients) == 1
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FlakyProvider:
+    def __init__(self, error=None, delay=0.0, name="flaky"):
+        self.error = error
+        self.delay = delay
+        self.name = name
+        self.calls = 0
+        self.cancelled = 0
+
+    async def generate_response(self, method, path, body=None, context=None, system_prompt=None):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error is not None:
+            raise self.error
+        return {"status_code": 200, "body": {"from": self.name}}
+
+
+def chain_manager(*providers):
+    manager = AIManager()
+    manager.chain = [
+        ChainLink(f"p{i}", provider, CircuitBreaker(window=4, min_calls=2, cooldown=60), ProviderLimiter(f"p{i}"))
+        for i, provider in enumerate(providers)
+    ]
+    return manager
+
+
+class TestCircuitBreaker:
+    """Tests for opening, probing and closing a provider's breaker."""
+
+    def test_opens_on_error_rate_and_probes_after_cooldown(self):
+        """Test that enough failures open the breaker, and one probe at a time is let through after the cooldown."""
+        clock = Clock()
+        breaker = CircuitBreaker(window=10, error_rate=0.5, min_calls=4, cooldown=30, clock=clock)
+        for error in (None, RuntimeError("boom"), None, RuntimeError("boom")):
+            assert breaker.allow()
+            breaker.record_success() if error is None else breaker.record_failure(error)
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow()
+
+        clock.now += 30
+        assert breaker.allow()
+        assert not breaker.allow()
+        breaker.record_failure(RuntimeError("still down"))
+        assert breaker.state == CircuitBreaker.OPEN
+
+        clock.now += 30
+        assert breaker.allow()
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert breaker.get_stats()["trips"] == 2
+
+    def test_timeout_opens_at_once(self):
+        """Test that a single timeout, even wrapped in another error, opens the breaker."""
+        breaker = CircuitBreaker(min_calls=5)
+        try:
+            try:
+                raise httpx.ReadTimeout("slow")
+            except httpx.TimeoutException:
+                raise Exception("Groq API timeout - request took too long")
+        except Exception as e:
+            breaker.record_failure(e)
+        assert breaker.state == CircuitBreaker.OPEN
+
+
+class TestProviderChain:
+    """Tests for failing over along the provider chain."""
+
+    @pytest.mark.asyncio
+    async def test_open_breaker_costs_no_latency(self):
+        """Test that a failing provider hands over at once, and is not called at all once its breaker is open."""
+        dead = FlakyProvider(error=httpx.ConnectError("refused"))
+        manager = chain_manager(dead, DemoProvider())
+
+        for _ in range(5):
+            response = await manager.generate_response("GET", "/api/users/1")
+            assert response["status_code"] == 200
+
+        assert dead.calls == 2
+        assert [link["state"] for link in manager.get_status()["chain"]] == ["open", "closed"]
+
+    @pytest.mark.asyncio
+    async def test_all_providers_down(self):
+        """Test that a chain with no provider left fails fast with every provider's last error."""
+        manager = chain_manager(FlakyProvider(error=RuntimeError("rate limited")))
+        for _ in range(2):
+            with pytest.raises(ProvidersUnavailable):
+                await manager.generate_response("GET", "/api/users")
+
+        with pytest.raises(ProvidersUnavailable, match="rate limited"):
+            await manager.generate_response("GET", "/api/users")
+        assert manager.chain[0].provider.calls == 2
+
+    @pytest.mark.asyncio
+    async def test_stream_fails_over_before_the_first_token(self):
+        """Test that a provider failing before output is replaced, and a non-streaming one answers whole."""
+        dead = FlakyProvider(error=httpx.ConnectError("refused"))
+        manager = chain_manager(dead, FlakyProvider())
+
+        text = "".join([chunk async for chunk in manager.stream_response("GET", "/api/users")])
+
+        assert json.loads(text) == {"status_code": 200, "body": {"from": "flaky"}}
+        assert manager.chain[1].breaker.stats["calls"] == 1
+
+
+class TestHedging:
+    """Tests for sending slow calls to a second provider."""
+
+    def test_hedges_stay_within_budget(self):
+        """Test that no call is hedged before enough latencies are known, and then at most the budget's share."""
+        policy = HedgePolicy(enabled=True, percentile=90, budget=0.25, min_samples=10)
+        for i in range(9):
+            policy.record("groq", 0.1 * (i + 1))
+        assert policy.delay("groq") is None
+
+        policy.record("groq", 1.0)
+        admitted = 0
+        for _ in range(100):
+            assert policy.delay("groq") == 1.0
+            admitted += policy.admit()
+        assert admitted == 25
+
+    @pytest.mark.asyncio
+    async def test_slow_primary_is_hedged_and_cancelled(self):
+        """Test that a call slower than usual is raced against the next provider, and the loser is cancelled."""
+        slow = FlakyProvider(delay=5.0, name="primary")
+        fast = FlakyProvider(delay=0.01, name="secondary")
+        manager = chain_manager(slow, fast)
+        manager.hedging = HedgePolicy(enabled=True, percentile=95, budget=1.0, min_samples=5)
+        for _ in range(5):
+            manager.hedging.record("p0", 0.05)
+
+        started = time.monotonic()
+        response = await manager.generate_response("GET", "/api/users")
+        await asyncio.sleep(0)
+
+        assert response["body"] == {"from": "secondary"}
+        assert time.monotonic() - started < 1.0
+        assert slow.cancelled == 1
+        assert manager.hedging.stats["hedged"] == manager.hedging.stats["hedge_wins"] == 1
+        assert manager.chain[0].breaker.state == CircuitBreaker.CLOSED
+
+    @pytest.mark.asyncio
+    async def test_demo_provider_is_never_a_hedge(self):
+        """Test that a slow call is hedged past the demo provider to the next real one, and not to demo alone."""
+        slow = FlakyProvider(delay=0.2, name="primary")
+        demo = FlakyProvider(name="demo")
+        fast = FlakyProvider(delay=0.01, name="secondary")
+        manager = chain_manager(slow, demo, fast)
+        manager.chain[1] = manager.chain[1]._replace(name=AIProvider.DEMO.value)
+        manager.hedging = HedgePolicy(enabled=True, percentile=95, budget=1.0, min_samples=5)
+        for _ in range(5):
+            manager.hedging.record("p0", 0.05)
+
+        assert (await manager.generate_response("GET", "/api/users"))["body"] == {"from": "secondary"}
+        assert demo.calls == 0
+
+        manager.chain.pop()
+        assert (await manager.generate_response("GET", "/api/users"))["body"] == {"from": "primary"}
+        assert demo.calls == 0
+        assert manager.hedging.stats["hedged"] == 1
+
+
+class TestRateLimits:
+    """Tests for keeping provider calls within their quota."""
+
+    @pytest.mark.asyncio
+    async def test_call_over_quota_waits_for_it(self, memory_storage):
+        """Test that a call short of tokens waits until they are back instead of failing."""
+        limiter = ProviderLimiter("groq", tpm=600, timeout=2)
+        await limiter.acquire(600)
+
+        started = time.monotonic()
+        await limiter.acquire(5)
+
+        assert 0.4 < time.monotonic() - started < 1.0
+        assert limiter.get_stats()["remaining"] == {"tpm": 0}
+        assert (limiter.stats["admitted"], limiter.stats["waited"]) == (2, 1)
+
+    @pytest.mark.asyncio
+    async def test_call_that_would_wait_too_long_is_refused(self, memory_storage):
+        """Test that a call is refused at once when its quota is not back before the timeout, or the queue is full."""
+        limiter = ProviderLimiter("groq", rpm=1, rpd=100, timeout=5)
+        await limiter.acquire()
+
+        started = time.monotonic()
+        with pytest.raises(RateLimited):
+            await limiter.acquire()
+        assert time.monotonic() - started < 0.1
+        assert limiter.get_stats()["remaining"] == {"rpm": 0, "rpd": 99}
+
+        limiter.queue_size = 0
+        with pytest.raises(RateLimited, match="waiting"):
+            await limiter.acquire()
+        assert limiter.stats["rejected"] == 2
+
+    @pytest.mark.asyncio
+    async def test_provider_over_quota_hands_over(self, memory_storage):
+        """Test that the next provider answers while the first is over quota, whose breaker stays closed."""
+        limited = FlakyProvider(name="limited")
+        manager = chain_manager(limited, FlakyProvider(name="next"))
+        manager.chain[0] = manager.chain[0]._replace(limiter=ProviderLimiter("p0", rpm=1, timeout=1))
+
+        responses = [await manager.generate_response("GET", "/api/users") for _ in range(3)]
+
+        assert [response["body"]["from"] for response in responses] == ["limited", "next", "next"]
+        assert limited.calls == 1
+        assert manager.chain[0].breaker.state == CircuitBreaker.CLOSED
+        assert manager.get_status()["chain"][0]["quota"]["rejected"] == 2
+
+    @pytest.mark.asyncio
+    async def test_call_takes_the_system_prompt_tokens(self, memory_storage, monkeypatch):
+        """Test that a call's tokens include the shared system prompt the provider sends when none is given."""
+        monkeypatch.setattr(prompt.system_prompt, "get", lambda: "You answer as a mock REST API. " * 50)
+        manager = chain_manager(FlakyProvider())
+        manager.chain[0] = manager.chain[0]._replace(limiter=ProviderLimiter("p0", tpm=100000))
+
+        await manager.generate_response("GET", "/api/users")
+        await manager.generate_response("GET", "/api/users", system_prompt="Answer in JSON.")
+
+        used = 100000 - manager.chain[0].limiter.remaining["tpm"]
+        request_tokens = 2 * (estimate_tokens("GET", "/api/users") + ai_settings.AI_MAX_TOKENS)
+        expected = request_tokens + count_prompt_tokens(prompt.system_prompt.get()) + estimate_tokens("Answer in JSON.")
+        assert expected - 1 < used <= expected
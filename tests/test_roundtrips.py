@@ -0,0 +1,38 @@
+"""
+Tests for per-request Redis round-trip counting.
+"""
+
+import asyncio
+
+import pytest
+
+from app.database.core import roundtrips
+
+
+class TestRoundTrips:
+    """Tests for round-trip counters and stats."""
+
+    @pytest.mark.asyncio
+    async def test_counters_are_per_request(self):
+        """Test that concurrent requests count their own round trips."""
+
+        async def request(n):
+            counter = roundtrips.track_round_trips()
+            for _ in range(n):
+                roundtrips._current.get().count += 1
+                await asyncio.sleep(0)
+            return counter.count
+
+        assert await asyncio.gather(request(1), request(2), request(3)) == [1, 2, 3]
+
+    def test_stats_per_outcome(self, monkeypatch):
+        """Test that stats aggregate requests per outcome."""
+        monkeypatch.setattr(roundtrips, "round_trip_stats", {})
+
+        roundtrips.record_round_trips("miss", 2)
+        roundtrips.record_round_trips("miss", 3)
+        roundtrips.record_round_trips("l1", 0)
+
+        stats = roundtrips.get_round_trip_stats()
+        assert stats["miss"] == {"requests": 2, "round_trips": 5, "max": 3, "avg": 2.5}
+        assert stats["l1"]["avg"] == 0
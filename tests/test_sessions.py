@@ -0,0 +1,132 @@
+"""
+Tests for session memory budgets and eviction.
+"""
+
+import pytest
+
+from app.database.backends import Batch
+from app.services.cache import CachedResponse, cache_service
+from app.services.sessions import SessionIndex
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(memory_storage):
+    memory_storage.clock = Clock()
+    return memory_storage.clock
+
+
+async def write_session(index, storage, session_id, size):
+    """Store one value of `size` bytes for the session and note it."""
+    key = f"{session_id}:GET:/items:0"
+    batch = Batch()
+    batch.set(key, b"x" * size, 3600)
+    await storage.apply(batch)
+    index.record(session_id, key, size)
+    return key
+
+
+class TestSessionBudgets:
+    """Tests for idle, quota and LRU eviction."""
+
+    @pytest.mark.asyncio
+    async def test_idle_and_oversized_sessions_are_evicted(self, memory_storage, clock):
+        """Test that idle sessions and sessions over their quota lose all their keys."""
+        index = SessionIndex(clock)
+        index.ttl, index.max_bytes, index.interval = 600, 1000, 60
+
+        idle = await write_session(index, memory_storage, "idle", 10)
+        clock.now += 601
+        large = await write_session(index, memory_storage, "large", 2000)
+        small = await write_session(index, memory_storage, "small", 10)
+        await index.flush()
+        await index.enforce()
+
+        assert await memory_storage.get(idle) is None
+        assert await memory_storage.get(large) is None
+        assert await memory_storage.get(small) is not None
+        assert index.stats["evicted_idle"] == 1 and index.stats["evicted_quota"] == 1
+        assert await memory_storage.session_totals() == (1, 10)
+        await index.stop()
+
+    @pytest.mark.asyncio
+    async def test_expired_keys_do_not_count_toward_the_quota(self, memory_storage, clock):
+        """Test that a long-lived session is measured by its live keys, not by everything it ever wrote."""
+        index = SessionIndex(clock)
+        index.max_bytes = 1000
+
+        for i in range(5):
+            clock.now += 61
+            key = f"busy:GET:/items:{i}"
+            batch = Batch()
+            batch.set(key, b"x" * 600, 60)
+            await memory_storage.apply(batch)
+            index.record("busy", key, 600, 60)
+            await index.flush()
+            await index.enforce()
+
+        assert index.stats["evicted_quota"] == 0
+        assert await memory_storage.get(key) is not None
+        assert await memory_storage.session_totals() == (1, 600)
+        await index.stop()
+
+    @pytest.mark.asyncio
+    async def test_least_recently_seen_are_evicted_over_budget(self, memory_storage, clock):
+        """Test that eviction keeps recently seen sessions and stops below the low watermark."""
+        index = SessionIndex(clock)
+        index.max_count, index.interval = 10, 60
+
+        keys = []
+        for i in range(12):
+            clock.now += 1
+            keys.append(await write_session(index, memory_storage, f"s{i}", 10))
+        clock.now += 1
+        index.touch("s0")
+        await index.flush()
+        await index.enforce()
+
+        # down to 90% of the budget, the refreshed session survives
+        assert index.sessions == 9
+        assert await memory_storage.get(keys[0]) is not None
+        assert [await memory_storage.get(key) for key in keys[1:4]] == [None, None, None]
+        assert await memory_storage.get(keys[4]) is not None
+        await index.stop()
+
+    @pytest.mark.asyncio
+    async def test_top_sessions_include_pending_writes(self, memory_storage, clock):
+        """Test that the admin listing reports sessions noted since the last flush."""
+        index = SessionIndex(clock)
+        index.interval = 60
+
+        await write_session(index, memory_storage, "small", 10)
+        await write_session(index, memory_storage, "large", 500)
+
+        top = await index.top_sessions(limit=1)
+
+        assert top == [{"session_id": "large", "bytes": 500, "keys": 1, "last_seen": clock.now}]
+        await index.stop()
+
+    @pytest.mark.asyncio
+    async def test_evicted_keys_leave_the_purge_indexes(self, memory_storage, clock):
+        """Test that evicting a session removes its responses from the method and path indexes."""
+        index = SessionIndex(clock)
+        key = cache_service.get_cache_key("gone", "GET", "api/items")
+        batch = Batch()
+        cache_service.queue_set(
+            batch, key, CachedResponse.from_data({"body": {}}), tags=cache_service.index_tags("GET", "api/items")
+        )
+        await memory_storage.apply(batch)
+        index.record("gone", key, 10)
+        await index.flush()
+
+        assert await index.evict(["gone"]) == 1
+        assert await memory_storage.tagged(["method:GET"]) == []
+        assert await cache_service.purge("api/items") == 0
+        await index.stop()
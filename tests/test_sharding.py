@@ -0,0 +1,199 @@
+"""
+Tests for sharding storage over several nodes by session.
+The rebalancing test against real servers needs at least two Redis nodes in
+HELIX_REDIS_NODES, the other one runs on fakeredis.
+"""
+
+import time
+
+import pytest
+
+from app.database.backends import Batch, HashRing, IndexedKey, MemoryBackend, RedisBackend, ShardedBackend
+from app.database.backends.redis import session_expiry_key
+from app.database.backends.sharded import hash_tag, session_tag
+from app.database.core import rebalance as rebalance_module
+from app.database.core.config import settings
+from app.database.core.connect import close_redis, redis_nodes
+from app.database.core.rebalance import rebalance
+from app.services.cache import cache_service
+from app.services.context import context_manager
+from app.services.singleflight import single_flight
+
+PREFIX = "helix-test-shard"
+
+
+def sessions(count):
+    return [f"{PREFIX}-{i}" for i in range(count)]
+
+
+def sharded_memory(nodes=("a:1", "b:1", "c:1")):
+    return ShardedBackend([MemoryBackend() for _ in nodes], nodes)
+
+
+async def write_session(backend, session_id):
+    key = cache_service.get_cache_key(session_id, "GET", "api/items")
+    batch = Batch()
+    batch.set(key, b"HXR1" + session_id.encode(), 600)
+    batch.tag(key, cache_service.index_tags("GET", "api/items"), 600)
+    batch.push(context_manager.key(session_id), [b"{}"], max_len=5, ttl=600)
+    await backend.apply(batch, atomic=True)
+    await backend.index_sessions(
+        {session_id: {key: IndexedKey(60), context_manager.key(session_id): IndexedKey(40)}}, {session_id: 1.0}
+    )
+    return key
+
+
+class TestHashRing:
+    """Tests for placing keys on nodes."""
+
+    def test_hash_tags_follow_redis_rules(self):
+        """Test that keys are sharded by the first non-empty {...}, else as a whole."""
+        assert hash_tag("{s1}:GET:api:0") == "s1"
+        assert hash_tag("lock:{s1}:GET:api:0") == "s1"
+        assert hash_tag("{}:GET") == "{}:GET"
+        assert hash_tag("helix:request_logs") == "helix:request_logs"
+
+    def test_adding_a_node_moves_only_its_share(self):
+        """Test that a fourth node takes about a quarter of the sessions, all from the other three."""
+        keys = [f"{{{session_id}}}" for session_id in sessions(20000)]
+        before = HashRing(["r1:6379", "r2:6379", "r3:6379"])
+        after = HashRing(["r1:6379", "r2:6379", "r3:6379", "r4:6379"])
+
+        moved = [key for key in keys if before.node_for(key) != after.node_for(key)]
+
+        assert 0.18 < len(moved) / len(keys) < 0.32
+        assert {after.node_for(key) for key in moved} == {"r4:6379"}
+        counts = [sum(1 for key in keys if after.index_for(key) == index) for index in range(4)]
+        assert max(counts) / min(counts) < 1.5
+
+
+class TestShardedBackend:
+    """Tests for routing storage operations to shards."""
+
+    @pytest.mark.asyncio
+    async def test_session_keys_live_on_one_shard(self):
+        """Test that a session's response, lock and context share a shard and a lookup finds them."""
+        backend = sharded_memory()
+        placed = set()
+        for session_id in sessions(50):
+            key = await write_session(backend, session_id)
+            lock_key, token = single_flight.new_lock(key)
+            shard = backend.shard_for(key)
+            assert backend.shard_for(lock_key) is shard
+            assert backend.shard_for(context_manager.key(session_id)) is shard
+            assert await shard.get(key) is not None
+            placed.add(id(shard))
+
+            result = await backend.lookup(key, lock_key, token, 30, context_manager.key(session_id), 5)
+            assert result.cached is not None
+
+        assert len(placed) == 3
+
+    @pytest.mark.asyncio
+    async def test_indexes_are_merged_across_shards(self):
+        """Test session totals, listings, eviction and purges over every shard."""
+        backend = sharded_memory()
+        keys = {session_id: await write_session(backend, session_id) for session_id in sessions(30)}
+        await backend.index_sessions({f"{PREFIX}-7": {keys[f"{PREFIX}-7"]: IndexedKey(5000)}}, {})
+
+        assert await backend.session_totals() == (30, 29 * 100 + 5000 + 40)
+        assert (await backend.list_sessions("bytes", 1))[0].session_id == f"{PREFIX}-7"
+        assert sorted(await backend.tagged(["path:api/items"])) == sorted(keys.values())
+
+        dropped = await backend.drop_sessions([f"{PREFIX}-1", f"{PREFIX}-2"])
+        assert set(dropped) == {f"{PREFIX}-1", f"{PREFIX}-2"}
+        assert await backend.get(keys[f"{PREFIX}-1"]) is None
+        assert (await backend.session_totals())[0] == 28
+
+
+class FakeNode(RedisBackend):
+    """A node of the ring served by a fakeredis server."""
+
+    def __init__(self, client):
+        super().__init__()
+        self._client = client
+
+    @property
+    def client(self):
+        return self._client
+
+
+def redis_node_list():
+    nodes = redis_nodes()
+    if len(nodes) < 2:
+        pytest.skip("Rebalancing needs two Redis nodes in HELIX_REDIS_NODES")
+    return nodes
+
+
+class TestRebalance:
+    """Tests for moving keys to a node added to the ring."""
+
+    @pytest.mark.asyncio
+    async def test_moved_sessions_are_found_on_their_new_node(self):
+        """Test that after adding a node, every session reads back through the new ring."""
+        nodes = redis_node_list()
+        old_nodes = nodes[:-1]
+        old = ShardedBackend([RedisBackend(node=index) for index in range(len(old_nodes))], old_nodes)
+        new = ShardedBackend([RedisBackend(node=index) for index in range(len(nodes))], nodes)
+        await new.start()
+        if not await new.ping():
+            await close_redis()
+            pytest.skip(f"Redis nodes {settings.REDIS_NODES} are not reachable")
+
+        ids = sessions(60)
+        count, size = await new.session_totals()
+        try:
+            keys = {session_id: await write_session(old, session_id) for session_id in ids}
+
+            stats = await rebalance(old_nodes, nodes)
+
+            assert stats["sessions"] > 0 and stats["keys"] >= 2 * stats["sessions"]
+            for session_id, key in keys.items():
+                assert await new.get(key) == b"HXR1" + session_id.encode()
+                assert await new.range(context_manager.key(session_id)) == [b"{}"]
+            assert await new.session_totals() == (count + 60, size + 60 * 100)
+            assert set(keys.values()) <= set(await new.tagged(["path:api/items", "method:GET"]))
+        finally:
+            await new.drop_sessions(ids)
+            for shard in new.shards:
+                for tag in cache_service.index_tags("GET", "api/items"):
+                    members = await shard.client.zrange(f"helix:tags:{tag}", 0, -1)
+                    members = [member for member in members if member.startswith(f"{{{PREFIX}".encode())]
+                    if members:
+                        await shard.client.zrem(f"helix:tags:{tag}", *members)
+            await new.close()
+
+    @pytest.mark.asyncio
+    async def test_session_index_moves_with_its_sessions(self, monkeypatch):
+        """Test that a moved session's sizes and key expiries are indexed on its new node and gone from the old."""
+        fakeredis = pytest.importorskip("fakeredis")
+        nodes = ["a:6379", "b:6379"]
+        servers = {node: fakeredis.FakeServer() for node in nodes}
+        monkeypatch.setattr(
+            rebalance_module, "_client", lambda node: fakeredis.aioredis.FakeRedis(server=servers[node])
+        )
+        clients = {node: fakeredis.aioredis.FakeRedis(server=servers[node]) for node in nodes}
+        old = ShardedBackend([FakeNode(clients["a:6379"])], nodes[:1])
+        new = ShardedBackend([FakeNode(clients[node]) for node in nodes], nodes)
+
+        ids = sessions(20)
+        expires_at = time.time() + 600
+        keys = {}
+        for session_id in ids:
+            keys[session_id] = await write_session(old, session_id)
+            await old.index_sessions({session_id: {keys[session_id]: IndexedKey(60, expires_at)}}, {})
+
+        stats = await rebalance(nodes[:1], nodes)
+
+        ring = HashRing(nodes)
+        moved = [session_id for session_id in ids if ring.node_for(session_tag(session_id)) == "b:6379"]
+        assert stats["sessions"] == len(moved) > 0
+        assert await new.session_totals() == (20, 20 * 100)
+        for session_id in moved:
+            assert await clients["b:6379"].zscore(session_expiry_key(session_id), keys[session_id]) == pytest.approx(
+                expires_at
+            )
+            assert not await clients["a:6379"].exists(session_expiry_key(session_id))
+        dropped = await new.drop_sessions(moved)
+        assert all(keys[session_id] in dropped[session_id] for session_id in moved)
+        assert await new.session_totals() == (20 - len(moved), (20 - len(moved)) * 100)
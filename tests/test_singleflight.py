@@ -0,0 +1,131 @@
+"""
+Tests for single-flight coalescing of identical generations.
+"""
+
+import asyncio
+
+import pytest
+
+from app.database.backends import Batch
+from app.services.cache import CachedResponse
+from app.services.singleflight import SingleFlight
+
+
+class TestSingleFlight:
+    """Tests for in-worker coalescing."""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_share_one_generation(self, memory_storage):
+        """Test that identical concurrent misses run the generator once."""
+        flight = SingleFlight()
+        calls = 0
+
+        async def generate():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return CachedResponse.from_data({"body": {"id": 1}})
+
+        results = await asyncio.gather(*(flight.run("k", generate) for _ in range(20)))
+
+        assert calls == 1
+        assert len({r.body for r in results}) == 1
+        assert flight.stats["local_waiters"] == 19
+
+    @pytest.mark.asyncio
+    async def test_errors_propagate_to_waiters(self, memory_storage):
+        """Test that a failed generation fails every waiter and frees the key."""
+        flight = SingleFlight()
+
+        async def generate():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("provider down")
+
+        results = await asyncio.gather(*(flight.run("k", generate) for _ in range(3)), return_exceptions=True)
+
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert flight._inflight == {}
+
+    @pytest.mark.asyncio
+    async def test_waiter_takes_over_a_cancelled_generation(self, memory_storage):
+        """Test that cancelling the leader does not cancel the requests coalesced onto it."""
+        flight = SingleFlight()
+        calls = 0
+
+        async def generate():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.02)
+            return CachedResponse.from_data({"body": {"call": calls}})
+
+        leader = asyncio.create_task(flight.run("k", generate))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(flight.run("k", generate)) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        results = await asyncio.gather(*followers)
+
+        assert leader.cancelled()
+        assert calls == 2
+        assert len({r.body for r in results}) == 1
+        assert flight._inflight == {}
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_leaves_generation_running(self, memory_storage):
+        """Test that a waiter cancelled itself is cancelled without affecting the leader."""
+        flight = SingleFlight()
+
+        async def generate():
+            await asyncio.sleep(0.02)
+            return CachedResponse.from_data({"body": {"id": 1}})
+
+        leader = asyncio.create_task(flight.run("k", generate))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.run("k", generate))
+        await asyncio.sleep(0)
+        follower.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        assert (await leader).body is not None
+
+
+class TestGenerationLock:
+    """Tests for the cross-worker generation lock."""
+
+    @pytest.mark.asyncio
+    async def test_release_frees_own_lock(self, memory_storage):
+        """Test that the owner can release its lock."""
+        flight = SingleFlight()
+        lock_key, token = flight.new_lock("k")
+        await memory_storage.lookup("k", lock_key, token, 35, "context:s", 5)
+
+        await flight.release(lock_key, token)
+
+        assert not await memory_storage.exists(lock_key)
+
+    @pytest.mark.asyncio
+    async def test_release_keeps_foreign_lock(self, memory_storage):
+        """Test that an expired owner cannot release a lock taken over by another worker."""
+        flight = SingleFlight()
+        lock_key, token = flight.new_lock("k")
+        batch = Batch()
+        batch.set(lock_key, b"other-worker", 35)
+        await memory_storage.apply(batch)
+
+        await flight.release(lock_key, token)
+
+        assert await memory_storage.get(lock_key) == b"other-worker"
+
+    @pytest.mark.asyncio
+    async def test_wait_for_peer_gives_up_when_storage_fails(self, memory_storage, monkeypatch):
+        """Test that an unreadable lock makes the waiter generate instead of failing."""
+        flight = SingleFlight()
+
+        async def exists(key):
+            raise ConnectionError("storage down")
+
+        monkeypatch.setattr(memory_storage, "exists", exists)
+
+        assert await flight.wait_for_peer("k", "lock:k") is None
@@ -0,0 +1,334 @@
+"""
+Conformance tests run against every storage backend.
+The Redis backend is only tested when a server is reachable
+(HELIX_REDIS_HOST / HELIX_REDIS_PORT).
+"""
+
+import asyncio
+
+import pytest
+import pytest_asyncio
+
+from app.database.backends import (
+    Batch,
+    Bucket,
+    Codec,
+    CompressedBackend,
+    IndexedKey,
+    MemoryBackend,
+    RedisBackend,
+    ShardedBackend,
+    SqliteBackend,
+)
+
+PREFIX = "helix-test:"
+# tagged like a session's keys, a lookup's keys live on one shard
+LOOKUP_KEYS = (f"{PREFIX}{{s}}:k", f"{PREFIX}lock:{{s}}", f"{PREFIX}ctx:{{s}}")
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest_asyncio.fixture(params=["memory", "sqlite", "redis", "compressed", "sharded"])
+async def backend(request, tmp_path):
+    if request.param == "memory":
+        backend = MemoryBackend(clock=Clock())
+    elif request.param == "compressed":
+        backend = CompressedBackend(MemoryBackend(clock=Clock()), Codec("zlib", min_bytes=1))
+    elif request.param == "sharded":
+        clock = Clock()
+        backend = ShardedBackend([MemoryBackend(clock=clock) for _ in range(3)], ["a:1", "b:1", "c:1"])
+    elif request.param == "sqlite":
+        backend = SqliteBackend(str(tmp_path / "helix.db"), clock=Clock())
+    else:
+        backend = RedisBackend()
+        if not await backend.ping():
+            await backend.close()
+            pytest.skip("Redis is not reachable")
+
+    await backend.start()
+    yield backend
+
+    if request.param == "redis":
+        sessions = await backend.list_sessions("idle", 1000)
+        await backend.drop_sessions([s.session_id for s in sessions if s.session_id.startswith(PREFIX)])
+        keys = await backend.client.keys(f"{PREFIX}*") + await backend.client.keys(f"helix:tags:{PREFIX}*")
+        if keys:
+            await backend.client.delete(*keys)
+    await backend.close()
+
+
+async def write(backend, build):
+    batch = Batch()
+    build(batch)
+    await backend.apply(batch, atomic=True)
+
+
+def advance(backend, seconds):
+    if isinstance(backend, RedisBackend):
+        pytest.skip("expiry is Redis' own")
+    backend = getattr(backend, "inner", backend)
+    getattr(backend, "shards", [backend])[0].clock.now += seconds
+
+
+class TestValues:
+    """Tests for plain values."""
+
+    @pytest.mark.asyncio
+    async def test_set_get_delete(self, backend):
+        """Test that values round-trip as bytes and can be deleted."""
+        key = f"{PREFIX}value"
+        assert await backend.get(key) is None
+
+        await write(backend, lambda b: b.set(key, b"\x00payload", 60))
+        assert await backend.get(key) == b"\x00payload"
+        assert await backend.exists(key)
+
+        await write(backend, lambda b: b.delete(key))
+        assert await backend.get(key) is None
+        assert not await backend.exists(key)
+
+    @pytest.mark.asyncio
+    async def test_apply_counts_deleted_keys(self, backend):
+        """Test that a batch reports how many of the keys it deletes existed."""
+        await write(backend, lambda b: (b.set(f"{PREFIX}a", b"v", 60), b.push(f"{PREFIX}l", [b"e"], 5, 60)))
+        batch = Batch()
+        for key in ("a", "l", "missing", "a"):
+            batch.delete(f"{PREFIX}{key}")
+
+        assert await backend.apply(batch) == 2
+
+    @pytest.mark.asyncio
+    async def test_values_expire(self, backend):
+        """Test that a value is gone once its TTL has passed."""
+        key = f"{PREFIX}expiring"
+        await write(backend, lambda b: b.set(key, b"v", 10))
+
+        advance(backend, 11)
+
+        assert await backend.get(key) is None
+        assert not await backend.exists(key)
+
+
+class TestLists:
+    """Tests for capped lists."""
+
+    @pytest.mark.asyncio
+    async def test_push_keeps_newest_first(self, backend):
+        """Test ordering, trimming and range limits."""
+        key = f"{PREFIX}list"
+        await write(backend, lambda b: b.push(key, [b"1", b"2"], max_len=3))
+        await write(backend, lambda b: b.push(key, [b"3", b"4"], max_len=3))
+
+        assert await backend.range(key) == [b"4", b"3", b"2"]
+        assert await backend.range(key, 2) == [b"4", b"3"]
+        assert await backend.range(f"{PREFIX}missing") == []
+
+    @pytest.mark.asyncio
+    async def test_push_refreshes_ttl(self, backend):
+        """Test that a list expires TTL seconds after its last push."""
+        key = f"{PREFIX}session"
+        await write(backend, lambda b: b.push(key, [b"1"], max_len=5, ttl=10))
+        advance(backend, 8)
+        await write(backend, lambda b: b.push(key, [b"2"], max_len=5, ttl=10))
+        advance(backend, 8)
+
+        assert await backend.range(key) == [b"2", b"1"]
+
+        advance(backend, 3)
+        assert await backend.range(key) == []
+
+
+class TestLookup:
+    """Tests for the combined cache read, lock and context lookup."""
+
+    @pytest.mark.asyncio
+    async def test_miss_takes_lock_once_and_reads_context(self, backend):
+        """Test that only the first miss gets the lock, and both get the context."""
+        key, lock, context = LOOKUP_KEYS
+        await write(backend, lambda b: b.push(context, [b"a", b"b", b"c"], max_len=5))
+
+        first = await backend.lookup(key, lock, "one", 30, context, 2)
+        second = await backend.lookup(key, lock, "two", 30, context, 2)
+
+        assert first.cached is None and first.locked
+        assert not second.locked
+        assert first.context == second.context == [b"c", b"b"]
+
+    @pytest.mark.asyncio
+    async def test_hit_and_revalidate(self, backend):
+        """Test that hits skip the lock, and revalidation skips the hit."""
+        key, lock, context = LOOKUP_KEYS
+        await write(backend, lambda b: b.set(key, b"HXR1body", 60))
+
+        hit = await backend.lookup(key, lock, "t", 30, context, 5, magic=(b"HXR1",))
+        revalidation = await backend.lookup(key, lock, "t", 30, context, 5, revalidate=True, magic=(b"HXR1",))
+
+        assert hit.cached == b"HXR1body" and not hit.locked
+        assert revalidation.cached is None and revalidation.locked
+
+    @pytest.mark.asyncio
+    async def test_foreign_format_is_a_miss(self, backend):
+        """Test that values without the envelope magic are not returned."""
+        key, lock, context = LOOKUP_KEYS
+        await write(backend, lambda b: b.set(key, b'{"legacy": true}', 60))
+
+        result = await backend.lookup(key, lock, "t", 30, context, 5, magic=(b"HXR1",))
+
+        assert result.cached is None and result.locked
+
+    @pytest.mark.asyncio
+    async def test_release_lock_checks_owner(self, backend):
+        """Test that a lock is only released with the token that took it."""
+        key, lock, context = LOOKUP_KEYS
+        await backend.lookup(key, lock, "owner", 30, context, 5)
+
+        await write(backend, lambda b: b.release_lock(lock, "someone-else"))
+        assert await backend.exists(lock)
+
+        await write(backend, lambda b: b.release_lock(lock, "owner"))
+        assert not await backend.exists(lock)
+
+
+class TestTags:
+    """Tests for secondary indexes."""
+
+    @pytest.mark.asyncio
+    async def test_tagged_intersects_tags(self, backend):
+        """Test that only keys carrying every tag are returned."""
+        get, post = f"{PREFIX}method:GET", f"{PREFIX}path:users"
+        await write(backend, lambda b: (b.tag("a", [get, post], 60), b.tag("b", [get], 60), b.tag("c", [post], 60)))
+
+        assert sorted(await backend.tagged([get])) == ["a", "b"]
+        assert sorted(await backend.tagged([post, get])) == ["a"]
+        assert await backend.tagged([f"{PREFIX}missing", get]) == []
+
+    @pytest.mark.asyncio
+    async def test_expired_and_untagged_keys_are_left_out(self, backend):
+        """Test that index entries end with the key's TTL or an untag."""
+        tag = f"{PREFIX}path:users"
+        await write(backend, lambda b: (b.tag("short", [tag], 10), b.tag("long", [tag], 60), b.tag("gone", [tag])))
+        await write(backend, lambda b: b.untag("gone", [tag]))
+
+        advance(backend, 11)
+
+        assert await backend.tagged([tag]) == ["long"]
+
+
+class TestPubSub:
+    """Tests for invalidation messages."""
+
+    @pytest.mark.asyncio
+    async def test_published_messages_reach_listeners(self, backend):
+        """Test that a message published in a batch reaches a subscriber."""
+        channel = f"{PREFIX}channel"
+        received = asyncio.get_running_loop().create_future()
+
+        async def listen():
+            async for message in backend.listen(channel):
+                received.set_result(message)
+                return
+
+        listener = asyncio.create_task(listen())
+        await asyncio.sleep(0.1)  # subscribed
+        await write(backend, lambda b: b.publish(channel, "origin:key"))
+
+        assert await asyncio.wait_for(received, 2) == "origin:key"
+        await listener
+
+
+class TestTokenBuckets:
+    """Tests for taking from several token buckets at once."""
+
+    @pytest.mark.asyncio
+    async def test_takes_from_all_buckets_or_none(self, backend):
+        """Test that a take short in one bucket takes nothing and says how long to wait."""
+
+        def buckets(tokens):
+            return [
+                Bucket(f"{PREFIX}{{p}}:rpm", 2, 2 / 60, 1),
+                Bucket(f"{PREFIX}{{p}}:tpm", 100, 100 / 60, tokens),
+            ]
+
+        wait, levels = await backend.take_tokens(buckets(60))
+        assert wait == 0
+        assert levels == [pytest.approx(1, abs=0.01), pytest.approx(40, abs=0.1)]
+
+        wait, levels = await backend.take_tokens(buckets(60))
+        assert wait == pytest.approx(12, abs=0.1)
+        assert levels[0] == pytest.approx(1, abs=0.01)
+
+        wait, levels = await backend.take_tokens(buckets(30))
+        assert wait == 0
+        assert levels == [pytest.approx(0, abs=0.01), pytest.approx(10, abs=0.1)]
+
+        advance(backend, 30)
+        wait, levels = await backend.take_tokens(buckets(60))
+        assert wait == 0
+        assert levels == [pytest.approx(0), pytest.approx(0)]
+
+
+class TestSessionIndex:
+    """Tests for per-session key accounting."""
+
+    @pytest.mark.asyncio
+    async def test_sizes_are_replaced_not_added(self, backend):
+        """Test that rewriting a key counts its new size only."""
+        one, two = f"{PREFIX}s1", f"{PREFIX}s2"
+        await backend.index_sessions({one: {f"{PREFIX}a": IndexedKey(100), f"{PREFIX}b": IndexedKey(50)}}, {one: 10.0})
+        await backend.index_sessions(
+            {one: {f"{PREFIX}a": IndexedKey(30)}, two: {f"{PREFIX}c": IndexedKey(500)}}, {one: 30.0, two: 20.0}
+        )
+
+        by_bytes = [s for s in await backend.list_sessions("bytes", 100) if s.session_id.startswith(PREFIX)]
+        by_idle = [s for s in await backend.list_sessions("idle", 100) if s.session_id.startswith(PREFIX)]
+
+        assert [(s.session_id, s.bytes, s.keys, s.last_seen) for s in by_bytes] == [
+            (two, 500, 1, 20.0),
+            (one, 80, 2, 30.0),
+        ]
+        assert [s.session_id for s in by_idle] == [two, one]
+        assert [s.session_id for s in await backend.list_sessions("idle", 100, seen_before=25.0)] == [two]
+
+    @pytest.mark.asyncio
+    async def test_expired_keys_leave_the_session_size(self, backend):
+        """Test that keys whose TTL ran out stop counting once the session is indexed again."""
+        session = f"{PREFIX}s1"
+        count, total = await backend.session_totals()
+        await backend.index_sessions(
+            {session: {f"{PREFIX}old": IndexedKey(100, 1.0), f"{PREFIX}new": IndexedKey(50, 4e9)}}, {session: 10.0}
+        )
+        await backend.index_sessions({session: {f"{PREFIX}ctx": IndexedKey(5)}}, {session: 20.0})
+
+        usage = [s for s in await backend.list_sessions("bytes", 100) if s.session_id == session]
+
+        assert [(s.bytes, s.keys) for s in usage] == [(55, 2)]
+        assert await backend.session_totals() == (count + 1, total + 55)
+
+    @pytest.mark.asyncio
+    async def test_drop_deletes_indexed_keys(self, backend):
+        """Test that dropping a session deletes its keys and its share of the totals."""
+        session, kept = f"{PREFIX}s1", f"{PREFIX}s2"
+        await write(backend, lambda b: (b.set(f"{PREFIX}a", b"x" * 10, 60), b.push(f"{PREFIX}ctx", [b"e"], 5)))
+        await write(backend, lambda b: b.set(f"{PREFIX}other", b"y", 60))
+        count, total = await backend.session_totals()
+        await backend.index_sessions(
+            {
+                session: {f"{PREFIX}a": IndexedKey(10), f"{PREFIX}ctx": IndexedKey(1)},
+                kept: {f"{PREFIX}other": IndexedKey(1)},
+            },
+            {session: 1.0, kept: 2.0},
+        )
+
+        dropped = await backend.drop_sessions([session])
+
+        assert sorted(dropped[session]) == [f"{PREFIX}a", f"{PREFIX}ctx"]
+        assert await backend.get(f"{PREFIX}a") is None
+        assert await backend.range(f"{PREFIX}ctx") == []
+        assert await backend.get(f"{PREFIX}other") == b"y"
+        assert await backend.session_totals() == (count + 1, total + 1)
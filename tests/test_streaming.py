@@ -0,0 +1,117 @@
+"""
+Tests for streaming generated responses while the provider writes them.
+"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.services.ai.config import ai_settings
+from app.services.ai.manager import ai_manager
+from app.services.ai.providers import GroqProvider
+from app.services.cache import cache_service
+from app.services.cache_policy import cache_policy
+from app.services.responder import MockRequest, mock_responder
+from app.services.sessions import session_index
+from app.services.streaming import EnvelopeParser
+
+ENVELOPE = {
+    "status_code": 201,
+    "headers": {"Location": "/api/users/1", "X-Note": 'quoted "}" brace'},
+    "body": {"users": [{"id": i, "name": f"User, {i}]", "tags": ["a", "b"]} for i in range(20)]},
+}
+
+
+def tokens(text, size=3):
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+class TestEnvelopeParser:
+    """Tests for parsing the envelope as it is written."""
+
+    def test_head_is_known_when_the_body_starts(self):
+        """Test that status and headers are ready before the body is, and the body text adds up."""
+        text = "```json\n" + json.dumps(ENVELOPE, indent=2) + "\n```"
+        parser = EnvelopeParser()
+        streamed, head_at = [], None
+
+        for position, token in enumerate(tokens(text)):
+            streamed.append(parser.feed(token))
+            if head_at is None and parser.head_ready:
+                head_at = position
+                assert (parser.status_code, parser.headers) == (201, ENVELOPE["headers"])
+
+        assert head_at < len(text) / 3 / 10
+        assert json.loads("".join(streamed)) == ENVELOPE["body"]
+        assert parser.result() == ENVELOPE
+
+    def test_truncated_envelope_is_an_error(self):
+        """Test that a stream ending inside the body is not taken as a complete response."""
+        parser = EnvelopeParser()
+        parser.feed(json.dumps(ENVELOPE)[:-10])
+        with pytest.raises(ValueError):
+            parser.result()
+
+
+class TestOpenAIStream:
+    """Tests for reading OpenAI-compatible completion streams."""
+
+    @pytest.mark.asyncio
+    async def test_deltas_are_yielded_in_order(self):
+        """Test that server-sent content deltas come out as text, up to [DONE]."""
+        pieces = tokens(json.dumps(ENVELOPE), 7)
+        events = [{"choices": [{"delta": {"role": "assistant"}}]}] + [
+            {"choices": [{"delta": {"content": piece}}]} for piece in pieces
+        ]
+        sse = "".join(f"data: {json.dumps(event)}\n\n" for event in events) + "data: [DONE]\n\n"
+
+        def handler(request):
+            assert json.loads(request.content)["stream"] is True
+            return httpx.Response(200, text=sse, headers={"content-type": "text/event-stream"})
+
+        provider = GroqProvider(api_key="test", model="test")
+        provider._create_client = lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        assert [text async for text in provider.stream_response("GET", "/api/users", system_prompt="test")] == pieces
+        await provider.close()
+
+
+class TestStreamedMiss:
+    """Tests for answering a miss before its generation is complete."""
+
+    @pytest.mark.asyncio
+    async def test_body_streams_before_generation_ends_and_is_cached(self, memory_storage, monkeypatch):
+        """Test that the head arrives while the provider is still writing, and the whole response is cached."""
+        gate = asyncio.Event()
+        text = json.dumps(ENVELOPE)
+
+        async def stream_response(method, path, body=None, context=None, system_prompt=None):
+            half = text.index('"body"') + 20
+            yield text[:half]
+            await gate.wait()
+            for token in tokens(text[half:], 50):
+                yield token
+
+        monkeypatch.setattr(ai_settings, "AI_STREAMING", True)
+        monkeypatch.setattr(ai_manager, "provider", GroqProvider(api_key="test", model="test"))
+        monkeypatch.setattr(ai_manager, "stream_response", stream_response)
+        monkeypatch.setattr(session_index, "record", lambda *args: None)
+        rule = cache_policy.match("GET", "api/users")
+        key = cache_service.get_cache_key("s1", "GET", "api/users", rule=rule)
+
+        outcome = await mock_responder.respond(MockRequest("s1", "GET", "api/users", b"", rule, key))
+
+        assert outcome.source == "stream"
+        assert outcome.response.status_code == 201
+        assert (b"location", b"/api/users/1") in outcome.response.raw_headers
+        assert await memory_storage.get(key) is None
+
+        gate.set()
+        body = b"".join([chunk async for chunk in outcome.response.body()])
+        completed = await outcome.response.completed
+
+        assert json.loads(body) == ENVELOPE["body"]
+        assert json.loads(completed.response.body) == ENVELOPE["body"]
+        assert (await cache_service.get(key)).body == completed.response.body
@@ -0,0 +1,157 @@
+"""
+Tests for response templates learned from generated responses and filled locally.
+"""
+
+import re
+import time
+from collections import OrderedDict
+
+import pytest
+from faker import Faker
+
+from app.services.ai.breaker import CircuitBreaker
+from app.services.ai.limiter import ProviderLimiter
+from app.services.ai.manager import AIManager, ChainLink
+from app.services.ai.prompt import system_prompt
+from app.services.ai.templates import fill, infer, merge, response_templates
+
+USER = {
+    "id": 7,
+    "uuid": "3f2b8c1e-9d4a-4b7e-8f1a-2c3d4e5f6a7b",
+    "name": "Alice Martin",
+    "email": "alice.martin@example.com",
+    "status": "active",
+    "score": 4.25,
+    "verified": True,
+    "created_at": "2024-03-01T10:15:00Z",
+    "customer_code": "CUS-20240301",
+    "tags": ["admin", "beta"],
+    "address": {"city": "Lyon", "country": "France"},
+}
+
+
+class ModelProvider:
+    """Stands in for a model, answering every call with the same realistic user."""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def generate_response(self, method, path, body=None, context=None, system_prompt=None):
+        self.calls += 1
+        users = [dict(USER, id=i, status=status) for i, status in enumerate(["active", "pending", "active"], 1)]
+        response_body = {"users": users, "total": 3} if path.endswith("users") else dict(USER)
+        return {"status_code": 200, "headers": {"Content-Type": "application/json"}, "body": response_body}
+
+
+@pytest.fixture
+def templates(memory_storage, monkeypatch):
+    """Fixture enabling the shared templates with an empty in-process cache."""
+    monkeypatch.setattr(response_templates, "enabled", True)
+    monkeypatch.setattr(response_templates, "_local", OrderedDict())
+    return response_templates
+
+
+def model_manager():
+    manager = AIManager()
+    provider = ModelProvider()
+    manager.chain = [ChainLink("groq", provider, CircuitBreaker(), ProviderLimiter("groq"))]
+    return manager, provider
+
+
+class TestInference:
+    """Tests for inferring a template and filling it."""
+
+    def test_filled_values_keep_types_and_formats(self):
+        """Test that every field comes back with its type, format or one of its seen values."""
+        template = merge(infer(USER), infer(dict(USER, status="banned")))
+        fake = Faker()
+
+        for _ in range(20):
+            user = fill(template, fake)
+            assert user.keys() == USER.keys()
+            assert isinstance(user["id"], int) and isinstance(user["score"], float)
+            assert isinstance(user["verified"], bool)
+            assert re.match(r"^[^@]+@[^@]+\.\w+$", user["email"])
+            assert re.match(r"^[0-9a-f]{8}-[0-9a-f]{4}-", user["uuid"])
+            assert user["created_at"].endswith("Z")
+            assert user["status"] in ("active", "banned")
+            assert re.match(r"^CUS-\d{8}$", user["customer_code"])
+            assert set(user["tags"]) <= {"admin", "beta"}
+            assert isinstance(user["address"]["city"], str)
+
+    def test_collection_items_get_distinct_ids(self):
+        """Test that items of a filled collection never share an id."""
+        template = infer({"users": [dict(USER, id=i) for i in range(1, 6)]})
+        users = fill(template, Faker())["users"]
+        assert len({user["id"] for user in users}) == len(users) == 5
+
+
+class TestLearnedTemplates:
+    """Tests for answering routes from their learned template."""
+
+    @pytest.mark.asyncio
+    async def test_route_is_generated_once_then_filled_locally(self, templates):
+        """Test that the first request of a route is generated, and the next ones of the route are not."""
+        manager, provider = model_manager()
+
+        first = await manager.generate_response("GET", "api/users/7")
+        second = await manager.generate_response("GET", "api/users/42")
+        third = await manager.generate_response("GET", "api/users/43")
+
+        assert provider.calls == 1
+        assert first["body"] == USER
+        assert second["body"]["id"] == 42 and third["body"]["id"] == 43
+        assert second["body"].keys() == USER.keys()
+        assert second["body"] != third["body"]
+
+        await manager.generate_response("GET", "api/users")
+        await manager.generate_response("GET", "api/users")
+        assert provider.calls == 2
+        assert [t["route"] for t in await templates.list()] == ["/api/users", "/api/users/{id}"]
+
+    @pytest.mark.asyncio
+    async def test_invalidated_or_stale_template_is_learned_again(self, templates, monkeypatch):
+        """Test that deleting a route's template, or changing the system prompt, sends the route to the model."""
+        manager, provider = model_manager()
+        await manager.generate_response("GET", "api/users/1")
+
+        assert await templates.invalidate("/api/users/{id}") == 1
+        assert await templates.storage.tagged([f"prompt:{system_prompt.version}"]) == []
+        await manager.generate_response("GET", "api/users/2")
+        assert provider.calls == 2
+
+        key = templates.key("GET", "api/users/3")
+        expires_at, template = templates._local[key]
+        monkeypatch.setitem(templates._local, key, (expires_at, dict(template, prompt="older")))
+        await manager.generate_response("GET", "api/users/3")
+        assert provider.calls == 3
+        assert templates.stats["stale"] == 1
+
+    @pytest.mark.asyncio
+    async def test_expired_template_is_learned_again(self, templates, monkeypatch):
+        """Test that a template past AI_TEMPLATE_TTL is no longer served, from the process or from storage."""
+        manager, provider = model_manager()
+        await manager.generate_response("GET", "api/users/1")
+        await manager.generate_response("GET", "api/users/2")
+        assert provider.calls == 1
+
+        later = time.time() + templates.ttl + 1
+        monkeypatch.setattr(time, "time", lambda: later)
+        await manager.generate_response("GET", "api/users/3")
+        assert provider.calls == 2
+
+        # still in storage, whose clock is not moved here, but learned too long ago
+        templates._local.clear()
+        monkeypatch.setattr(time, "time", lambda: later + templates.ttl + 1)
+        await manager.generate_response("GET", "api/users/4")
+        assert provider.calls == 3
+
+    @pytest.mark.asyncio
+    async def test_session_that_wrote_is_not_templated(self, templates):
+        """Test that writes and sessions that wrote to the collection still go to the model."""
+        manager, provider = model_manager()
+        await manager.generate_response("GET", "api/users/1")
+
+        await manager.generate_response("GET", "api/users/2", context=[{"method": "POST", "path": "api/users"}])
+        await manager.generate_response("PUT", "api/users/2", body={"name": "Bob"})
+        assert provider.calls == 3
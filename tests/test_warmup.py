@@ -0,0 +1,147 @@
+"""
+Tests for cache warm-up from an OpenAPI document.
+"""
+
+import pytest
+from starlette.datastructures import Headers, QueryParams
+
+from app.services.ai.manager import ai_manager
+from app.services.cache import cache_service
+from app.services.cache_policy import CacheRule, cache_policy
+from app.services.sessions import session_index
+from app.services.warmup import list_operations, warm_cache
+
+SPEC = {
+    "openapi": "3.0.0",
+    "servers": [{"url": "http://localhost:8080/api/v1"}],
+    "paths": {
+        "/users": {
+            "get": {
+                "parameters": [
+                    {"name": "page", "in": "query", "required": True, "schema": {"type": "integer", "example": 2}},
+                    {"name": "sort", "in": "query", "schema": {"type": "string"}},
+                ]
+            },
+            "post": {"requestBody": {"content": {"application/json": {"example": {"name": "Ann"}}}}},
+        },
+        "/users/{id}": {
+            "parameters": [{"$ref": "#/components/parameters/Id"}],
+            "get": {"parameters": [{"name": "Accept-Language", "in": "header", "example": "de"}]},
+        },
+        "/orders/{orderId}": {
+            "get": {"parameters": [{"name": "orderId", "in": "path", "schema": {"type": "string", "enum": ["A1"]}}]}
+        },
+    },
+    "components": {"parameters": {"Id": {"name": "id", "in": "path", "schema": {"type": "integer"}}}},
+}
+
+
+@pytest.fixture
+def generations(monkeypatch):
+    calls = []
+
+    async def generate_response(method, path, body=None, context=None, system_prompt=None):
+        calls.append((method, path, body))
+        return {"status_code": 200, "headers": {"Content-Type": "application/json"}, "body": {"path": path}}
+
+    monkeypatch.setattr(ai_manager, "generate_response", generate_response)
+    monkeypatch.setattr(session_index, "record", lambda *args: None)
+    return calls
+
+
+class TestOperations:
+    """Tests for turning a spec into requests."""
+
+    def test_examples_fill_parameters(self):
+        """Test path, required query and body examples, $refs and the server base path."""
+        operations = list_operations(SPEC, ["*"])
+
+        assert [(op.method, op.path, op.query, op.body, op.headers) for op in operations] == [
+            ("GET", "api/v1/users", {"page": "2"}, b"", {}),
+            ("POST", "api/v1/users", {}, b'{"name": "Ann"}', {}),
+            ("GET", "api/v1/users/1", {}, b"", {"Accept-Language": "de"}),
+            ("GET", "api/v1/orders/A1", {}, b"", {}),
+        ]
+
+    def test_methods_filter(self):
+        """Test that only the requested methods are listed."""
+        assert {op.method for op in list_operations(SPEC)} == {"GET"}
+
+
+class TestWarmup:
+    """Tests for pre-generating responses."""
+
+    @pytest.mark.asyncio
+    async def test_warmed_entries_are_found_by_real_requests(self, memory_storage, generations):
+        """Test that warm-up writes under the key the catch-all route computes, once."""
+        operations = list_operations(SPEC)
+
+        first = await warm_cache(operations, "s1", concurrency=2)
+        second = await warm_cache(operations, "s1", concurrency=2)
+
+        assert [r.status for r in first] == ["warmed"] * 3
+        assert [r.status for r in second] == ["cached"] * 3
+        assert len(generations) == 3
+
+        rule = cache_policy.match("GET", "api/v1/users")
+        key = cache_service.get_cache_key(
+            "s1", "GET", "api/v1/users", b"", query=QueryParams("page=2"), headers=Headers(), rule=rule
+        )
+        cache_service.local.clear()
+        assert (await cache_service.get(key)).body == b'{"path":"api/v1/users"}'
+
+    @pytest.mark.asyncio
+    async def test_header_keyed_rules_use_spec_headers(self, memory_storage, generations, monkeypatch):
+        """Test that header-keyed routes are warmed with the spec's headers, or skipped without them."""
+        rule = CacheRule.model_validate({"match": {"path": "/api/v1/*"}, "key": {"headers": ["accept-language"]}})
+        monkeypatch.setattr(cache_policy, "rules", [rule])
+
+        results = {r.operation.path: r for r in await warm_cache(list_operations(SPEC), "s3")}
+
+        assert results["api/v1/users/1"].status == "warmed"
+        assert results["api/v1/users"].status == "skipped"
+        assert "accept-language" in results["api/v1/users"].error
+        key = cache_service.get_cache_key(
+            "s3", "GET", "api/v1/users/1", b"", headers=Headers({"accept-language": "de"}), rule=rule
+        )
+        assert await memory_storage.exists(key)
+
+    @pytest.mark.asyncio
+    async def test_failures_are_reported_per_operation(self, memory_storage, monkeypatch):
+        """Test that a failed generation does not stop the other operations."""
+
+        async def generate_response(method, path, body=None, context=None, system_prompt=None):
+            if path.endswith("/1"):
+                raise RuntimeError("provider down")
+            return {"status_code": 200, "body": {}}
+
+        monkeypatch.setattr(ai_manager, "generate_response", generate_response)
+        monkeypatch.setattr(session_index, "record", lambda *args: None)
+        reported = []
+
+        results = await warm_cache(list_operations(SPEC), "s2", on_result=reported.append)
+
+        assert sorted(r.status for r in results) == ["failed", "warmed", "warmed"]
+        assert len(reported) == 3
+        assert next(r for r in results if r.status == "failed").error == "provider down"
+
+    @pytest.mark.asyncio
+    async def test_failed_write_releases_the_lock(self, memory_storage, generations, monkeypatch):
+        """Test that a warm-up whose write fails does not leave other workers waiting on its lock."""
+        apply, calls = memory_storage.apply, []
+
+        async def failing_apply(batch, atomic=False):
+            calls.append(batch)
+            if len(calls) == 1:
+                raise ConnectionError("storage down")
+            await apply(batch, atomic)
+
+        monkeypatch.setattr(memory_storage, "apply", failing_apply)
+        operation = list_operations(SPEC)[0]
+
+        [result] = await warm_cache([operation], "s4")
+
+        rule = cache_policy.match("GET", operation.path)
+        key = cache_service.get_cache_key("s4", "GET", operation.path, b"", query=operation.query, rule=rule)
+        assert result.status == "failed"
+        assert not await memory_storage.exists(f"lock:{key}")